@@ -8,6 +8,8 @@ from django.contrib.auth import get_user_model
 from django.db import transaction
 from django.db.models import Count, F, OuterRef, Prefetch, Q, Subquery
 from rest_framework.decorators import action
+
+from judge.judgeapi import estimate_submission
 from judge.models import (
     Contest, ContestParticipation, ContestTag, Judge, Language, Organization, Problem, ProblemType, Profile, Rating,
     Submission, ContestSubmission, SubmissionSource,
@@ -294,6 +296,7 @@ class SubmissionStatus(generics.GenericAPIView):
             'case_total': submission.case_total,
             'cases': cases,
             'error': submission.error,
+            'estimate': estimate_submission(submission) if submission.status == 'QU' else None,
         }
 
         return Response(context, status=status.HTTP_200_OK)
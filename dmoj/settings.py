@@ -78,6 +78,19 @@ DMOJ_SUBMISSION_LIMIT = 2
 # Whether to allow users to view source code: 'all' | 'all-solved' | 'only-own'
 DMOJ_SUBMISSION_SOURCE_VISIBILITY = 'all-solved'
 DMOJ_BLOG_NEW_PROBLEM_COUNT = 7
+# Contest results are updated from each graded submission alone when the contest format supports it. Also recompute
+# them from scratch, and log any difference.
+DMOJ_VERIFY_CONTEST_RESULTS = False
+# How long the rendered rows of contest scoreboards are cached, in seconds. Rows are replaced whenever the results of
+# their participation are recomputed, so this only bounds how long other changes, such as to organizations, take to
+# show. Rows are shared between processes only through a shared cache, such as memcached.
+DMOJ_CONTEST_SCOREBOARD_CACHE_TIMEOUT = 86400
+# The number of participations on each page of a contest scoreboard.
+DMOJ_CONTEST_RANKING_PAGE_SIZE = 500
+# How long the queue position and time estimates of a submission are cached, in seconds.
+DMOJ_SUBMISSION_ESTIMATE_CACHE_TIMEOUT = 5
+# How long pages wait for the bridge to estimate a submission, in seconds, before they are shown without an estimate.
+DMOJ_SUBMISSION_ESTIMATE_TIMEOUT = 0.5
 DMOJ_TOTP_TOLERANCE_HALF_MINUTES = 1
 DMOJ_SCRATCH_CODES_COUNT = 5
 DMOJ_USER_MAX_ORGANIZATION_COUNT = 3
@@ -511,6 +524,51 @@ BRIDGED_JUDGE_ADDRESS = [('localhost', 9999)]
 BRIDGED_JUDGE_PROXIES = None
 BRIDGED_DJANGO_ADDRESS = [('localhost', 9998)]
 BRIDGED_DJANGO_CONNECT = None
+# Test case results are written to the database in batches of this many rows, or after this many seconds.
+BRIDGED_TEST_CASE_FLUSH_SIZE = 50
+BRIDGED_TEST_CASE_FLUSH_INTERVAL = 1.0
+# Recompute grading totals from the database and log any mismatch with the totals tracked by the bridge.
+BRIDGED_VERIFY_GRADING_TOTALS = False
+# Serve connections from an asyncio event loop instead of a thread per connection. Packets are then handled
+# in a pool of this many threads, shared by judge and Django connections.
+BRIDGED_USE_ASYNCIO = False
+BRIDGED_ASYNCIO_WORKERS = 16
+# How the bridge assigns submissions to judges: one of 'least-load', 'throughput', 'shortest-job-first',
+# 'fair-share' and 'affinity'. See judge/bridge/scheduler.py for the options each scheduler accepts.
+BRIDGED_SCHEDULER = 'least-load'
+BRIDGED_SCHEDULER_OPTIONS = {}
+# Addresses to serve bridge metrics on, at /metrics in the Prometheus text format, e.g. [('localhost', 9995)].
+BRIDGED_METRICS_ADDRESS = None
+# Maximum number of events the bridge queues for posting in the background. Set to 0 to post synchronously instead.
+BRIDGED_EVENT_QUEUE_SIZE = 10000
+BRIDGED_EVENT_BATCH_SIZE = 100
+# Live test case progress is posted at most once per this many seconds for each submission, and at most this many
+# times per second in total. The latest progress of a submission is always posted once the limit allows.
+BRIDGED_PROGRESS_INTERVAL = 0.5
+BRIDGED_PROGRESS_RATE = 100
+# Judges that support it send and receive packets smaller than this many bytes uncompressed. Larger packets are
+# compressed at this zlib level. Set the threshold to 0 to compress every packet.
+BRIDGED_COMPRESSION_THRESHOLD = 256
+BRIDGED_COMPRESSION_LEVEL = 6
+# Encode packets with msgpack instead of JSON for judges that support it. Requires the msgpack package.
+BRIDGED_USE_MSGPACK = False
+# The live ping and load of judges are kept in the cache. They are only written to the database on connect and
+# disconnect, and when the load changes by this much, or the ping by this fraction, since last written.
+BRIDGED_JUDGE_LOAD_CHANGE = 0.25
+BRIDGED_JUDGE_PING_CHANGE = 0.5
+# File in which the bridge journals the submissions it is asked to judge, so that it can queue the unfinished ones
+# again when it restarts. Set to None to mark them as internal errors on restart instead. With fsync, the journal
+# also survives the machine crashing, at the cost of a disk write per event.
+BRIDGED_JOURNAL_PATH = None
+BRIDGED_JOURNAL_FSYNC = False
+# Run several bridge instances that share one queue, kept in the database, instead of a journal. Each instance needs
+# a unique name, and polls the queue for its free judges every this many seconds. Judges and the site may connect to
+# any instance; commands that concern every instance, such as aborting a submission, are sent to every address in
+# BRIDGED_DJANGO_BROADCAST, which should list the Django-facing address of each instance.
+BRIDGED_SHARED_QUEUE = False
+BRIDGED_INSTANCE_NAME = 'bridge'
+BRIDGED_SHARED_QUEUE_POLL_INTERVAL = 1.0
+BRIDGED_DJANGO_BROADCAST = None
 
 # Event Server configuration
 EVENT_DAEMON_USE = False
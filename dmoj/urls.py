@@ -204,6 +204,8 @@ urlpatterns = [
         path('/clone', contests.ContestClone.as_view(), name='contest_clone'),
         path('/ranking/', contests.ContestRanking.as_view(), name='contest_ranking'),
         path('/ranking/ajax', contests.contest_ranking_ajax, name='contest_ranking_ajax'),
+        path('/ranking/diff', contests.contest_ranking_diff, name='contest_ranking_diff'),
+        path('/ranking/find', contests.contest_ranking_redirect, name='contest_ranking_redirect'),
         path('/join', contests.ContestJoin.as_view(), name='contest_join'),
         path('/leave', contests.ContestLeave.as_view(), name='contest_leave'),
         path('/stats', contests.ContestStats.as_view(), name='contest_stats'),
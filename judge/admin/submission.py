@@ -16,6 +16,7 @@ from reversion.admin import VersionAdmin
 from django_ace import AceWidget
 from judge.models import ContestParticipation, ContestProblem, ContestSubmission, Profile, Submission, \
     SubmissionSource, SubmissionTestCase
+from judge.tasks import rejudge_submissions
 from judge.utils.raw_sql import use_straight_join
 
 
@@ -171,9 +172,7 @@ class SubmissionAdmin(VersionAdmin):
         if not request.user.has_perm('judge.edit_all_problem'):
             id = request.profile.id
             queryset = queryset.filter(Q(problem__authors__id=id) | Q(problem__curators__id=id))
-        judged = len(queryset)
-        for model in queryset:
-            model.judge(rejudge=True, batch_rejudge=True, rejudge_user=request.user)
+        judged = sum(rejudge_submissions(queryset, request.user))
         self.message_user(request, ngettext('%d submission was successfully scheduled for rejudging.',
                                             '%d submissions were successfully scheduled for rejudging.',
                                             judged) % judged)
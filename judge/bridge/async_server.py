@@ -0,0 +1,255 @@
+import asyncio
+import logging
+import socket
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django import db
+
+from judge.bridge.base_handler import Disconnect, MAX_ALLOWED_PACKET_SIZE, size_pack, split_header
+
+logger = logging.getLogger('judge.bridge')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor(max_workers):
+    """Returns the thread pool shared by all asyncio servers, in which handlers (and thus all ORM calls) run."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='bridge')
+        return _executor
+
+
+class AsyncConnection:
+    """
+    Stands in for the socket of a ZlibPacketHandler, so that handler code running in the executor can send data,
+    close the connection and set timeouts while the event loop owns the actual transport.
+    """
+
+    def __init__(self, loop, writer):
+        self.loop = loop
+        self.writer = writer
+        self._timeout = None
+        self._tasks = set()
+
+    def gettimeout(self):
+        return self._timeout
+
+    def settimeout(self, timeout):
+        self._timeout = timeout
+
+    def sendall(self, data):
+        self.loop.call_soon_threadsafe(self.writer.write, data)
+
+    def shutdown(self, how=socket.SHUT_RDWR):
+        self.loop.call_soon_threadsafe(self.close)
+
+    def close(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks.clear()
+        self.writer.close()
+
+    def _track(self, task):
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def start_task(self, coro):
+        """Schedules a coroutine on the event loop from any thread. Returns a future that can be cancelled."""
+        if _on_loop(self.loop):
+            return self._track(self.loop.create_task(coro))
+        return asyncio.run_coroutine_threadsafe(self._tracked(coro), self.loop)
+
+    async def _tracked(self, coro):
+        self._track(asyncio.current_task())
+        return await coro
+
+
+def _call_handler(func, *args):
+    """
+    Runs handler code in an executor thread. The threads are shared by every connection, so their connections to the
+    database are checked before and after each call, as Django does around each request, rather than kept for the
+    lifetime of a connection.
+    """
+    db.close_old_connections()
+    try:
+        return func(*args)
+    finally:
+        db.close_old_connections()
+
+
+def _on_loop(loop):
+    try:
+        return asyncio.get_running_loop() is loop
+    except RuntimeError:
+        return False
+
+
+class AsyncHandlerMixin:
+    """Replaces the per-connection threads of JudgeHandler with tasks on the connection's event loop."""
+
+    def _start_ping(self):
+        self.request.start_task(self._ping_task())
+
+    async def _ping_task(self):
+        loop = asyncio.get_running_loop()
+        try:
+            next_ping = 0
+            while not self._stop_ping.is_set():
+                next_ping = self._ping_if_due(next_ping)
+                # Handlers only touch the buffer in the executor, with its lock held.
+                if self._test_case_buffer.due_in() == 0:
+                    await loop.run_in_executor(self.server.executor, _call_handler, self._flush_test_cases_if_due)
+                await asyncio.sleep(self._ping_wait(next_ping))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception('Ping error in %s', self.name)
+            self.close()
+
+    def _make_no_response_job(self):
+        return self.request.start_task(self._no_response_task())
+
+    async def _no_response_task(self):
+        await asyncio.sleep(self.no_response_timeout)
+        await asyncio.get_running_loop().run_in_executor(self.server.executor, _call_handler,
+                                                         self._kill_if_no_response)
+
+    def on_cleanup(self):
+        # The connection to the database belongs to the executor thread, not to this handler, and is closed by
+        # _call_handler once it is too old.
+        pass
+
+
+class _Listener:
+    def __init__(self, server, address):
+        self.server = server
+        self.server_address = address
+
+    @property
+    def executor(self):
+        return self.server.executor
+
+
+class AsyncServer:
+    """
+    Serves a ZlibPacketHandler subclass from an asyncio event loop instead of one thread per connection.
+
+    Frames are read on the event loop. Each packet is then handled in a bounded thread pool, one packet at a time
+    per connection, so that handler code, including its blocking ORM calls, runs unchanged.
+    """
+
+    def __init__(self, addresses, handler, executor, **kwargs):
+        self.addresses = addresses
+        self.handler = type('Async' + handler.__name__, (AsyncHandlerMixin, handler), {})
+        self.handler_kwargs = kwargs
+        self.executor = executor
+        self.loop = None
+        self.servers = []
+        self._stop = None
+        self._ready = threading.Event()
+
+    def serve_forever(self):
+        asyncio.run(self._serve())
+
+    async def _serve(self):
+        self.loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        try:
+            for address in self.addresses:
+                self.servers.append(await asyncio.start_server(
+                    partial(self._handle, _Listener(self, address)), *address, reuse_address=True,
+                ))
+        finally:
+            self._ready.set()
+
+        try:
+            await self._stop.wait()
+        finally:
+            for server in self.servers:
+                server.close()
+                await server.wait_closed()
+
+    def bound_addresses(self):
+        self._ready.wait()
+        return [sock.getsockname() for server in self.servers for sock in server.sockets]
+
+    def shutdown(self):
+        self._ready.wait()
+        self.loop.call_soon_threadsafe(self._stop.set)
+
+    def _make_handler(self, connection, client_address, listener):
+        # Bypass RequestHandlerMeta, which would run the blocking handle() loop.
+        handler = self.handler.__new__(self.handler)
+        handler.__init__(connection, client_address, listener, **self.handler_kwargs)
+        return handler
+
+    async def _handle(self, listener, reader, writer):
+        loop = asyncio.get_running_loop()
+        run = partial(loop.run_in_executor, self.executor, _call_handler)
+        connection = AsyncConnection(loop, writer)
+        client_address = writer.get_extra_info('peername')
+        handler = self._make_handler(connection, client_address, listener)
+
+        await run(handler.on_connect)
+        try:
+            await self._read_packets(handler, connection, reader, run)
+        except Disconnect:
+            pass
+        except zlib.error:
+            if handler._got_packet:
+                logger.warning('Encountered zlib error during packet handling, disconnecting client: %s',
+                               handler.client_address, exc_info=True)
+            else:
+                logger.info('Potentially wrong protocol (zlib error): %s: %r', handler.client_address,
+                            handler._initial_tag, exc_info=True)
+        except asyncio.TimeoutError:
+            if handler._got_packet:
+                logger.info('Socket timed out: %s', handler.client_address)
+                await run(handler.on_timeout)
+            else:
+                logger.info('Potentially wrong protocol: %s: %r', handler.client_address, handler._initial_tag)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception:
+            logger.exception('Error in base packet handling')
+        finally:
+            try:
+                await run(handler.on_cleanup)
+                await run(handler.on_disconnect)
+            finally:
+                connection.close()
+
+    async def _read(self, connection, reader, size):
+        try:
+            return await asyncio.wait_for(reader.readexactly(size), connection.gettimeout())
+        except asyncio.IncompleteReadError:
+            raise Disconnect()
+
+    async def _read_packets(self, handler, connection, reader, run):
+        tag = await self._read(connection, reader, size_pack.size)
+        handler._initial_tag = tag
+        if handler.client_address[0] in handler.proxies and tag == b'PROX':
+            line = tag + await asyncio.wait_for(reader.readuntil(b'\r\n'), connection.gettimeout())
+            if len(line) > 107:
+                raise Disconnect()
+            handler.parse_proxy_protocol(line[:-2])
+            header = size_pack.unpack(await self._read(connection, reader, size_pack.size))[0]
+        else:
+            header = size_pack.unpack(tag)[0]
+
+        while True:
+            size, flags = split_header(header)
+            if size > MAX_ALLOWED_PACKET_SIZE:
+                logger.log(logging.WARNING if handler._got_packet else logging.INFO,
+                           'Disconnecting client due to too-large message size (%d bytes): %s',
+                           size, handler.client_address)
+                raise Disconnect()
+            await run(handler._on_packet, await self._read(connection, reader, size), flags)
+            header = size_pack.unpack(await self._read(connection, reader, size_pack.size))[0]
@@ -1,3 +1,4 @@
+import json
 import logging
 import socket
 import struct
@@ -8,12 +9,54 @@ from netaddr import IPGlob, IPSet
 
 from judge.utils.unicode import utf8text
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 logger = logging.getLogger('judge.bridge')
 
 size_pack = struct.Struct('!I')
 assert size_pack.size == 4
 
 MAX_ALLOWED_PACKET_SIZE = 8 * 1024 * 1024
+RECEIVE_BUFFER_SIZE = 64 * 1024
+
+# The top bits of the size that prefixes each frame are flags. Peers only set them once they negotiated to, so frames
+# to and from old peers are always zlib compressed JSON.
+FRAME_RAW = 1 << 31  # The payload is not compressed.
+FRAME_MSGPACK = 1 << 30  # The payload is msgpack instead of JSON.
+FRAME_SIZE_MASK = FRAME_MSGPACK - 1
+
+
+def split_header(header):
+    """Splits the integer prefixing a frame into (size, flags)."""
+    return header & FRAME_SIZE_MASK, header & ~FRAME_SIZE_MASK
+
+
+if orjson is None:
+    json_loads = json.loads
+else:
+    def json_loads(data):
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # orjson is stricter than json, e.g. about NaN, so only trust it to reject truly malformed input.
+            return json.loads(data)
+
+
+def msgpack_loads(data):
+    # Only called on connections that negotiated msgpack, which requires it to be installed.
+    return msgpack.unpackb(data, raw=False)
+
+
+def msgpack_dumps(data):
+    return msgpack.packb(data, use_bin_type=True)
 
 
 def proxy_list(human_readable):
@@ -51,6 +94,11 @@ class RequestHandlerMeta(type):
 
 class ZlibPacketHandler(metaclass=RequestHandlerMeta):
     proxies = []
+    # If set, on_packet receives the decompressed bytes rather than a str, e.g. to hand straight to json_loads.
+    raw_packets = False
+    # Frames smaller than this are sent uncompressed. Only ever set for peers that negotiated it.
+    compression_threshold = 0
+    compression_level = zlib.Z_DEFAULT_COMPRESSION
 
     def __init__(self, request, client_address, server):
         self.request = request
@@ -59,6 +107,7 @@ class ZlibPacketHandler(metaclass=RequestHandlerMeta):
         self.server_address = server.server_address
         self._initial_tag = None
         self._got_packet = False
+        self._receive_buffer = None
 
     @property
     def timeout(self):
@@ -68,25 +117,54 @@ class ZlibPacketHandler(metaclass=RequestHandlerMeta):
     def timeout(self, timeout):
         self.request.settimeout(timeout or None)
 
-    def read_sized_packet(self, size, initial=None):
+    def read_sized_packet(self, header, initial=None):
+        size, flags = split_header(header)
         if size > MAX_ALLOWED_PACKET_SIZE:
             logger.log(logging.WARNING if self._got_packet else logging.INFO,
                        'Disconnecting client due to too-large message size (%d bytes): %s', size, self.client_address)
             raise Disconnect()
 
-        buffer = []
+        if flags & FRAME_RAW:
+            self._on_decompressed(self._read_raw_packet(size, initial), flags)
+            return
+
+        # Decompress as data arrives, received into a buffer reused across packets, so that the compressed packet is
+        # never assembled or copied.
+        if self._receive_buffer is None:
+            self._receive_buffer = memoryview(bytearray(RECEIVE_BUFFER_SIZE))
+        decompressor = zlib.decompressobj()
+        output = bytearray()
         remainder = size
 
         if initial:
-            buffer.append(initial)
+            output += decompressor.decompress(initial)
             remainder -= len(initial)
             assert remainder >= 0
 
         while remainder:
-            data = self.request.recv(remainder)
-            remainder -= len(data)
-            buffer.append(data)
-        self._on_packet(b''.join(buffer))
+            received = self.request.recv_into(self._receive_buffer, min(remainder, RECEIVE_BUFFER_SIZE))
+            if not received:
+                raise Disconnect()
+            remainder -= received
+            output += decompressor.decompress(self._receive_buffer[:received])
+
+        if not decompressor.eof:
+            raise zlib.error('Incomplete compressed packet')
+        self._on_decompressed(output, flags)
+
+    def _read_raw_packet(self, size, initial):
+        output = bytearray(size)
+        view = memoryview(output)
+        received = 0
+        if initial:
+            view[:len(initial)] = initial
+            received = len(initial)
+        while received < size:
+            count = self.request.recv_into(view[received:])
+            if not count:
+                raise Disconnect()
+            received += count
+        return output
 
     def parse_proxy_protocol(self, line):
         words = line.split()
@@ -124,14 +202,23 @@ class ZlibPacketHandler(metaclass=RequestHandlerMeta):
             buffer += data
         return buffer
 
-    def _on_packet(self, data):
-        decompressed = zlib.decompress(data).decode('utf-8')
+    def _on_packet(self, data, flags=0):
+        self._on_decompressed(data if flags & FRAME_RAW else zlib.decompress(data), flags)
+
+    def _on_decompressed(self, data, flags=0):
         self._got_packet = True
-        self.on_packet(decompressed)
+        if flags & FRAME_MSGPACK:
+            self.on_msgpack_packet(data)
+        else:
+            self.on_packet(data if self.raw_packets else data.decode('utf-8'))
 
     def on_packet(self, data):
         raise NotImplementedError()
 
+    def on_msgpack_packet(self, data):
+        logger.warning('Disconnecting client that sent msgpack without negotiating it: %s', self.client_address)
+        raise Disconnect()
+
     def on_connect(self):
         pass
 
@@ -157,13 +244,14 @@ class ZlibPacketHandler(metaclass=RequestHandlerMeta):
                         self.read_sized_packet(self.read_size(remainder))
                         break
 
-                    size = size_pack.unpack(remainder[:size_pack.size])[0]
+                    header = size_pack.unpack(remainder[:size_pack.size])[0]
+                    size, flags = split_header(header)
                     remainder = remainder[size_pack.size:]
                     if len(remainder) <= size:
-                        self.read_sized_packet(size, remainder)
+                        self.read_sized_packet(header, remainder)
                         break
 
-                    self._on_packet(remainder[:size])
+                    self._on_packet(remainder[:size], flags)
                     remainder = remainder[size:]
             else:
                 self.read_sized_packet(tag)
@@ -194,8 +282,14 @@ class ZlibPacketHandler(metaclass=RequestHandlerMeta):
             self.on_cleanup()
 
     def send(self, data):
-        compressed = zlib.compress(data.encode('utf-8'))
-        self.request.sendall(size_pack.pack(len(compressed)) + compressed)
+        self.send_frame(data.encode('utf-8'))
+
+    def send_frame(self, payload, flags=0):
+        if len(payload) < self.compression_threshold:
+            flags |= FRAME_RAW
+        else:
+            payload = zlib.compress(payload, self.compression_level)
+        self.request.sendall(size_pack.pack(len(payload) | flags) + payload)
 
     def close(self):
         self.request.shutdown(socket.SHUT_RDWR)
@@ -0,0 +1,71 @@
+"""
+Measures how long a free judge takes to pick its next submission from a deep JudgeList queue.
+
+Run with: python -m judge.bridge.benchmark_judge_list [--queued 10000] [--judges 50]
+"""
+import logging
+import random
+import time
+
+from judge.bridge.judge_list import JudgeList
+from judge.bridge.tests.util import FakeJudge
+from judge.judge_priority import BATCH_REJUDGE_PRIORITY, DEFAULT_PRIORITY
+
+
+def build(queued, judges, problems, languages, seed):
+    rng = random.Random(seed)
+    problem_codes = ['p%d' % i for i in range(problems)]
+    language_keys = ['lang%d' % i for i in range(languages)]
+
+    judge_list = JudgeList()
+    fleet = []
+    for i in range(judges):
+        judge = FakeJudge('judge%d' % i, rng.sample(problem_codes, max(1, problems // 2)), language_keys)
+        # Start with every judge busy, so that everything submitted ends up queued.
+        judge._working = -1 - i
+        judge_list.judges.add(judge)
+        judge_list.submission_map[judge._working] = judge
+        fleet.append(judge)
+
+    for id in range(1, queued + 1):
+        priority = BATCH_REJUDGE_PRIORITY if rng.random() < 0.9 else DEFAULT_PRIORITY
+        judge_list.judge(id, rng.choice(problem_codes), rng.choice(language_keys), '', None, priority)
+    return judge_list, fleet
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-q', '--queued', type=int, default=10000)
+    parser.add_argument('-j', '--judges', type=int, default=50)
+    parser.add_argument('-p', '--problems', type=int, default=100)
+    parser.add_argument('-l', '--languages', type=int, default=5)
+    parser.add_argument('-s', '--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    judge_list, fleet = build(args.queued, args.judges, args.problems, args.languages, args.seed)
+    print('Queued %d submissions for %d judges' % (len(judge_list.queue), len(fleet)))
+
+    rng = random.Random(args.seed)
+    latencies = []
+    while judge_list.queue and fleet:
+        judge = rng.choice(fleet)
+        start = time.perf_counter()
+        judge_list.on_judge_free(judge, judge.get_current_submission())
+        latencies.append(time.perf_counter() - start)
+        if not judge.working:
+            # Nothing left that this judge may grade right now; it stays connected but idle.
+            fleet.remove(judge)
+
+    latencies.sort()
+    count = len(latencies)
+    print('Dispatches: %d, remaining in queue: %d' % (count, len(judge_list.queue)))
+    print('Mean: %.1f us, p50: %.1f us, p99: %.1f us, max: %.1f us' % (
+        sum(latencies) / count * 1e6, latencies[count // 2] * 1e6,
+        latencies[min(count - 1, count * 99 // 100)] * 1e6, latencies[-1] * 1e6,
+    ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+Measures how fast ZlibPacketHandler receives and parses packets, compared to assembling each compressed packet
+before decompressing, decoding and parsing it, as the bridge used to.
+
+Reports packets per second, and the peak memory allocated while handling a packet, in multiples of its decompressed
+size: the number of full copies of the packet that are alive at once.
+
+Run with: python -m judge.bridge.benchmark_packets [--packets 20000] [--output-size 256]
+"""
+import json
+import random
+import socket
+import threading
+import time
+import tracemalloc
+import zlib
+from types import SimpleNamespace
+
+from judge.bridge.base_handler import Disconnect, ZlibPacketHandler, json_loads, size_pack
+
+
+class BenchmarkHandler(ZlibPacketHandler):
+    raw_packets = True
+
+    def on_packet(self, data):
+        json_loads(data)
+
+
+def make_handler(sock):
+    # Bypass RequestHandlerMeta, which would run the handle() loop immediately.
+    handler = BenchmarkHandler.__new__(BenchmarkHandler)
+    handler.__init__(sock, ('127.0.0.1', 0), SimpleNamespace(server_address=('127.0.0.1', 0)))
+    return handler
+
+
+def recv_exactly(sock, size):
+    buffer = []
+    while size:
+        data = sock.recv(size)
+        if not data:
+            raise Disconnect()
+        size -= len(data)
+        buffer.append(data)
+    return b''.join(buffer)
+
+
+def legacy_read(sock):
+    size = size_pack.unpack(recv_exactly(sock, size_pack.size))[0]
+    json.loads(zlib.decompress(recv_exactly(sock, size)).decode('utf-8'))
+
+
+def make_frame(output_size, seed=0):
+    # Random letters compress about as poorly as real program output.
+    rng = random.Random(seed)
+    packet = json.dumps({
+        'name': 'test-case-status',
+        'submission-id': 1,
+        'cases': [{
+            'position': 1, 'status': 0, 'time': 0.01, 'points': 1, 'total-points': 1, 'memory': 1024,
+            'output': ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(output_size)),
+            'extended-feedback': '', 'feedback': '',
+        }],
+    }).encode('utf-8')
+    compressed = zlib.compress(packet)
+    return size_pack.pack(len(compressed)) + compressed, len(packet)
+
+
+def run(read_one, frame, packets):
+    reader, writer = socket.socketpair()
+    sender = threading.Thread(target=writer.sendall, args=(frame * packets,))
+    sender.start()
+    try:
+        start = time.perf_counter()
+        for _ in range(packets):
+            read_one(reader)
+        return time.perf_counter() - start
+    finally:
+        sender.join()
+        reader.close()
+        writer.close()
+
+
+def peak_memory(read_one, frame):
+    reader, writer = socket.socketpair()
+    sender = threading.Thread(target=writer.sendall, args=(frame,))
+    sender.start()
+    try:
+        tracemalloc.start()
+        read_one(reader)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+        sender.join()
+        reader.close()
+        writer.close()
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--packets', type=int, default=20000)
+    parser.add_argument('-o', '--output-size', type=int, default=256,
+                        help='size of the test case output in each packet, in bytes')
+    parser.add_argument('-l', '--large-size', type=int, default=4 * 1024 * 1024,
+                        help='size of the packet used to measure memory, in bytes')
+    args = parser.parse_args()
+
+    def current(sock):
+        handler = handlers.get(sock)
+        if handler is None:
+            handler = handlers[sock] = make_handler(sock)
+        handler.read_sized_packet(handler.read_size())
+
+    handlers = {}
+    frame, size = make_frame(args.output_size)
+    large_frame, large_size = make_frame(args.large_size)
+    print('Packets of %d bytes (%d compressed); large packet of %d bytes (%d compressed)' % (
+        size, len(frame) - size_pack.size, large_size, len(large_frame) - size_pack.size,
+    ))
+
+    for name, read_one in (('legacy', legacy_read), ('current', current)):
+        elapsed = run(read_one, frame, args.packets)
+        peak = peak_memory(read_one, large_frame)
+        print('%-8s %10.0f packets/s, peak memory per large packet: %.2fx its size' % (
+            name, args.packets / elapsed, peak / large_size,
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Measures how many submissions per second several bridge instances sharing a queue dispatch together, with judges that
+grade instantly, so that only the coordination through the database is measured.
+
+The latest existing submissions are queued in the shared queue for the duration of the run, so it must not be run
+against the database of a live bridge in shared queue mode. SQLite serializes writers, so the instances only scale
+on a database server.
+
+Run with: DJANGO_SETTINGS_MODULE=dmoj.settings python -m judge.bridge.benchmark_shared_queue \
+    [--submissions 2000] [--processes 1 2 4] [--judges 4]
+"""
+import logging
+import multiprocessing
+import time
+
+import django
+
+
+def run_instance(name, judges, start, results):
+    from django import db
+
+    from judge.bridge.shared_queue import SharedJudgeList, SharedQueue
+    from judge.bridge.tests.util import FakeJudge
+
+    class AnyJudge(FakeJudge):
+        def can_judge(self, problem, executor, judge_id=None):
+            return True
+
+    # The connection was inherited from the parent process, and must not be shared with it.
+    db.connections.close_all()
+    judge_list = SharedJudgeList(SharedQueue(name))
+    fleet = [AnyJudge('%s-judge%d' % (name, i)) for i in range(judges)]
+    judge_list.judges.update(fleet)
+
+    start.wait()
+    graded = 0
+    judge_list.poll()
+    while any(judge.working for judge in fleet):
+        for judge in fleet:
+            if judge.working:
+                graded += 1
+                judge_list.on_judge_free(judge, judge.get_current_submission())
+    results.put(graded)
+
+
+def measure(ids, processes, judges):
+    from judge.bridge.shared_queue import SharedQueue
+    from judge.judge_priority import DEFAULT_PRIORITY
+    from judge.models import BridgeQueueEntry
+
+    queue = SharedQueue('benchmark')
+    for id in ids:
+        queue.push(id, 'problem', 'lang', None, DEFAULT_PRIORITY)
+
+    context = multiprocessing.get_context('fork')
+    start = context.Event()
+    results = context.Queue()
+    workers = [context.Process(target=run_instance, args=('benchmark%d' % i, judges, start, results))
+               for i in range(processes)]
+    for worker in workers:
+        worker.start()
+
+    begin = time.perf_counter()
+    start.set()
+    graded = [results.get() for _ in workers]
+    elapsed = time.perf_counter() - begin
+    for worker in workers:
+        worker.join()
+
+    BridgeQueueEntry.objects.filter(submission_id__in=ids).delete()
+    return sum(graded), elapsed
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s', '--submissions', type=int, default=2000)
+    parser.add_argument('-p', '--processes', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('-j', '--judges', type=int, default=4, help='judges per instance')
+    args = parser.parse_args()
+
+    django.setup()
+    from django import db
+
+    from judge.models import BridgeQueueEntry, Submission
+
+    logging.disable(logging.INFO)
+    ids = list(Submission.objects.exclude(id__in=BridgeQueueEntry.objects.values('submission_id'))
+               .order_by('-id').values_list('id', flat=True)[:args.submissions])
+    if not ids:
+        print('There are no submissions to queue')
+        return
+    db.connections.close_all()
+
+    baseline = None
+    for processes in args.processes:
+        graded, elapsed = measure(ids, processes, args.judges)
+        db.connections.close_all()
+        throughput = graded / elapsed
+        baseline = baseline or throughput / processes
+        print('%d instances: %d submissions in %.2f s, %.0f/s (%.2fx one instance)' % (
+            processes, graded, elapsed, throughput, throughput / baseline))
+
+
+if __name__ == '__main__':
+    main()
@@ -4,34 +4,122 @@ import threading
 from functools import partial
 
 from django.conf import settings
+from django.db.models import Q
 
+from judge.bridge.async_server import AsyncServer, get_executor
 from judge.bridge.django_handler import DjangoHandler
-from judge.bridge.judge_handler import JudgeHandler
+from judge.bridge.event_publisher import EventPublisher
+from judge.bridge.journal import QueueJournal
+from judge.bridge.judge_handler import JudgeHandler, event
 from judge.bridge.judge_list import JudgeList
+from judge.bridge.metrics import Gauge, MetricsServer
+from judge.bridge.scheduler import make_scheduler
 from judge.bridge.server import Server
+from judge.bridge.shared_queue import SharedJudgeList, SharedQueue
 from judge.models import Judge, Submission
 
 logger = logging.getLogger('judge.bridge')
 
+queue_depth = Gauge('bridge_queue_depth', 'Submissions waiting for a judge', ['priority'])
+connected_judges = Gauge('bridge_judges', 'Judges connected to the bridge', ['state'])
+
 
 def reset_judges():
     Judge.objects.update(online=False, ping=None, load=None)
 
 
+def recover_submissions(judges):
+    """
+    Queues again the submissions that the previous run of the bridge had not finished, according to its journal,
+    unless they have been graded or aborted since. Returns their ids.
+    """
+    records, dispatched = judges.journal.replay()
+    # Judges that lose their connection to the bridge as it shuts down mark what they were grading as an internal
+    # error, after the journal is closed.
+    unfinished = set(Submission.objects.filter(id__in=[record[1] for record in records])
+                     .filter(Q(status__in=Submission.IN_PROGRESS_GRADING_STATUS) | Q(id__in=dispatched, status='IE'))
+                     .values_list('id', flat=True))
+    for record in records:
+        if record[1] not in unfinished:
+            judges.journal.finish(record[1])
+    judges.recover([record for record in records if record[1] in unfinished])
+
+    # Grading starts over, and grading-begin clears the test cases of the previous attempt.
+    Submission.objects.filter(id__in=unfinished & dispatched).update(status='QU', result=None, error=None)
+    return unfinished
+
+
+def release_submissions(judges):
+    """
+    Makes the submissions that the previous run of this instance had dispatched available to every instance of the
+    shared queue again, to be graded from the start. Returns their ids.
+    """
+    ids = judges.shared.release_all()
+    Submission.objects.filter(id__in=ids).update(status='QU', result=None, error=None)
+    return ids
+
+
+def judge_states(judges):
+    try:
+        current = list(judges.judges)
+    except RuntimeError:
+        # The set changed while we were copying it.
+        with judges.lock:
+            current = list(judges.judges)
+    working = sum(judge.working for judge in current)
+    return {('working',): working, ('idle',): len(current) - working}
+
+
 def judge_daemon():
-    reset_judges()
-    Submission.objects.filter(status__in=Submission.IN_PROGRESS_GRADING_STATUS) \
-        .update(status='IE', result='IE', error=None)
-    judges = JudgeList()
+    scheduler = make_scheduler(settings.BRIDGED_SCHEDULER, settings.BRIDGED_SCHEDULER_OPTIONS)
+    journal = None
+    if settings.BRIDGED_SHARED_QUEUE:
+        # Other instances are grading, so only what this instance was grading is reset.
+        judges = SharedJudgeList(SharedQueue(settings.BRIDGED_INSTANCE_NAME), scheduler=scheduler)
+        release_submissions(judges)
+    else:
+        reset_judges()
+        if settings.BRIDGED_JOURNAL_PATH:
+            journal = QueueJournal(settings.BRIDGED_JOURNAL_PATH, fsync=settings.BRIDGED_JOURNAL_FSYNC)
+        judges = JudgeList(scheduler=scheduler, journal=journal)
+
+        recovered = recover_submissions(judges) if journal is not None else set()
+        Submission.objects.filter(status__in=Submission.IN_PROGRESS_GRADING_STATUS).exclude(id__in=recovered) \
+            .update(status='IE', result='IE', error=None)
 
-    judge_server = Server(settings.BRIDGED_JUDGE_ADDRESS, partial(JudgeHandler, judges=judges))
-    django_server = Server(settings.BRIDGED_DJANGO_ADDRESS, partial(DjangoHandler, judges=judges))
+    if settings.BRIDGED_USE_ASYNCIO:
+        executor = get_executor(settings.BRIDGED_ASYNCIO_WORKERS)
+        judge_server = AsyncServer(settings.BRIDGED_JUDGE_ADDRESS, JudgeHandler, executor, judges=judges)
+        django_server = AsyncServer(settings.BRIDGED_DJANGO_ADDRESS, DjangoHandler, executor, judges=judges)
+    else:
+        judge_server = Server(settings.BRIDGED_JUDGE_ADDRESS, partial(JudgeHandler, judges=judges))
+        django_server = Server(settings.BRIDGED_DJANGO_ADDRESS, partial(DjangoHandler, judges=judges))
+
+    # These only read counters, so that scraping never contends for the JudgeList lock.
+    if settings.BRIDGED_SHARED_QUEUE:
+        queue_depth.set_function(lambda: {(priority,): count for priority, count in judges.shared.depths().items()})
+    else:
+        queue_depth.set_function(lambda: {(priority,): judges.queue.count(priority)
+                                          for priority in range(judges.priorities)})
+    connected_judges.set_function(partial(judge_states, judges))
+    metrics_server = MetricsServer(settings.BRIDGED_METRICS_ADDRESS or [])
 
     threading.Thread(target=django_server.serve_forever).start()
     threading.Thread(target=judge_server.serve_forever).start()
+    threading.Thread(target=metrics_server.serve_forever, daemon=True).start()
 
     stop = threading.Event()
 
+    def poll_shared_queue():
+        while not stop.wait(settings.BRIDGED_SHARED_QUEUE_POLL_INTERVAL):
+            try:
+                judges.poll()
+            except Exception:
+                logger.exception('Failed to poll the shared queue')
+
+    if settings.BRIDGED_SHARED_QUEUE:
+        threading.Thread(target=poll_shared_queue, daemon=True).start()
+
     def signal_handler(signum, _):
         logger.info('Exiting due to %s', signal.Signals(signum).name)
         stop.set()
@@ -43,5 +131,11 @@ def judge_daemon():
     try:
         stop.wait()
     finally:
+        if journal is not None:
+            with judges.lock:
+                journal.close()
         django_server.shutdown()
         judge_server.shutdown()
+        metrics_server.shutdown()
+        if isinstance(event, EventPublisher):
+            event.flush(timeout=5)
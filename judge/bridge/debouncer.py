@@ -0,0 +1,128 @@
+import heapq
+import logging
+import threading
+import time
+
+from judge.bridge.metrics import Counter
+
+logger = logging.getLogger('judge.bridge')
+
+__all__ = ['Debouncer']
+
+debounced_events = Counter('bridge_debounced_events_total', 'Events submitted to a debouncer, by what became of them',
+                           ['result'])
+
+
+class Debouncer(object):
+    """
+    Limits how often events are delivered for each key, without ever losing the latest one.
+
+    An event is a function that delivers it. The first event for a key is delivered immediately. Events submitted
+    within `interval` seconds of the last delivery for the same key are held, each replacing the one held before it,
+    and the one held last is delivered once the interval has passed (the trailing edge). In addition, at most `rate`
+    events are delivered per second across all keys; events over the limit are held in the same way.
+
+    Held events are delivered from a background thread, never with the lock of the debouncer held. The state for a
+    key is dropped once it has been quiet for an interval, or when it is cancelled.
+    """
+
+    def __init__(self, interval=0.5, rate=100, clock=time.monotonic, background=True):
+        self.interval = interval
+        self.rate = rate
+        self.clock = clock
+        self.background = background
+        self._tokens = rate
+        self._refilled = clock()
+        # key: [when the timer for the key is due, held event or None]
+        self._state = {}
+        self._timers = []
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._state)
+
+    def _take_token(self, now):
+        self._tokens = min(self.rate, self._tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def _schedule(self, when, key):
+        heapq.heappush(self._timers, (when, key))
+        if self.background and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='debouncer', daemon=True)
+            self._thread.start()
+        self._condition.notify()
+
+    def submit(self, key, deliver):
+        with self._condition:
+            now = self.clock()
+            state = self._state.get(key)
+            if state is None and self._take_token(now):
+                self._state[key] = [now + self.interval, None]
+                self._schedule(now + self.interval, key)
+                debounced_events.inc(result='immediate')
+            else:
+                if state is None:
+                    self._state[key] = [now + 1 / self.rate, deliver]
+                    self._schedule(now + 1 / self.rate, key)
+                else:
+                    if state[1] is not None:
+                        debounced_events.inc(result='superseded')
+                    state[1] = deliver
+                return
+        self._deliver(deliver)
+
+    def cancel(self, key):
+        """Forgets a key, along with any event held for it."""
+        with self._condition:
+            state = self._state.pop(key, None)
+        if state is not None and state[1] is not None:
+            debounced_events.inc(result='cancelled')
+
+    def _deliver(self, deliver):
+        try:
+            deliver()
+        except Exception:
+            logger.exception('Failed to deliver debounced event')
+
+    def run_due(self):
+        """Delivers held events that are due. Returns when the next timer is due, or None if there are none."""
+        due = []
+        with self._condition:
+            now = self.clock()
+            while self._timers and self._timers[0][0] <= now:
+                when, key = heapq.heappop(self._timers)
+                state = self._state.get(key)
+                if state is None or state[0] != when:
+                    # The key was cancelled, and possibly submitted again, since this timer was set.
+                    continue
+                if state[1] is None:
+                    del self._state[key]
+                    continue
+                if self._take_token(now):
+                    due.append(state[1])
+                    state[:] = [now + self.interval, None]
+                    debounced_events.inc(result='trailing')
+                else:
+                    state[0] = now + 1 / self.rate
+                heapq.heappush(self._timers, (state[0], key))
+            next_due = self._next_due()
+
+        for deliver in due:
+            self._deliver(deliver)
+        return next_due
+
+    def _next_due(self):
+        return self._timers[0][0] if self._timers else None
+
+    def _run(self):
+        while True:
+            next_due = self.run_due()
+            with self._condition:
+                # Unless a timer was set in the meantime, sleep until the next one is due.
+                if self._next_due() == next_due:
+                    self._condition.wait(None if next_due is None else max(0, next_due - self.clock()))
@@ -4,13 +4,19 @@ import struct
 
 from django import db
 
-from judge.bridge.base_handler import Disconnect, ZlibPacketHandler
+from judge.bridge.base_handler import Disconnect, ZlibPacketHandler, json_loads
+from judge.bridge.metrics import QueryTimer, handler_db_time
 
 logger = logging.getLogger('judge.bridge')
 size_pack = struct.Struct('!I')
 
+# Seconds after which an idle persistent connection is closed.
+IDLE_TIMEOUT = 600
+
 
 class DjangoHandler(ZlibPacketHandler):
+    raw_packets = True
+
     def __init__(self, request, client_address, server, judges):
         super().__init__(request, client_address, server)
 
@@ -19,6 +25,7 @@ class DjangoHandler(ZlibPacketHandler):
             'terminate-submission': self.on_termination,
             'disconnect-judge': self.on_disconnect_request,
             'disable-judge': self.on_disable_judge,
+            'submission-estimate': self.on_estimate,
         }
         self.judges = judges
 
@@ -26,14 +33,26 @@ class DjangoHandler(ZlibPacketHandler):
         super().send(json.dumps(data, separators=(',', ':')))
 
     def on_packet(self, packet):
-        packet = json.loads(packet)
+        packet = json_loads(packet)
+        name = packet.get('name', None)
+        timer = QueryTimer()
         try:
-            result = self.handlers.get(packet.get('name', None), self.on_malformed)(packet)
+            with db.connection.execute_wrapper(timer):
+                result = self.handlers.get(name, self.on_malformed)(packet)
         except Exception:
             logger.exception('Error in packet handling (Django-facing)')
             result = {'name': 'bad-request'}
-        self.send(result)
-        raise Disconnect()
+        handler_db_time.observe(timer.elapsed, handler='django', packet=name if name in self.handlers else 'malformed')
+
+        # Clients that tag their requests with ids keep the connection open for further requests, and may send
+        # several before reading any response. Others get one response, after which the connection is closed.
+        request_id = packet.get('request-id')
+        if request_id is None:
+            self.send(result)
+            raise Disconnect()
+
+        self.timeout = IDLE_TIMEOUT
+        self.send(dict(result or {}, **{'request-id': request_id}))
 
     def on_submission(self, data):
         id = data['submission-id']
@@ -44,12 +63,18 @@ class DjangoHandler(ZlibPacketHandler):
         priority = data['priority']
         if not self.judges.check_priority(priority):
             return {'name': 'bad-request'}
-        self.judges.judge(id, problem, language, source, judge_id, priority)
+        self.judges.judge(id, problem, language, source, judge_id, priority,
+                          user=data.get('user-id'), contest=data.get('contest-id'))
         return {'name': 'submission-received', 'submission-id': id}
 
     def on_termination(self, data):
         return {'name': 'submission-received', 'judge-aborted': self.judges.abort(data['submission-id'])}
 
+    def on_estimate(self, data):
+        id = data['submission-id']
+        estimate = self.judges.estimate(id) or {'state': 'unknown'}
+        return dict(estimate, name='submission-estimate', **{'submission-id': id})
+
     def on_disconnect_request(self, data):
         judge_id = data['judge-id']
         force = data['force']
@@ -0,0 +1,131 @@
+import logging
+import threading
+from collections import OrderedDict
+from itertools import count
+
+from judge.bridge.metrics import Counter
+
+logger = logging.getLogger('judge.bridge')
+
+__all__ = ['EventPublisher', 'is_progress_event']
+
+events_sent = Counter('bridge_events_sent_total', 'Events posted to the event daemon')
+events_coalesced = Counter('bridge_events_coalesced_total', 'Queued events replaced by a newer event')
+events_dropped = Counter('bridge_events_dropped_total', 'Progress events dropped because the event queue was full')
+
+
+def is_progress_event(message):
+    """
+    Returns whether an event only reports the progress of grading through test cases, and is superseded by whatever
+    comes after it. These may be dropped under load; all others, such as grading-begin and done-submission, are state
+    transitions that clients need, and are always delivered.
+    """
+    if not isinstance(message, dict):
+        return False
+    type = message.get('type')
+    return type == 'test-case' or (type == 'update-submission' and message.get('state') == 'test-case')
+
+
+class EventPublisher(object):
+    """
+    Posts events from a background thread, so that callers never wait on the event daemon.
+
+    Events are queued in memory and sent in batches of up to batch_size. While an event is still queued, a newer
+    test-case event for the same channel, or update-submission event for the same submission, replaces it and moves
+    to the end of the queue.
+    Once max_size events are queued, the oldest queued progress event is dropped to make room; if there is none, a
+    new progress event is dropped instead, but other events are always queued.
+    """
+
+    def __init__(self, post_many, max_size=10000, batch_size=100):
+        self.post_many = post_many
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._pending = OrderedDict()
+        self._progress = OrderedDict()
+        self._counter = count()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopping = False
+
+    def _coalesce_key(self, channel, message):
+        type = message.get('type') if isinstance(message, dict) else None
+        if type == 'test-case':
+            return channel, type
+        elif type == 'update-submission':
+            return channel, type, message.get('id')
+        return next(self._counter)
+
+    def post(self, channel, message):
+        key = self._coalesce_key(channel, message)
+        progress = is_progress_event(message)
+
+        with self._condition:
+            if key in self._pending:
+                # The newer event is sent after everything queued before it, such as a done-submission that
+                # ended the run the replaced event belonged to.
+                self._pending[key] = (channel, message)
+                self._pending.move_to_end(key)
+                if progress:
+                    self._progress[key] = True
+                    self._progress.move_to_end(key)
+                else:
+                    self._progress.pop(key, None)
+                events_coalesced.inc()
+                return 0
+
+            if len(self._pending) >= self.max_size:
+                if self._progress:
+                    del self._pending[self._progress.popitem(last=False)[0]]
+                    self.dropped += 1
+                    events_dropped.inc()
+                elif progress:
+                    self.dropped += 1
+                    events_dropped.inc()
+                    return 0
+
+            self._pending[key] = (channel, message)
+            if progress:
+                self._progress[key] = True
+            self._ensure_thread()
+            self._condition.notify()
+        return 0
+
+    def last(self):
+        return 0
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='event-publisher', daemon=True)
+            self._thread.start()
+
+    def _take_batch(self):
+        with self._condition:
+            while not self._pending and not self._stopping:
+                self._condition.wait()
+            batch = []
+            while self._pending and len(batch) < self.batch_size:
+                key, event = self._pending.popitem(last=False)
+                self._progress.pop(key, None)
+                batch.append(event)
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return
+            try:
+                self.post_many(batch)
+                events_sent.inc(len(batch))
+            except Exception:
+                logger.exception('Failed to post %d events', len(batch))
+
+    def flush(self, timeout=None):
+        """Sends everything queued, then stops the publishing thread."""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
@@ -0,0 +1,43 @@
+STATUS_CODES = ['SC', 'AC', 'WA', 'MLE', 'TLE', 'IR', 'RTE', 'OLE']
+
+
+class GradingTotals(object):
+    """Running aggregate of the test case results of one submission, from which its final result is derived."""
+
+    def __init__(self, submission_id):
+        self.submission_id = submission_id
+        self.time = 0
+        self.memory = 0
+        self.points = 0.0
+        self.total = 0
+        self.status = 0
+        self.batches = {}  # batch number: [points, total]
+
+    @classmethod
+    def from_cases(cls, submission_id, cases):
+        totals = cls(submission_id)
+        for case in cases:
+            totals.add(case)
+        return totals
+
+    def add(self, case):
+        self.time += case.time
+        if not case.batch:
+            self.points += case.points
+            self.total += case.total
+        elif case.batch in self.batches:
+            self.batches[case.batch][0] = min(self.batches[case.batch][0], case.points)
+            self.batches[case.batch][1] = max(self.batches[case.batch][1], case.total)
+        else:
+            self.batches[case.batch] = [case.points, case.total]
+        self.memory = max(self.memory, case.memory)
+        self.status = max(self.status, STATUS_CODES.index(case.status))
+
+    def result(self):
+        """Returns (time, memory, case points, case total, result code)."""
+        points = self.points
+        total = self.total
+        for batch_points, batch_total in self.batches.values():
+            points += batch_points
+            total += batch_total
+        return self.time, self.memory, round(points, 1), round(total, 1), STATUS_CODES[self.status]
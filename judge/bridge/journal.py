@@ -0,0 +1,132 @@
+import json
+import logging
+import os
+from collections import OrderedDict
+
+logger = logging.getLogger('judge.bridge')
+
+__all__ = ['QueueJournal']
+
+
+def encode(record):
+    return json.dumps(record, separators=(',', ':')) + '\n'
+
+
+class QueueJournal(object):
+    """
+    An append-only log of the submissions the bridge has been asked to judge, so that a restarted bridge can queue
+    again the ones it had not finished.
+
+    Each line is a JSON array: ['queue', id, problem, language, source, judge id, priority, user, contest] when a
+    submission arrives, ['dispatch', id] when it is sent to a judge, and ['finish', id] when the bridge is done with
+    it, whether it was graded, aborted or lost with its judge. Once the log holds `compact_ratio` times as many
+    lines as there are unfinished submissions, it is rewritten with only those.
+
+    Lines are flushed to the operating system as they are written, which survives the bridge crashing. With `fsync`,
+    they are also forced to disk, which survives the machine crashing, at the cost of a disk write per event.
+
+    JudgeList calls the methods of a journal with its lock held.
+    """
+
+    def __init__(self, path, fsync=False, compact_ratio=4, min_compact_size=1000):
+        self.path = path
+        self.fsync = fsync
+        self.compact_ratio = compact_ratio
+        self.min_compact_size = min_compact_size
+        # submission id: the queue record of each unfinished submission, in the order they arrived
+        self.pending = OrderedDict()
+        self.dispatched = set()
+        self._lines = 0
+        self._file = None
+        self._closed = False
+
+    def replay(self):
+        """
+        Reads the journal left by the previous run of the bridge, and compacts it. Returns the queue records of the
+        unfinished submissions in the order they arrived, and the set of ids of those that had been dispatched.
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                for number, line in enumerate(f, 1):
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # The bridge died while writing the last line.
+                        logger.warning('Ignoring corrupt line %d of queue journal %s', number, self.path)
+                        continue
+                    self._apply(record)
+        except FileNotFoundError:
+            pass
+
+        records = list(self.pending.values())
+        dispatched, self.dispatched = self.dispatched, set()
+        self.compact()
+        logger.info('Recovered %d submissions (%d dispatched) from queue journal %s',
+                    len(records), len(dispatched), self.path)
+        return records, dispatched
+
+    def _apply(self, record):
+        kind, id = record[0], record[1]
+        if kind == 'queue':
+            self.pending[id] = record
+        elif kind == 'dispatch':
+            if id in self.pending:
+                self.dispatched.add(id)
+        elif kind == 'finish':
+            self.pending.pop(id, None)
+            self.dispatched.discard(id)
+
+    def _open(self):
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+        return self._file
+
+    def _sync(self, f):
+        f.flush()
+        if self.fsync:
+            os.fsync(f.fileno())
+
+    def _write(self, record):
+        if self._closed:
+            return
+        self._apply(record)
+        f = self._open()
+        f.write(encode(record))
+        self._sync(f)
+        self._lines += 1
+        if self._lines > max(self.min_compact_size, self.compact_ratio * len(self.pending)):
+            self.compact()
+
+    def compact(self):
+        """Rewrites the journal with only the unfinished submissions, replacing the old one atomically."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+        temp = self.path + '.tmp'
+        with open(temp, 'w', encoding='utf-8') as f:
+            for id, record in self.pending.items():
+                f.write(encode(record))
+                if id in self.dispatched:
+                    f.write(encode(['dispatch', id]))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, self.path)
+        self._lines = len(self.pending) + len(self.dispatched)
+
+    def queue(self, id, problem, language, source, judge_id, priority, user=None, contest=None):
+        self._write(['queue', id, problem, language, source, judge_id, priority, user, contest])
+
+    def dispatch(self, id):
+        self._write(['dispatch', id])
+
+    def finish(self, id):
+        if id in self.pending:
+            self._write(['finish', id])
+
+    def close(self):
+        """Stops journaling, so that submissions lost while the bridge shuts down are queued again after it restarts."""
+        self._closed = True
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -4,22 +4,44 @@ import logging
 import threading
 import time
 from collections import deque, namedtuple
+from functools import partial
 from operator import itemgetter
 
 from django import db
 from django.conf import settings
 from django.utils import timezone
 
-from judge import event_poster as event
-from judge.bridge.base_handler import ZlibPacketHandler, proxy_list
+from judge import event_poster
+from judge.bridge.base_handler import FRAME_MSGPACK, ZlibPacketHandler, json_loads, msgpack, msgpack_dumps, \
+    msgpack_loads, proxy_list
+from judge.bridge.debouncer import Debouncer
+from judge.bridge.event_publisher import EventPublisher
+from judge.bridge.grading_totals import GradingTotals
+from judge.bridge.judge_sync import sync_problems, sync_runtimes, update_problems
+from judge.bridge.metrics import Counter, QueryTimer, Summary, handler_db_time
+from judge.bridge.submission_data import get_attempt_numbers, get_problem_limits
+from judge.bridge.write_buffer import TestCaseWriteBuffer
 from judge.caching import finished_submission
-from judge.models import Judge, Language, LanguageLimit, Problem, RuntimeVersion, Submission, SubmissionTestCase
+from judge.judge_priority import REJUDGE_PRIORITY
+from judge.models import Judge, Submission, SubmissionTestCase
 
 logger = logging.getLogger('judge.bridge')
 json_log = logging.getLogger('judge.json.bridge')
 
-UPDATE_RATE_LIMIT = 5
-UPDATE_RATE_TIME = 0.5
+# Maximum number of queued rejudges to compute attempt numbers for at once.
+ATTEMPT_PREFETCH_LIMIT = 1000
+
+packets_received = Counter('bridge_judge_packets_total', 'Packets received from judges', ['judge'])
+grading_time = Summary('bridge_grading_seconds', 'Time from dispatching a submission to its grading-end', ['judge'])
+
+if event_poster.real and settings.BRIDGED_EVENT_QUEUE_SIZE:
+    event = EventPublisher(event_poster.post_many, settings.BRIDGED_EVENT_QUEUE_SIZE, settings.BRIDGED_EVENT_BATCH_SIZE)
+else:
+    event = event_poster
+
+# Shared by all judges, so that the rate limit applies to the bridge as a whole.
+progress_events = Debouncer(settings.BRIDGED_PROGRESS_INTERVAL, settings.BRIDGED_PROGRESS_RATE)
+
 SubmissionData = namedtuple('SubmissionData', 'time memory short_circuit pretests_only contest_no attempt_no user_id')
 
 
@@ -29,6 +51,10 @@ def _ensure_connection():
 
 class JudgeHandler(ZlibPacketHandler):
     proxies = proxy_list(settings.BRIDGED_JUDGE_PROXIES or [])
+    raw_packets = True
+    # Seconds between pings, and seconds a judge has to acknowledge a submission before it is disconnected.
+    ping_interval = 10
+    no_response_timeout = 20
 
     def __init__(self, request, client_address, server, judges):
         super().__init__(request, client_address, server)
@@ -47,9 +73,12 @@ class JudgeHandler(ZlibPacketHandler):
             'submission-acknowledged': self.on_submission_acknowledged,
             'ping-response': self.on_ping_response,
             'supported-problems': self.on_supported_problems,
+            'supported-problems-delta': self.on_supported_problems_delta,
             'handshake': self.on_handshake,
         }
         self._working = False
+        self._msgpack = False
+        self._submit_time = None
         self._no_response_job = None
         self._problems = []
         self.executors = {}
@@ -57,6 +86,8 @@ class JudgeHandler(ZlibPacketHandler):
         self.latency = None
         self.time_delta = None
         self.load = 1e100
+        # The ping and load last written to the database.
+        self._saved_status = (None, None)
         self.name = None
         self.is_disabled = False
         self.batch_id = None
@@ -65,13 +96,19 @@ class JudgeHandler(ZlibPacketHandler):
         self._ping_average = deque(maxlen=6)  # 1 minute average, just like load
         self._time_delta = deque(maxlen=6)
 
-        # each value is (updates, last reset)
-        self.update_counter = {}
+        # Guards the submission whose progress is posted, which the debouncer thread checks before posting.
+        self._progress_lock = threading.Lock()
+        self._progress_id = None
         self.judge = None
         self.judge_address = None
 
         self._submission_cache_id = None
         self._submission_cache = {}
+        # Guards the buffer of test cases, which the ping loop also writes out once they are old enough.
+        self._test_case_lock = threading.Lock()
+        self._test_case_buffer = TestCaseWriteBuffer(None, settings.BRIDGED_TEST_CASE_FLUSH_SIZE,
+                                                     settings.BRIDGED_TEST_CASE_FLUSH_INTERVAL)
+        self._grading_totals = None
 
     def on_connect(self):
         self.timeout = 15
@@ -80,6 +117,7 @@ class JudgeHandler(ZlibPacketHandler):
 
     def on_disconnect(self):
         self._stop_ping.set()
+        self._end_progress()
         if self._working:
             logger.error('Judge %s disconnected while handling submission %s', self.name, self._working)
         self.judges.remove(self)
@@ -113,21 +151,14 @@ class JudgeHandler(ZlibPacketHandler):
         judge = self.judge = Judge.objects.get(name=self.name)
         judge.start_time = timezone.now()
         judge.online = True
-        judge.problems.set(Problem.objects.filter(code__in=list(self.problems.keys())))
-        judge.runtimes.set(Language.objects.filter(key__in=list(self.executors.keys())))
+        # Written on the first ping response.
+        judge.ping = judge.load = None
+        sync_problems(judge, self.problems.keys())
+        sync_runtimes(judge, self.executors)
 
         # Cache is_disabled for faster access
         self.is_disabled = judge.is_disabled
 
-        # Delete now in case we somehow crashed and left some over from the last connection
-        RuntimeVersion.objects.filter(judge=judge).delete()
-        versions = []
-        for lang in judge.runtimes.all():
-            versions += [
-                RuntimeVersion(language=lang, name=name, version='.'.join(map(str, version)), priority=idx, judge=judge)
-                for idx, (name, version) in enumerate(self.executors[lang.key])
-            ]
-        RuntimeVersion.objects.bulk_create(versions)
         judge.last_ip = self.client_address[0]
         judge.save()
         self.judge_address = '[%s]:%s' % (self.client_address[0], self.client_address[1])
@@ -135,19 +166,58 @@ class JudgeHandler(ZlibPacketHandler):
                                           executors=list(self.executors.keys())))
 
     def _disconnected(self):
-        Judge.objects.filter(id=self.judge.id).update(online=False)
-        RuntimeVersion.objects.filter(judge=self.judge).delete()
+        Judge.clear_live_status(self.name)
+        if self.latency is None:
+            Judge.objects.filter(id=self.judge.id).update(online=False)
+        else:
+            Judge.objects.filter(id=self.judge.id).update(online=False, ping=self.latency, load=self.load)
+
+    def _status_changed(self):
+        ping, load = self._saved_status
+        if ping is None or load is None:
+            return True
+        return (abs(self.load - load) >= settings.BRIDGED_JUDGE_LOAD_CHANGE or
+                abs(self.latency - ping) >= settings.BRIDGED_JUDGE_PING_CHANGE * ping)
 
     def _update_ping(self):
+        # The status page reads the live ping and load from the cache. The database is only written when they change
+        # significantly, rather than on every ping of every judge.
+        Judge.set_live_status(self.name, self.latency, self.load)
+        if not self._status_changed():
+            return
         try:
             Judge.objects.filter(name=self.name).update(ping=self.latency, load=self.load)
+            self._saved_status = (self.latency, self.load)
         except Exception as e:
             # What can I do? I don't want to tie this to MySQL.
             if e.__class__.__name__ == 'OperationalError' and e.__module__ == '_mysql_exceptions' and e.args[0] == 2006:
                 db.connection.close()
 
     def send(self, data):
-        super().send(json.dumps(data, separators=(',', ':')))
+        if self._msgpack:
+            self.send_frame(msgpack_dumps(data), FRAME_MSGPACK)
+        else:
+            super().send(json.dumps(data, separators=(',', ':')))
+
+    def _negotiate_protocol(self, features):
+        """
+        Picks the frame options to use with a judge, among the protocol features listed in its handshake. Judges that
+        list none keep sending and receiving zlib compressed JSON.
+        """
+        options = {}
+        if 'raw-frames' in features and settings.BRIDGED_COMPRESSION_THRESHOLD:
+            options['compression-threshold'] = settings.BRIDGED_COMPRESSION_THRESHOLD
+            options['compression-level'] = settings.BRIDGED_COMPRESSION_LEVEL
+        if 'msgpack' in features and settings.BRIDGED_USE_MSGPACK and msgpack is not None:
+            options['encoding'] = 'msgpack'
+        if 'problem-deltas' in features:
+            options['problem-deltas'] = True
+        return options
+
+    def _apply_protocol(self, options):
+        self.compression_threshold = options.get('compression-threshold', 0)
+        self.compression_level = options.get('compression-level', self.compression_level)
+        self._msgpack = options.get('encoding') == 'msgpack'
 
     def on_handshake(self, packet):
         if 'id' not in packet or 'key' not in packet:
@@ -164,11 +234,18 @@ class JudgeHandler(ZlibPacketHandler):
         self.problems = dict(self._problems)
         self.executors = packet['executors']
         self.name = packet['id']
+        self._test_case_buffer.judge_name = self.name
 
-        self.send({'name': 'handshake-success'})
+        if packet.get('protocol-features'):
+            # The reply itself is in the old format; both sides switch to the negotiated options after it.
+            options = self._negotiate_protocol(packet['protocol-features'])
+            self.send({'name': 'handshake-success', 'protocol': options})
+            self._apply_protocol(options)
+        else:
+            self.send({'name': 'handshake-success'})
         logger.info('Judge authenticated: %s (%s)', self.client_address, packet['id'])
         self.judges.register(self)
-        threading.Thread(target=self._ping_thread).start()
+        self._start_ping()
         self._connected()
 
     def can_judge(self, problem, executor, judge_id=None):
@@ -179,14 +256,13 @@ class JudgeHandler(ZlibPacketHandler):
     def working(self):
         return bool(self._working)
 
-    def get_related_submission_data(self, submission):
+    def get_related_submission_data(self, submission, problem=None):
         _ensure_connection()
 
         try:
-            pid, time, memory, short_circuit, lid, is_pretested, sub_date, uid, part_virtual, part_id = (
+            pid, lid, is_pretested, sub_date, uid, part_virtual, part_id = (
                 Submission.objects.filter(id=submission)
-                          .values_list('problem__id', 'problem__time_limit', 'problem__memory_limit',
-                                       'problem__short_circuit', 'language__id', 'is_pretested', 'date', 'user__id',
+                          .values_list('problem__id', 'language__id', 'is_pretested', 'date', 'user__id',
                                        'contest__participation__virtual', 'contest__participation__id')).get()
         except Submission.DoesNotExist:
             logger.error('Submission vanished: %s', submission)
@@ -196,14 +272,12 @@ class JudgeHandler(ZlibPacketHandler):
             ))
             return
 
-        attempt_no = Submission.objects.filter(problem__id=pid, contest__participation__id=part_id, user__id=uid,
-                                               date__lt=sub_date).exclude(status__in=('CE', 'IE')).count() + 1
+        attempt_no = self._get_attempt_number(submission, problem)
+        if attempt_no is None:
+            attempt_no = Submission.objects.filter(problem__id=pid, contest__participation__id=part_id, user__id=uid,
+                                                   date__lt=sub_date).exclude(status__in=('CE', 'IE')).count() + 1
 
-        try:
-            time, memory = (LanguageLimit.objects.filter(problem__id=pid, language__id=lid)
-                            .values_list('time_limit', 'memory_limit').get())
-        except LanguageLimit.DoesNotExist:
-            pass
+        time, memory, short_circuit = get_problem_limits(pid, lid)
 
         return SubmissionData(
             time=time,
@@ -215,6 +289,27 @@ class JudgeHandler(ZlibPacketHandler):
             user_id=uid,
         )
 
+    def _get_attempt_number(self, submission, problem):
+        # Mass rejudges dispatch thousands of queued submissions to the same problem, so their attempt numbers are
+        # computed together the first time one of them is dispatched. This is called with the JudgeList lock held.
+        attempts = self.judges.attempt_numbers
+        if submission in attempts:
+            return attempts.pop(submission)
+        if problem is None or submission not in self.judges.queue:
+            return None
+        batch = self.judges.queue.ids_for_problem(problem, min_priority=REJUDGE_PRIORITY, limit=ATTEMPT_PREFETCH_LIMIT)
+        if not batch:
+            return None
+        batch.append(submission)
+
+        if len(attempts) > ATTEMPT_PREFETCH_LIMIT * 10:
+            # Drop the results for submissions that were aborted before being dispatched.
+            for id in [id for id in attempts if id not in self.judges.queue]:
+                del attempts[id]
+
+        attempts.update(get_attempt_numbers(batch))
+        return attempts.pop(submission, None)
+
     def disconnect(self, force=False):
         if force:
             # Yank the power out.
@@ -223,9 +318,10 @@ class JudgeHandler(ZlibPacketHandler):
             self.send({'name': 'disconnect'})
 
     def submit(self, id, problem, language, source):
-        data = self.get_related_submission_data(id)
+        data = self.get_related_submission_data(id, problem)
         self._working = id
-        self._no_response_job = threading.Timer(20, self._kill_if_no_response)
+        self._submit_time = time.monotonic()
+        self._no_response_job = self._make_no_response_job()
         self.send({
             'name': 'submission-request',
             'submission-id': id,
@@ -243,6 +339,9 @@ class JudgeHandler(ZlibPacketHandler):
             },
         })
 
+    def _make_no_response_job(self):
+        return threading.Timer(self.no_response_timeout, self._kill_if_no_response)
+
     def _kill_if_no_response(self):
         logger.error('Judge failed to acknowledge submission: %s: %s', self.name, self._working)
         self.close()
@@ -290,16 +389,32 @@ class JudgeHandler(ZlibPacketHandler):
         self.send({'name': 'ping', 'when': time.time()})
 
     def on_packet(self, data):
+        self._on_encoded_packet(data, json_loads)
+
+    def on_msgpack_packet(self, data):
+        if not self._msgpack:
+            # Rejects the packet, since msgpack was not negotiated.
+            super().on_msgpack_packet(data)
+            return
+        self._on_encoded_packet(data, msgpack_loads)
+
+    def _on_encoded_packet(self, data, loads):
         try:
             try:
-                data = json.loads(data)
+                data = loads(data)
                 if 'name' not in data:
                     raise ValueError
             except ValueError:
                 self.on_malformed(data)
             else:
-                handler = self.handlers.get(data['name'], self.on_malformed)
-                handler(data)
+                name = data['name'] if data['name'] in self.handlers else 'malformed'
+                packets_received.inc(judge=self.name)
+                timer = QueryTimer()
+                try:
+                    with db.connection.execute_wrapper(timer):
+                        self.handlers.get(data['name'], self.on_malformed)(data)
+                finally:
+                    handler_db_time.observe(timer.elapsed, handler='judge', packet=name)
         except Exception:
             logger.exception('Error in packet handling (Judge-side): %s', self.name)
             self._packet_exception()
@@ -320,12 +435,35 @@ class JudgeHandler(ZlibPacketHandler):
         if not self.working:
             self.judges.update_problems(self)
 
-        self.judge.problems.set(Problem.objects.filter(code__in=list(self.problems.keys())))
+        sync_problems(self.judge, self.problems.keys())
         json_log.info(self._make_json_log(action='update-problems', count=len(self.problems)))
 
+    def on_supported_problems_delta(self, packet):
+        # Sent instead of supported-problems by judges that negotiated problem-deltas: added is a list of
+        # [code, mtime] pairs, and removed a list of codes.
+        added = dict(packet['added'])
+        removed = [code for code in packet['removed'] if code not in added]
+        logger.info('%s: Updated problem list: %d added, %d removed', self.name, len(added), len(removed))
+
+        problems = dict(self.problems)
+        for code in removed:
+            problems.pop(code, None)
+        problems.update(added)
+        self._problems = list(problems.items())
+        self.problems = problems
+        if added:
+            self.judges.add_problems(self, added.keys())
+
+        update_problems(self.judge, list(added), removed)
+        json_log.info(self._make_json_log(action='update-problems', count=len(self.problems),
+                                          added=len(added), removed=len(removed)))
+
     def on_grading_begin(self, packet):
         logger.info('%s: Grading has begun on: %s', self.name, packet['submission-id'])
         self.batch_id = None
+        self._end_progress()
+        self._progress_id = packet['submission-id']
+        self._grading_totals = GradingTotals(packet['submission-id'])
 
         if Submission.objects.filter(id=packet['submission-id']).update(
                 status='G', is_pretested=packet['pretested'], current_testcase=1,
@@ -340,6 +478,8 @@ class JudgeHandler(ZlibPacketHandler):
 
     def on_grading_end(self, packet):
         logger.info('%s: Grading has ended on: %s', self.name, packet['submission-id'])
+        self._observe_grading_time()
+        self._end_progress()
         self._free_self(packet)
         self.batch_id = None
 
@@ -350,36 +490,7 @@ class JudgeHandler(ZlibPacketHandler):
             json_log.error(self._make_json_log(packet, action='grading-end', info='unknown submission'))
             return
 
-        time = 0
-        memory = 0
-        points = 0.0
-        total = 0
-        status = 0
-        status_codes = ['SC', 'AC', 'WA', 'MLE', 'TLE', 'IR', 'RTE', 'OLE']
-        batches = {}  # batch number: (points, total)
-
-        for case in SubmissionTestCase.objects.filter(submission=submission):
-            time += case.time
-            if not case.batch:
-                points += case.points
-                total += case.total
-            else:
-                if case.batch in batches:
-                    batches[case.batch][0] = min(batches[case.batch][0], case.points)
-                    batches[case.batch][1] = max(batches[case.batch][1], case.total)
-                else:
-                    batches[case.batch] = [case.points, case.total]
-            memory = max(memory, case.memory)
-            i = status_codes.index(case.status)
-            if i > status:
-                status = i
-
-        for i in batches:
-            points += batches[i][0]
-            total += batches[i][1]
-
-        points = round(points, 1)
-        total = round(total, 1)
+        time, memory, points, total, result = self._get_grading_totals(packet, submission)
         submission.case_points = points
         submission.case_total = total
 
@@ -392,7 +503,7 @@ class JudgeHandler(ZlibPacketHandler):
         submission.time = time
         submission.memory = memory
         submission.points = sub_points
-        submission.result = status_codes[status]
+        submission.result = result
         submission.save()
 
         json_log.info(self._make_json_log(
@@ -408,7 +519,7 @@ class JudgeHandler(ZlibPacketHandler):
 
         problem._updating_stats_only = True
         problem.update_stats()
-        submission.update_contest()
+        submission.update_contest(graded=True)
 
         finished_submission(submission)
 
@@ -425,6 +536,35 @@ class JudgeHandler(ZlibPacketHandler):
             event.post('contest_%d' % participation.contest_id, {'type': 'update'})
         self._post_update_submission(submission.id, 'grading-end', done=True)
 
+    def _observe_grading_time(self):
+        if self._submit_time is not None:
+            grading_time.observe(time.monotonic() - self._submit_time, judge=self.name)
+            self._submit_time = None
+
+    def _get_grading_totals(self, packet, submission):
+        totals = self._grading_totals
+        self._grading_totals = None
+
+        # We only have running totals if we saw the submission's grading-begin, which is always the case unless the
+        # judge misbehaves. Otherwise, fall back to the test cases in the database.
+        if totals is None or totals.submission_id != submission.id:
+            return GradingTotals.from_cases(
+                submission.id, SubmissionTestCase.objects.filter(submission=submission),
+            ).result()
+
+        result = totals.result()
+        if settings.BRIDGED_VERIFY_GRADING_TOTALS:
+            expected = GradingTotals.from_cases(
+                submission.id, SubmissionTestCase.objects.filter(submission=submission),
+            ).result()
+            if result != expected:
+                logger.error('%s: Running totals for %s do not match database: %r != %r',
+                             self.name, submission.id, result, expected)
+                json_log.error(self._make_json_log(packet, action='grading-end', info='running totals mismatch',
+                                                   running=result, expected=expected))
+                return expected
+        return result
+
     def on_compile_error(self, packet):
         logger.info('%s: Submission failed to compile: %s', self.name, packet['submission-id'])
         self._free_self(packet)
@@ -458,6 +598,7 @@ class JudgeHandler(ZlibPacketHandler):
             raise ValueError('\n\n' + packet['message'])
         except ValueError:
             logger.exception('Judge %s failed while handling submission %s', self.name, packet['submission-id'])
+        self._end_progress()
         self._free_self(packet)
 
         id = packet['submission-id']
@@ -473,6 +614,7 @@ class JudgeHandler(ZlibPacketHandler):
 
     def on_submission_terminated(self, packet):
         logger.info('%s: Submission aborted: %s', self.name, packet['submission-id'])
+        self._end_progress()
         self._free_self(packet)
 
         if Submission.objects.filter(id=packet['submission-id']).update(status='AB', result='AB', points=0):
@@ -506,11 +648,6 @@ class JudgeHandler(ZlibPacketHandler):
         updates = packet['cases']
         max_position = max(map(itemgetter('position'), updates))
 
-        if not Submission.objects.filter(id=id).update(current_testcase=max_position + 1):
-            logger.warning('Unknown submission: %s', id)
-            json_log.error(self._make_json_log(packet, action='test-case', info='unknown submission'))
-            return
-
         bulk_test_case_updates = []
         for result in updates:
             test_case = SubmissionTestCase(submission_id=id, case=result['position'])
@@ -540,6 +677,8 @@ class JudgeHandler(ZlibPacketHandler):
             test_case.extended_feedback = result.get('extended-feedback') or ''
             test_case.output = result['output']
             bulk_test_case_updates.append(test_case)
+            if self._grading_totals is not None and self._grading_totals.submission_id == id:
+                self._grading_totals.add(test_case)
 
             json_log.info(self._make_json_log(
                 packet, action='test-case', case=test_case.case, batch=test_case.batch,
@@ -551,28 +690,57 @@ class JudgeHandler(ZlibPacketHandler):
                 runtime_version=result.get('runtime-version', ''),
             ))
 
-        do_post = True
+        with self._test_case_lock:
+            self._test_case_buffer.add(id, max_position + 1, bulk_test_case_updates)
+            if self._test_case_buffer.should_flush():
+                self._flush_and_post_test_cases()
+
+    def _flush_test_cases_if_due(self):
+        with self._test_case_lock:
+            if self._test_case_buffer.should_flush():
+                self._flush_and_post_test_cases()
+
+    def _flush_and_post_test_cases(self):
+        # Rows must be written before clients are told to refresh, otherwise they would see stale results, so progress
+        # is only posted once they are. The debouncer thread only posts events; it never touches the database.
+        id = self._test_case_buffer.submission_id
+        position = self._test_case_buffer.current_testcase - 1
+        if self._flush_test_cases():
+            progress_events.submit(id, partial(self._post_test_case, id, position,
+                                               self._get_submission_event_data(id)))
+
+    def _post_test_case(self, id, position, data):
+        with self._progress_lock:
+            if self._progress_id != id:
+                return
 
-        if id in self.update_counter:
-            cnt, reset = self.update_counter[id]
-            cnt += 1
-            if time.monotonic() - reset > UPDATE_RATE_TIME:
-                del self.update_counter[id]
-            else:
-                self.update_counter[id] = (cnt, reset)
-                if cnt > UPDATE_RATE_LIMIT:
-                    do_post = False
-        if id not in self.update_counter:
-            self.update_counter[id] = (1, time.monotonic())
-
-        if do_post:
             event.post('sub_%s' % Submission.get_id_secret(id), {
                 'type': 'test-case',
-                'id': max_position,
+                'id': position,
             })
-            self._post_update_submission(id, state='test-case')
+            self._post_submission_event(data, id, state='test-case')
+
+    def _end_progress(self):
+        # Whatever event follows supersedes any test-case event still held by the debouncer.
+        with self._progress_lock:
+            if self._progress_id is not None:
+                progress_events.cancel(self._progress_id)
+                self._progress_id = None
+        with self._test_case_lock:
+            self._flush_test_cases()
+
+    def _flush_test_cases(self):
+        # Called with _test_case_lock held.
+        id = self._test_case_buffer.submission_id
+        if id is None:
+            return True
 
-        SubmissionTestCase.objects.bulk_create(bulk_test_case_updates)
+        _ensure_connection()
+        if not self._test_case_buffer.flush():
+            logger.warning('Unknown submission: %s', id)
+            json_log.error(self._make_json_log(sub=id, action='test-case', info='unknown submission'))
+            return False
+        return True
 
     def on_malformed(self, packet):
         logger.error('%s: Malformed packet: %s', self.name, packet)
@@ -590,16 +758,46 @@ class JudgeHandler(ZlibPacketHandler):
     def _free_self(self, packet):
         self.judges.on_judge_free(self, packet['submission-id'])
 
+    def _start_ping(self):
+        threading.Thread(target=self._ping_thread).start()
+
     def _ping_thread(self):
         try:
+            next_ping = 0
             while True:
-                self.ping()
-                if self._stop_ping.wait(10):
+                next_ping = self._ping_if_due(next_ping)
+                self._flush_test_cases_if_due()
+                if self._stop_ping.wait(self._ping_wait(next_ping)):
                     break
         except Exception:
             logger.exception('Ping error in %s', self.name)
             self.close()
             raise
+        finally:
+            # Writing test cases opened a connection for this thread.
+            db.connection.close()
+
+    def _ping_if_due(self, next_ping):
+        """Pings the judge if it is time to. Returns when to ping it next, on the monotonic clock."""
+        now = time.monotonic()
+        if now < next_ping:
+            return next_ping
+        self.ping()
+        return now + self.ping_interval
+
+    def _ping_wait(self, next_ping):
+        """
+        Returns how long the ping loop sleeps: until the next ping, or until the buffered test cases are old enough to
+        be written. Test cases buffered while it sleeps are only old enough after it wakes up again, unless they are
+        written as soon as they are buffered.
+        """
+        wait = next_ping - time.monotonic()
+        due = self._test_case_buffer.due_in()
+        if due is not None:
+            wait = min(wait, due)
+        elif self._test_case_buffer.max_delay > 0:
+            wait = min(wait, self._test_case_buffer.max_delay)
+        return max(0, wait)
 
     def _make_json_log(self, packet=None, sub=None, **kwargs):
         data = {
@@ -613,16 +811,19 @@ class JudgeHandler(ZlibPacketHandler):
         data.update(kwargs)
         return json.dumps(data)
 
-    def _post_update_submission(self, id, state, done=False):
-        if self._submission_cache_id == id:
-            data = self._submission_cache
-        else:
-            self._submission_cache = data = Submission.objects.filter(id=id).values(
+    def _get_submission_event_data(self, id):
+        if self._submission_cache_id != id:
+            self._submission_cache = Submission.objects.filter(id=id).values(
                 'problem__is_public', 'contest_object_id',
                 'user_id', 'problem_id', 'status', 'language__key',
             ).get()
             self._submission_cache_id = id
+        return self._submission_cache
+
+    def _post_update_submission(self, id, state, done=False):
+        self._post_submission_event(self._get_submission_event_data(id), id, state, done)
 
+    def _post_submission_event(self, data, id, state, done=False):
         if data['problem__is_public']:
             event.post('submissions', {
                 'type': 'done-submission' if done else 'update-submission',
@@ -1,56 +1,85 @@
 import logging
-from collections import namedtuple
-from random import random
 from threading import RLock
 
+from judge.bridge.metrics import Summary
+from judge.bridge.queue_estimates import QueueEstimator
+from judge.bridge.scheduler import LeastLoadScheduler
+from judge.bridge.submission_queue import SubmissionQueue
 from judge.judge_priority import REJUDGE_PRIORITY
 
-try:
-    from llist import dllist
-except ImportError:
-    from pyllist import dllist
-
 logger = logging.getLogger('judge.bridge')
 
-PriorityMarker = namedtuple('PriorityMarker', 'priority')
+dispatch_latency = Summary('bridge_dispatch_latency_seconds',
+                           'Time from a submission arriving at the bridge to its dispatch to a judge', ['priority'])
+
+
+class RestrictedJudge(object):
+    """Presents a judge to the scheduler as if it could only grade some of its problems."""
+
+    def __init__(self, judge, problems):
+        self._judge = judge
+        self._problems = problems
+
+    def __getattr__(self, name):
+        return getattr(self._judge, name)
+
+    def can_judge(self, problem, executor, judge_id=None):
+        return problem in self._problems and self._judge.can_judge(problem, executor, judge_id)
 
 
 class JudgeList(object):
     priorities = 4
 
-    def __init__(self):
-        self.queue = dllist()
-        self.priority = [self.queue.append(PriorityMarker(i)) for i in range(self.priorities)]
+    def __init__(self, scheduler=None, journal=None):
+        self.scheduler = scheduler or LeastLoadScheduler()
+        self.journal = journal
+        self.queue = SubmissionQueue(self.priorities, clock=self.scheduler.clock)
+        self.estimator = QueueEstimator(self.scheduler.clock)
+        self.node_map = self.queue.node_map
         self.judges = set()
-        self.node_map = {}
         self.submission_map = {}
+        # Attempt numbers computed ahead of time for queued rejudges, see JudgeHandler._get_attempt_number.
+        self.attempt_numbers = {}
         self.lock = RLock()
 
-    def _handle_free_judge(self, judge):
+    def _handle_free_judge(self, judge, problems=None):
         with self.lock:
-            node = self.queue.first
-            priority = 0
-            while node:
-                if isinstance(node.value, PriorityMarker):
-                    priority = node.value.priority + 1
-                elif priority >= REJUDGE_PRIORITY and self.count_not_disabled() > 1 and sum(
-                        not judge.working and not judge.is_disabled for judge in self.judges) <= 1:
+            candidate = judge if problems is None else RestrictedJudge(judge, problems)
+            for priority in range(self.priorities):
+                if priority >= REJUDGE_PRIORITY and self.queue.has_priority(priority) and \
+                        self.count_not_disabled() > 1 and sum(
+                            not judge.working and not judge.is_disabled for judge in self.judges) <= 1:
                     return
-                else:
-                    id, problem, language, source, judge_id = node.value
-                    if judge.can_judge(problem, language, judge_id):
-                        self.submission_map[id] = judge
-                        try:
-                            judge.submit(id, problem, language, source)
-                        except Exception:
-                            logger.exception('Failed to dispatch %d (%s, %s) to %s', id, problem, language, judge.name)
-                            self.judges.remove(judge)
-                            return
-                        logger.info('Dispatched queued submission %d: %s', id, judge.name)
-                        self.queue.remove(node)
-                        del self.node_map[id]
-                        break
-                node = node.next
+
+                item = self.scheduler.select_submission(candidate, self.queue, priority)
+                if item is None:
+                    continue
+
+                self.submission_map[item.id] = judge
+                try:
+                    judge.submit(item.id, item.problem, item.language, item.source)
+                except Exception:
+                    logger.exception('Failed to dispatch %d (%s, %s) to %s', item.id, item.problem, item.language,
+                                     judge.name)
+                    self.judges.remove(judge)
+                    return
+                logger.info('Dispatched queued submission %d: %s', item.id, judge.name)
+                self.queue.remove(item.id)
+                dispatch_latency.observe(self.scheduler.clock() - item.queued, priority=priority)
+                self._on_dispatch(judge, item.id, item.problem, item.language, item.user, item.contest)
+                return
+
+    def _on_dispatch(self, judge, id, problem, language, user, contest):
+        self.scheduler.on_dispatch(judge, id, problem, language, user, contest)
+        self.estimator.on_dispatch(judge, id, problem, language)
+        if self.journal is not None:
+            self.journal.dispatch(id)
+
+    def _on_finish(self, judge, id, completed=True):
+        self.scheduler.on_finish(judge, id, completed=completed)
+        self.estimator.on_finish(id, completed=completed)
+        if self.journal is not None:
+            self.journal.finish(id)
 
     def count_not_disabled(self):
         return sum(not judge.is_disabled for judge in self.judges)
@@ -72,6 +101,16 @@ class JudgeList(object):
         with self.lock:
             self._handle_free_judge(judge)
 
+    def add_problems(self, judge, problems):
+        """
+        Dispatches to a free judge that gained `problems`. Only submissions to those problems are considered, since
+        the judge would already be grading any other submission it could.
+        """
+        with self.lock:
+            problems = {problem for problem in problems if self.queue.has_problem(problem)}
+            if problems and not judge.working:
+                self._handle_free_judge(judge, problems)
+
     def update_disable_judge(self, judge_id, is_disabled):
         with self.lock:
             for judge in self.judges:
@@ -86,6 +125,7 @@ class JudgeList(object):
                     del self.submission_map[sub]
                 except KeyError:
                     pass
+                self._on_finish(judge, sub, completed=False)
             self.judges.discard(judge)
 
             # Since we reserve a judge for high priority submissions when there are more than one,
@@ -103,6 +143,7 @@ class JudgeList(object):
         with self.lock:
             del self.submission_map[submission]
             judge._working = False
+            self._on_finish(judge, submission)
             self._handle_free_judge(judge)
 
     def abort(self, submission):
@@ -112,38 +153,63 @@ class JudgeList(object):
                 self.submission_map[submission].abort()
                 return True
             except KeyError:
-                try:
-                    node = self.node_map[submission]
-                except KeyError:
-                    pass
-                else:
-                    self.queue.remove(node)
-                    del self.node_map[submission]
+                self.queue.remove(submission)
+                if self.journal is not None:
+                    self.journal.finish(submission)
                 return False
 
+    def recover(self, records):
+        """Queues again submissions from the journal of a previous run, given their queue records."""
+        with self.lock:
+            for _, id, problem, language, source, judge_id, priority, user, contest in records:
+                if id not in self.submission_map and id not in self.node_map:
+                    self.queue.push(priority, id, problem, language, source, judge_id, user, contest)
+
+    def estimate(self, id):
+        """
+        Returns what the bridge expects of a submission: its state, 'queued' or 'grading', and for queued
+        submissions the number ahead of it and the expected wait, and the expected (remaining) grading time, both in
+        seconds. Returns None for submissions the bridge does not have.
+        """
+        with self.lock:
+            if id in self.submission_map:
+                return {'state': 'grading', 'position': 0, 'wait': 0, 'grading': self.estimator.remaining(id)}
+            node = self.node_map.get(id)
+            if node is None:
+                return None
+            position, wait, grading = self.estimator.estimate(node.value, self.queue, self.judges)
+            return {'state': 'queued', 'position': position, 'wait': wait, 'grading': grading}
+
     def check_priority(self, priority):
         return 0 <= priority < self.priorities
 
-    def judge(self, id, problem, language, source, judge_id, priority):
+    def _available_judges(self, problem, language, judge_id, priority):
+        candidates = [judge for judge in self.judges if judge.can_judge(problem, language, judge_id)]
+        available = [judge for judge in candidates if not judge.working and not judge.is_disabled]
+        if judge_id:
+            logger.info('Specified judge %s is%savailable', judge_id, ' ' if available else ' not ')
+        else:
+            logger.info('Free judges: %d', len(available))
+
+        # Keep one judge free for higher priority submissions.
+        if len(candidates) > 1 and len(available) == 1 and priority >= REJUDGE_PRIORITY:
+            return []
+        return available
+
+    def judge(self, id, problem, language, source, judge_id, priority, user=None, contest=None):
+        start = self.scheduler.clock()
         with self.lock:
             if id in self.submission_map or id in self.node_map:
                 # Already judging, don't queue again. This can happen during batch rejudges, rejudges should be
                 # idempotent.
                 return
 
-            candidates = [judge for judge in self.judges if judge.can_judge(problem, language, judge_id)]
-            available = [judge for judge in candidates if not judge.working and not judge.is_disabled]
-            if judge_id:
-                logger.info('Specified judge %s is%savailable', judge_id, ' ' if available else ' not ')
-            else:
-                logger.info('Free judges: %d', len(available))
-
-            if len(candidates) > 1 and len(available) == 1 and priority >= REJUDGE_PRIORITY:
-                available = []
+            if self.journal is not None:
+                self.journal.queue(id, problem, language, source, judge_id, priority, user, contest)
 
+            available = self._available_judges(problem, language, judge_id, priority)
             if available:
-                # Schedule the submission on the judge reporting least load.
-                judge = min(available, key=lambda judge: (judge.load, random()))
+                judge = self.scheduler.select_judge(available, problem, language, user, contest)
                 logger.info('Dispatched submission %d to: %s', id, judge.name)
                 self.submission_map[id] = judge
                 try:
@@ -151,10 +217,9 @@ class JudgeList(object):
                 except Exception:
                     logger.exception('Failed to dispatch %d (%s, %s) to %s', id, problem, language, judge.name)
                     self.judges.discard(judge)
-                    return self.judge(id, problem, language, source, judge_id, priority)
+                    return self.judge(id, problem, language, source, judge_id, priority, user, contest)
+                self._on_dispatch(judge, id, problem, language, user, contest)
+                dispatch_latency.observe(self.scheduler.clock() - start, priority=priority)
             else:
-                self.node_map[id] = self.queue.insert(
-                    (id, problem, language, source, judge_id),
-                    self.priority[priority],
-                )
+                self.queue.push(priority, id, problem, language, source, judge_id, user, contest)
                 logger.info('Queued submission: %d', id)
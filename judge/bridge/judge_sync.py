@@ -0,0 +1,125 @@
+import hashlib
+import json
+import uuid
+
+from django.core.cache import cache
+
+from judge.models import Judge, Language, Problem, RuntimeVersion
+
+__all__ = ['sync_problems', 'sync_runtimes', 'update_problems']
+
+# Saving a problem or language deletes this token, which changes every digest, so that judges resync on their next
+# connect in case a code they advertise now matches a different row.
+SYNC_TOKEN_KEY = 'judge_sync_token'
+SYNC_TIMEOUT = 86400
+
+
+def sync_key(judge_id, kind):
+    return 'judge_sync:%d:%s' % (judge_id, kind)
+
+
+def _sync_token():
+    token = cache.get(SYNC_TOKEN_KEY)
+    if token is None:
+        cache.add(SYNC_TOKEN_KEY, uuid.uuid4().hex, None)
+        token = cache.get(SYNC_TOKEN_KEY)
+    return token
+
+
+def _digest(data):
+    return hashlib.sha1(json.dumps([_sync_token(), data], sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _sync_rows(queryset, key_fields, wanted, make):
+    """
+    Makes the rows in `queryset` match `wanted`, a set of tuples of the values of `key_fields`, deleting and creating
+    only the rows that differ. Returns (created, deleted).
+    """
+    stale = []
+    for row in queryset.values_list('id', *key_fields):
+        if row[1:] in wanted:
+            wanted.discard(row[1:])
+        else:
+            stale.append(row[0])
+    if stale:
+        queryset.filter(id__in=stale).delete()
+    if wanted:
+        queryset.model.objects.bulk_create([make(*values) for values in wanted])
+    return len(wanted), len(stale)
+
+
+def _sync(judge, kind, data, sync):
+    key = sync_key(judge.id, kind)
+    digest = _digest(data)
+    if cache.get(key) == digest:
+        return 0, 0
+    changed = sync()
+    cache.set(key, digest, SYNC_TIMEOUT)
+    return changed
+
+
+def sync_problems(judge, codes):
+    """
+    Links a judge to the problems with the given codes, inserting and deleting only the links that changed. Does
+    nothing if the codes are the same as when the judge was last synced. Returns (created, deleted).
+    """
+    codes = sorted(codes)
+    through = Judge.problems.through
+
+    def sync():
+        wanted = {(id,) for id in Problem.objects.filter(code__in=codes).values_list('id', flat=True)}
+        return _sync_rows(through.objects.filter(judge=judge), ('problem_id',), wanted,
+                          lambda problem_id: through(judge=judge, problem_id=problem_id))
+
+    return _sync(judge, 'problems', codes, sync)
+
+
+def update_problems(judge, added, removed):
+    """
+    Links a judge to the problems with the codes in `added`, and unlinks it from those in `removed`, without reading
+    its other links. Returns (created, deleted).
+    """
+    # The digest of the full problem list is unknown here, so the next connect diffs the links instead of trusting it.
+    cache.delete(sync_key(judge.id, 'problems'))
+    through = Judge.problems.through
+
+    deleted = 0
+    if removed:
+        deleted = through.objects.filter(judge=judge, problem__code__in=removed).delete()[0]
+
+    created = []
+    if added:
+        linked = through.objects.filter(judge=judge, problem__code__in=added).values_list('problem_id', flat=True)
+        created = [through(judge=judge, problem_id=id) for id in
+                   Problem.objects.filter(code__in=added).exclude(id__in=list(linked)).values_list('id', flat=True)]
+        through.objects.bulk_create(created)
+    return len(created), deleted
+
+
+def sync_runtimes(judge, executors):
+    """
+    Links a judge to the languages of its executors, and records the runtime versions of each, inserting and
+    deleting only the rows that changed. Does nothing if the executors are the same as when the judge was last
+    synced. Returns (created, deleted).
+    """
+    through = Judge.runtimes.through
+
+    def sync():
+        languages = dict(Language.objects.filter(key__in=list(executors.keys())).values_list('key', 'id'))
+        created, deleted = _sync_rows(through.objects.filter(judge=judge), ('language_id',),
+                                      {(id,) for id in languages.values()},
+                                      lambda language_id: through(judge=judge, language_id=language_id))
+
+        wanted = {
+            (languages[key], name, '.'.join(map(str, version)), priority)
+            for key, runtimes in executors.items() if key in languages
+            for priority, (name, version) in enumerate(runtimes)
+        }
+        versions = _sync_rows(RuntimeVersion.objects.filter(judge=judge),
+                              ('language_id', 'name', 'version', 'priority'), wanted,
+                              lambda language_id, name, version, priority: RuntimeVersion(
+                                  judge=judge, language_id=language_id, name=name, version=version,
+                                  priority=priority))
+        return created + versions[0], deleted + versions[1]
+
+    return _sync(judge, 'runtimes', executors, sync)
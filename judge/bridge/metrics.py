@@ -0,0 +1,184 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+__all__ = ['Counter', 'Gauge', 'Summary', 'QueryTimer', 'MetricsServer', 'registry']
+
+
+class Metric(object):
+    type = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _key(self, labels):
+        if tuple(sorted(labels)) != tuple(sorted(self.labels)):
+            raise ValueError('Expected labels %r for %s, got %r' % (self.labels, self.name, tuple(labels)))
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def _format_labels(self, key, extra=()):
+        pairs = list(zip(self.labels, key)) + list(extra)
+        if not pairs:
+            return ''
+        return '{%s}' % ','.join('%s="%s"' % (name, value.replace('\\', '\\\\').replace('"', '\\"'))
+                                 for name, value in pairs)
+
+    def samples(self):
+        raise NotImplementedError()
+
+    def render(self):
+        lines = ['# HELP %s %s' % (self.name, self.help), '# TYPE %s %s' % (self.name, self.type)]
+        lines += ['%s%s %r' % (name, labels, float(value)) for name, labels, value in self.samples()]
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        return [(self.name, self._format_labels(key), value) for key, value in values]
+
+
+class Gauge(Metric):
+    """A value that can go up and down. Either set explicitly, or computed by a function when rendered."""
+    type = 'gauge'
+
+    def __init__(self, name, help, labels=(), function=None):
+        super().__init__(name, help, labels)
+        self._values = {}
+        self._function = function
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function):
+        """`function` returns a dictionary mapping tuples of label values to values."""
+        self._function = function
+
+    def samples(self):
+        if self._function is not None:
+            values = [(tuple(map(str, key)), value) for key, value in self._function().items()]
+        else:
+            with self._lock:
+                values = list(self._values.items())
+        return [(self.name, self._format_labels(key), value) for key, value in values]
+
+
+class Summary(Metric):
+    type = 'summary'
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            count, total = self._values.get(key, (0, 0))
+            self._values[key] = (count + 1, total + value)
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), (0, 0))
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        result = []
+        for key, (count, total) in values:
+            labels = self._format_labels(key)
+            result.append((self.name + '_count', labels, count))
+            result.append((self.name + '_sum', labels, total))
+        return result
+
+
+class Registry(object):
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError('Duplicate metric: %s' % metric.name)
+            self._metrics[metric.name] = metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return ''.join(metric.render() + '\n' for metric in metrics)
+
+
+registry = Registry()
+
+handler_db_time = Summary('bridge_handler_db_seconds', 'Time spent in database queries while handling packets',
+                          ['handler', 'packet'])
+
+
+class QueryTimer(object):
+    """A Django execute_wrapper that adds up the time spent running queries."""
+
+    def __init__(self):
+        self.elapsed = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.elapsed += time.perf_counter() - start
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+
+        body = registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer(object):
+    """Serves every registered metric at /metrics, in the Prometheus text format."""
+
+    def __init__(self, addresses):
+        self.servers = [ThreadingHTTPServer(address, MetricsRequestHandler) for address in addresses]
+
+    def serve_forever(self):
+        threads = [threading.Thread(target=server.serve_forever, daemon=True) for server in self.servers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def shutdown(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
@@ -0,0 +1,91 @@
+from judge.bridge.scheduler import RunningAverage
+
+__all__ = ['QueueEstimator']
+
+
+class QueueEstimator(object):
+    """
+    Learns how long submissions take to grade, from their dispatch to the judge becoming free again, and uses that
+    to estimate how long queued submissions will wait.
+
+    Durations are averaged per (problem, language), falling back to the problem in any language, then to every
+    submission. The wait of a queued submission is the expected time to grade everything ahead of it that the same
+    judges could grade, plus the expected remainder of what they are grading, shared among those judges. It assumes
+    the queue is served in order, so it is only a guide under the schedulers that reorder it.
+
+    JudgeList calls the methods of an estimator with its lock held.
+    """
+
+    def __init__(self, clock, weight=0.2):
+        self.clock = clock
+        self.durations = RunningAverage(weight)
+        # submission id: (judge name, problem, language, dispatch time)
+        self.running = {}
+
+    def on_dispatch(self, judge, id, problem, language):
+        self.running[id] = (judge.name, problem, language, self.clock())
+
+    def on_finish(self, id, completed=True):
+        try:
+            _, problem, language, start = self.running.pop(id)
+        except KeyError:
+            return
+        if completed:
+            duration = self.clock() - start
+            for key in ((problem, language), problem, None):
+                self.durations.add(key, duration)
+
+    def expected_duration(self, problem, language):
+        for key in ((problem, language), problem, None):
+            duration = self.durations.get(key)
+            if duration is not None:
+                return duration
+        return None
+
+    def remaining(self, id):
+        try:
+            _, problem, language, start = self.running[id]
+        except KeyError:
+            return None
+        expected = self.expected_duration(problem, language)
+        return None if expected is None else max(0, expected - (self.clock() - start))
+
+    def estimate(self, item, queue, judges):
+        """
+        Returns (position, wait, grading) for a queued submission: the number of submissions ahead of it that the
+        same judges could grade, and the expected seconds until it is dispatched and then graded. Either time is
+        None without any history to go on, and the wait is also None if no connected judge can grade it.
+        """
+        grading = self.expected_duration(item.problem, item.language)
+        judges = [judge for judge in judges if judge.can_judge(item.problem, item.language, item.judge_id)]
+        names = {judge.name for judge in judges}
+
+        competes = {}
+        position = 0
+        work = 0
+        known = True
+        ahead = (other for priority in range(item.priority + 1) for other in queue.iter_priority(priority)
+                 if other.priority < item.priority or other.seq < item.seq)
+        for other in ahead:
+            # Submissions in the same bucket can be graded by the same judges, so only check each bucket once.
+            key = other.problem, other.language, other.judge_id
+            if key not in competes:
+                competes[key] = any(judge.can_judge(*key) for judge in judges)
+            if competes[key]:
+                position += 1
+                duration = self.expected_duration(other.problem, other.language)
+                if duration is None:
+                    known = False
+                else:
+                    work += duration
+
+        for id, (name, _, _, _) in self.running.items():
+            if name in names:
+                remaining = self.remaining(id)
+                if remaining is None:
+                    known = False
+                else:
+                    work += remaining
+
+        wait = work / len(judges) if judges and known else None
+        return position, wait, grading
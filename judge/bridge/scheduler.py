@@ -0,0 +1,254 @@
+import random
+import time
+from collections import OrderedDict
+
+from judge.bridge.metrics import Counter
+
+schedulers = {}
+
+affinity_dispatches = Counter('bridge_affinity_dispatches_total',
+                              'Submissions dispatched by the affinity scheduler, by whether the judge was warm',
+                              ['result'])
+
+
+def register_scheduler(name):
+    def register_class(scheduler_class):
+        assert name not in schedulers
+        schedulers[name] = scheduler_class
+        scheduler_class.name = name
+        return scheduler_class
+
+    return register_class
+
+
+def make_scheduler(name, options=None):
+    return schedulers[name](**(options or {}))
+
+
+class RunningAverage(object):
+    """Exponentially weighted moving average of observations, keyed by anything hashable."""
+
+    def __init__(self, weight=0.2):
+        self.weight = weight
+        self.values = {}
+
+    def add(self, key, value):
+        old = self.values.get(key)
+        self.values[key] = value if old is None else old + self.weight * (value - old)
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+
+class BaseScheduler(object):
+    """
+    Decides where JudgeList dispatches submissions.
+
+    select_judge picks one of the free judges able to grade a newly arrived submission, and select_submission picks
+    the queued submission a free judge grades next, among those queued at one priority. Priorities are always
+    served in order, and JudgeList still keeps a judge in reserve for non-rejudge work, regardless of scheduler.
+
+    JudgeList calls the methods of a scheduler with its lock held.
+    """
+    name = None
+
+    def __init__(self, clock=time.monotonic, seed=None):
+        self.clock = clock
+        self.random = random.Random(seed)
+        # submission id: (judge name, problem, language, user, contest, dispatch time)
+        self.running = {}
+
+    def select_judge(self, judges, problem, language, user=None, contest=None):
+        return min(judges, key=lambda judge: (judge.load, self.random.random()))
+
+    def select_submission(self, judge, queue, priority):
+        return queue.find(judge, priority)
+
+    def on_dispatch(self, judge, id, problem, language, user=None, contest=None):
+        self.running[id] = (judge.name, problem, language, user, contest, self.clock())
+
+    def on_finish(self, judge, id, completed=True):
+        try:
+            name, problem, language, user, contest, start = self.running.pop(id)
+        except KeyError:
+            return
+        if completed:
+            self.on_graded(name, problem, language, user, contest, self.clock() - start)
+
+    def on_graded(self, judge_name, problem, language, user, contest, duration):
+        pass
+
+
+@register_scheduler('least-load')
+class LeastLoadScheduler(BaseScheduler):
+    """Dispatches to the judge reporting the least load, and serves the queue in order. This is the default."""
+
+
+@register_scheduler('throughput')
+class ThroughputScheduler(BaseScheduler):
+    """
+    Chooses among free judges at random, weighted by how many submissions in the language each judge grades per
+    second, as measured by the bridge. This spreads work over a fleet of judges with different hardware in
+    proportion to their speed. Judges not yet measured in a language are weighted like the fastest judge.
+    """
+
+    def __init__(self, weight=0.2, **kwargs):
+        super().__init__(**kwargs)
+        self.durations = RunningAverage(weight)
+
+    def on_graded(self, judge_name, problem, language, user, contest, duration):
+        self.durations.add((judge_name, language), max(duration, 1e-3))
+
+    def select_judge(self, judges, problem, language, user=None, contest=None):
+        durations = [self.durations.get((judge.name, language)) for judge in judges]
+        best = max((1 / duration for duration in durations if duration is not None), default=1)
+        weights = [best if duration is None else 1 / duration for duration in durations]
+        return self.random.choices(judges, weights)[0]
+
+
+@register_scheduler('shortest-job-first')
+class ShortestJobFirstScheduler(BaseScheduler):
+    """
+    Within a priority, grades the submission to the problem that historically took the least time to grade first,
+    which minimizes the average wait. To bound starvation, submissions that have been waiting for longer than
+    max_wait seconds are served first, in order. Problems without history are assumed to be quick.
+    """
+
+    def __init__(self, max_wait=60, weight=0.2, **kwargs):
+        super().__init__(**kwargs)
+        self.max_wait = max_wait
+        self.durations = RunningAverage(weight)
+
+    def on_graded(self, judge_name, problem, language, user, contest, duration):
+        self.durations.add(problem, duration)
+
+    def expected_duration(self, problem):
+        return self.durations.get(problem, 0)
+
+    def select_submission(self, judge, queue, priority):
+        starved_before = self.clock() - self.max_wait
+        best = None
+        best_key = None
+        for item in queue.eligible(judge, priority):
+            if item.queued < starved_before:
+                key = (0, item.seq)
+            else:
+                key = (1, self.expected_duration(item.problem), item.seq)
+            if best_key is None or key < best_key:
+                best, best_key = item, key
+        return best
+
+
+@register_scheduler('fair-share')
+class FairShareScheduler(BaseScheduler):
+    """
+    Within a priority, grades the submission of the user (or contest, with share_by='contest') that has recently
+    used the least judge time, so that one user submitting or rejudging many times does not hold up everyone else.
+    Usage decays with a half-life of half_life seconds. Only the first depth submissions of each (problem, language)
+    are considered, to keep the cost of a dispatch bounded.
+    """
+
+    def __init__(self, share_by='user', half_life=300, depth=16, **kwargs):
+        super().__init__(**kwargs)
+        if share_by not in ('user', 'contest'):
+            raise ValueError('share_by must be either user or contest: %r' % share_by)
+        self.share_by = share_by
+        self.half_life = half_life
+        self.depth = depth
+        # share key: (usage, time of last update)
+        self.usage = {}
+
+    def _share_key(self, user, contest):
+        return user if self.share_by == 'user' else contest
+
+    def get_usage(self, key, now=None):
+        try:
+            usage, updated = self.usage[key]
+        except KeyError:
+            return 0
+        now = self.clock() if now is None else now
+        return usage * 0.5 ** ((now - updated) / self.half_life)
+
+    def _add_usage(self, key, amount):
+        now = self.clock()
+        self.usage[key] = (self.get_usage(key, now) + amount, now)
+
+        if len(self.usage) > 10000:
+            for key in [key for key in self.usage if self.get_usage(key, now) < 1e-3]:
+                del self.usage[key]
+
+    def on_graded(self, judge_name, problem, language, user, contest, duration):
+        self._add_usage(self._share_key(user, contest), duration)
+
+    def select_submission(self, judge, queue, priority):
+        now = self.clock()
+        running = {}
+        for _, _, _, user, contest, start in self.running.values():
+            key = self._share_key(user, contest)
+            running[key] = running.get(key, 0) + now - start
+
+        best = None
+        best_key = None
+        for item in queue.eligible(judge, priority, depth=self.depth):
+            share = self._share_key(item.user, item.contest)
+            key = (self.get_usage(share, now) + running.get(share, 0), item.seq)
+            if best_key is None or key < best_key:
+                best, best_key = item, key
+        return best
+
+
+@register_scheduler('affinity')
+class AffinityScheduler(BaseScheduler):
+    """
+    Prefers judges that recently graded the same problem in the same language, since they have the test data and
+    compiled checker cached. Each judge remembers the last `recent` (problem, language) pairs it graded.
+
+    A new submission goes to the least loaded warm judge if any is free. A judge becoming free takes the oldest
+    queued submission it is warm for over the front of the queue, unless the front has already waited max_wait
+    seconds, which bounds the extra wait any submission incurs.
+    """
+
+    def __init__(self, recent=8, max_wait=5, **kwargs):
+        super().__init__(**kwargs)
+        self.recent = recent
+        self.max_wait = max_wait
+        # judge name: OrderedDict of (problem, language), least recently graded first
+        self.warm = {}
+        self.hits = 0
+        self.misses = 0
+
+    def is_warm(self, judge, problem, language):
+        return (problem, language) in self.warm.get(judge.name, ())
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0
+
+    def select_judge(self, judges, problem, language, user=None, contest=None):
+        warm = [judge for judge in judges if self.is_warm(judge, problem, language)]
+        return super().select_judge(warm or judges, problem, language, user, contest)
+
+    def select_submission(self, judge, queue, priority):
+        first = queue.find(judge, priority)
+        if first is None or self.is_warm(judge, first.problem, first.language) or \
+                first.queued <= self.clock() - self.max_wait:
+            return first
+
+        warm = [item for item in queue.eligible(judge, priority) if self.is_warm(judge, item.problem, item.language)]
+        return min(warm, key=lambda item: item.seq, default=first)
+
+    def on_dispatch(self, judge, id, problem, language, user=None, contest=None):
+        super().on_dispatch(judge, id, problem, language, user, contest)
+
+        recent = self.warm.setdefault(judge.name, OrderedDict())
+        if (problem, language) in recent:
+            recent.move_to_end((problem, language))
+            self.hits += 1
+            affinity_dispatches.inc(result='hit')
+        else:
+            recent[problem, language] = True
+            if len(recent) > self.recent:
+                recent.popitem(last=False)
+            self.misses += 1
+            affinity_dispatches.inc(result='miss')
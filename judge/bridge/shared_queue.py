@@ -0,0 +1,230 @@
+import logging
+from collections import namedtuple
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Q
+
+from judge.bridge.judge_list import JudgeList, RestrictedJudge, dispatch_latency
+from judge.judge_priority import REJUDGE_PRIORITY
+from judge.models import BridgeQueueEntry, SubmissionSource
+
+logger = logging.getLogger('judge.bridge')
+
+__all__ = ['SharedQueue', 'SharedJudgeList']
+
+SharedSubmission = namedtuple('SharedSubmission', 'id priority problem language source judge_id user contest')
+
+
+class SharedQueue(object):
+    """
+    The queue of submissions waiting for a judge, kept in the database so that several bridge instances can serve it.
+
+    Every submission an instance is asked to judge gets a row until it is finished. A row is claimed by setting its
+    bridge to the name of the instance that dispatched it, with an update that only succeeds if the row is still
+    unclaimed, so that two instances never dispatch the same submission. Unclaimed rows are served in order of
+    priority, then of arrival.
+    """
+
+    def __init__(self, name, window=50, max_scan=500):
+        self.name = name
+        # Unclaimed rows are read this many at a time when looking for one a judge can grade.
+        self.window = window
+        # At most this many unclaimed rows are read by each claim, so that a judge that can grade none of them does
+        # not read the whole queue every time it is free. Rows further back wait for those ahead of them.
+        self.max_scan = max_scan
+
+    def push(self, id, problem, language, judge_id, priority, user=None, contest=None, claimed=False):
+        """Adds a submission, claimed by this instance if `claimed`. Returns False if it is already queued."""
+        try:
+            with transaction.atomic():
+                BridgeQueueEntry.objects.create(submission_id=id, priority=priority, problem=problem,
+                                                language=language, judge=judge_id, user=user, contest=contest,
+                                                bridge=self.name if claimed else None)
+        except IntegrityError:
+            return False
+        return True
+
+    def claim(self, judge, max_priority):
+        """
+        Claims the first unclaimed submission of at most `max_priority` that `judge` can grade, among the first
+        `max_scan` of them, and returns it, or None if there is no such submission.
+        """
+        unclaimed = BridgeQueueEntry.objects.filter(bridge__isnull=True, priority__lte=max_priority) \
+            .order_by('priority', 'id')
+        after = Q()
+        scanned = 0
+        while scanned < self.max_scan:
+            rows = unclaimed.filter(after).values_list('id', 'submission_id', 'priority', 'problem', 'language',
+                                                       'judge', 'user', 'contest')
+            rows = list(rows[:min(self.window, self.max_scan - scanned)])
+            scanned += len(rows)
+            for row_id, id, priority, problem, language, judge_id, user, contest in rows:
+                if not judge.can_judge(problem, language, judge_id):
+                    continue
+                if not BridgeQueueEntry.objects.filter(id=row_id, bridge__isnull=True).update(bridge=self.name):
+                    # Another instance claimed it first.
+                    continue
+                try:
+                    source = SubmissionSource.objects.values_list('source', flat=True).get(submission_id=id)
+                except SubmissionSource.DoesNotExist:
+                    self.finish(id)
+                    continue
+                return SharedSubmission(id, priority, problem, language, source, judge_id, user, contest)
+
+            if len(rows) < self.window:
+                return None
+            row_id, priority = rows[-1][0], rows[-1][2]
+            after = Q(priority__gt=priority) | Q(priority=priority, id__gt=row_id)
+        return None
+
+    def release(self, id):
+        """Makes a submission this instance claimed available to every instance again."""
+        BridgeQueueEntry.objects.filter(submission_id=id, bridge=self.name).update(bridge=None)
+
+    def release_all(self):
+        """Releases every submission claimed by this instance, e.g. by its previous run. Returns their ids."""
+        claimed = BridgeQueueEntry.objects.filter(bridge=self.name)
+        ids = list(claimed.values_list('submission_id', flat=True))
+        claimed.update(bridge=None)
+        return ids
+
+    def finish(self, id):
+        BridgeQueueEntry.objects.filter(submission_id=id).delete()
+
+    def remove(self, id):
+        """Removes a submission if no instance has claimed it yet. Returns whether it was removed."""
+        return bool(BridgeQueueEntry.objects.filter(submission_id=id, bridge__isnull=True).delete()[0])
+
+    def get(self, id):
+        """Returns (row id, priority, problem, language, claiming instance) for a queued submission, or None."""
+        return BridgeQueueEntry.objects.filter(submission_id=id) \
+            .values_list('id', 'priority', 'problem', 'language', 'bridge').first()
+
+    def position(self, row_id, priority):
+        """
+        Returns the number of unclaimed submissions ahead of a queued submission, given its row. Rows are ordered as
+        they are claimed, so a rejudged submission is behind those queued before it was rejudged.
+        """
+        return BridgeQueueEntry.objects.filter(bridge__isnull=True) \
+            .filter(Q(priority__lt=priority) | Q(priority=priority, id__lt=row_id)).count()
+
+    def has_waiting(self):
+        return BridgeQueueEntry.objects.filter(bridge__isnull=True).exists()
+
+    def depths(self):
+        """Returns the number of unclaimed submissions of each priority that has any."""
+        return dict(BridgeQueueEntry.objects.filter(bridge__isnull=True).values_list('priority')
+                    .annotate(count=Count('id')).order_by())
+
+
+class SharedJudgeList(JudgeList):
+    """
+    A JudgeList for a bridge instance that shares its queue with other instances through a SharedQueue.
+
+    A submission is dispatched by the instance it arrives at if one of its judges is free. Otherwise, it waits in the
+    shared queue for a judge of any instance to become free, or for an instance to poll the queue on behalf of its
+    free judges, since instances are not told when another queues a submission. Submissions are claimed in order of
+    priority and arrival; the scheduler only chooses among free judges.
+    """
+
+    def __init__(self, shared, scheduler=None):
+        super().__init__(scheduler)
+        self.shared = shared
+
+    def _handle_free_judge(self, judge, problems=None):
+        with self.lock:
+            max_priority = self.priorities - 1
+            if self.count_not_disabled() > 1 and \
+                    sum(not judge.working and not judge.is_disabled for judge in self.judges) <= 1:
+                # Keep one judge free for higher priority submissions.
+                max_priority = REJUDGE_PRIORITY - 1
+
+            item = self.shared.claim(judge if problems is None else RestrictedJudge(judge, problems), max_priority)
+            if item is None:
+                return
+
+            self.submission_map[item.id] = judge
+            try:
+                judge.submit(item.id, item.problem, item.language, item.source)
+            except Exception:
+                logger.exception('Failed to dispatch %d (%s, %s) to %s', item.id, item.problem, item.language,
+                                 judge.name)
+                del self.submission_map[item.id]
+                self.shared.release(item.id)
+                self.judges.remove(judge)
+                return
+            logger.info('Dispatched shared queued submission %d: %s', item.id, judge.name)
+            self._on_dispatch(judge, item.id, item.problem, item.language, item.user, item.contest)
+
+    def _on_finish(self, judge, id, completed=True):
+        super()._on_finish(judge, id, completed=completed)
+        self.shared.finish(id)
+
+    def add_problems(self, judge, problems):
+        with self.lock:
+            if problems and not judge.working:
+                self._handle_free_judge(judge, set(problems))
+
+    def poll(self):
+        """Dispatches waiting submissions to free judges, e.g. those queued by other instances."""
+        with self.lock:
+            if not self.shared.has_waiting():
+                return
+            for judge in list(self.judges):
+                if not judge.working and not judge.is_disabled:
+                    self._handle_free_judge(judge)
+
+    def abort(self, submission):
+        logger.info('Abort request: %d', submission)
+        with self.lock:
+            try:
+                self.submission_map[submission].abort()
+                return True
+            except KeyError:
+                # A submission claimed by another instance is aborted by that instance.
+                self.shared.remove(submission)
+                return False
+
+    def estimate(self, id):
+        with self.lock:
+            if id in self.submission_map:
+                return super().estimate(id)
+            queued = self.shared.get(id)
+            if queued is None:
+                return None
+            row_id, priority, problem, language, bridge = queued
+            # Only the instance grading a submission knows how long it has been grading, and the wait depends on
+            # the judges of every instance.
+            grading = self.estimator.expected_duration(problem, language)
+            if bridge is not None:
+                return {'state': 'grading', 'position': 0, 'wait': 0, 'grading': grading}
+            return {'state': 'queued', 'position': self.shared.position(row_id, priority), 'wait': None,
+                    'grading': grading}
+
+    def judge(self, id, problem, language, source, judge_id, priority, user=None, contest=None):
+        start = self.scheduler.clock()
+        with self.lock:
+            if id in self.submission_map:
+                return
+
+            available = self._available_judges(problem, language, judge_id, priority)
+            if not self.shared.push(id, problem, language, judge_id, priority, user, contest, claimed=bool(available)):
+                # Already queued or being graded, maybe by another instance.
+                return
+            if not available:
+                logger.info('Queued submission: %d', id)
+                return
+
+            judge = self.scheduler.select_judge(available, problem, language, user, contest)
+            logger.info('Dispatched submission %d to: %s', id, judge.name)
+            self.submission_map[id] = judge
+            try:
+                judge.submit(id, problem, language, source)
+            except Exception:
+                logger.exception('Failed to dispatch %d (%s, %s) to %s', id, problem, language, judge.name)
+                del self.submission_map[id]
+                self.shared.release(id)
+                self.judges.discard(judge)
+                return
+            self._on_dispatch(judge, id, problem, language, user, contest)
+            dispatch_latency.observe(self.scheduler.clock() - start, priority=priority)
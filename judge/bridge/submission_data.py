@@ -0,0 +1,63 @@
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.core.cache import cache
+
+from judge.models import LanguageLimit, Problem, Submission
+
+# Set of submission statuses that do not count as an attempt.
+NON_ATTEMPT_STATUS = ('CE', 'IE')
+
+
+def problem_limits_key(problem_id):
+    return 'problem_judge_limits:%d' % problem_id
+
+
+def get_problem_limits(problem_id, language_id):
+    """
+    Returns (time limit, memory limit, short circuit) for submissions in a language to a problem.
+
+    The limits of every language of a problem are cached together under one key, so that editing the problem or
+    any of its language limits only needs to invalidate that key.
+    """
+    key = problem_limits_key(problem_id)
+    limits = cache.get(key)
+    if limits is None:
+        time, memory, short_circuit = (Problem.objects.filter(id=problem_id)
+                                       .values_list('time_limit', 'memory_limit', 'short_circuit').get())
+        limits = {
+            'time': time,
+            'memory': memory,
+            'short_circuit': short_circuit,
+            'languages': {language: (time, memory) for language, time, memory in LanguageLimit.objects
+                          .filter(problem_id=problem_id).values_list('language_id', 'time_limit', 'memory_limit')},
+        }
+        cache.set(key, limits)
+
+    time, memory = limits['languages'].get(language_id, (limits['time'], limits['memory']))
+    return time, memory, limits['short_circuit']
+
+
+def get_attempt_numbers(submission_ids):
+    """
+    Returns a dictionary mapping each submission to its attempt number: one more than the number of earlier
+    submissions to the same problem by the same user in the same participation, excluding compile and internal
+    errors. The whole batch is computed with two queries instead of one count per submission.
+    """
+    submissions = list(Submission.objects.filter(id__in=submission_ids)
+                       .values_list('id', 'problem_id', 'user_id', 'contest__participation_id', 'date'))
+    if not submissions:
+        return {}
+
+    problems = {problem for _, problem, _, _, _ in submissions}
+    users = {user for _, _, user, _, _ in submissions}
+    dates = defaultdict(list)
+    for key in (Submission.objects.filter(problem_id__in=problems, user_id__in=users)
+                .exclude(status__in=NON_ATTEMPT_STATUS)
+                .values_list('problem_id', 'user_id', 'contest__participation_id', 'date')):
+        dates[key[:3]].append(key[3])
+    for value in dates.values():
+        value.sort()
+
+    return {id: bisect_left(dates[problem, user, participation], date) + 1
+            for id, problem, user, participation, date in submissions}
@@ -0,0 +1,154 @@
+import time
+from bisect import bisect_left, insort
+from collections import Counter, namedtuple
+from itertools import count, islice
+
+try:
+    from llist import dllist
+except ImportError:
+    from pyllist import dllist
+
+QueuedSubmission = namedtuple('QueuedSubmission',
+                              'seq priority id problem language source judge_id queued user contest')
+
+
+class SubmissionQueue(object):
+    """
+    Pending submissions, indexed by priority and then by what is needed to judge them.
+
+    Submissions that may run on any judge are bucketed by (problem, language): every submission in a bucket is
+    eligible for exactly the same judges, so a free judge only needs to look at the head of each bucket, instead
+    of walking every queued submission. The buckets of each priority are kept sorted by the age of their head, so
+    the search stops at the first bucket the judge can grade. Submissions pinned to a specific judge are bucketed
+    by that judge's name. Within a priority, submissions are dispatched in the order they were queued.
+    """
+
+    def __init__(self, priorities, clock=time.monotonic):
+        self.priorities = priorities
+        self.clock = clock
+        self._general = [{} for _ in range(priorities)]
+        # For each priority, a sorted list of (sequence number of bucket head, (problem, language)).
+        self._heads = [[] for _ in range(priorities)]
+        self._targeted = [{} for _ in range(priorities)]
+        self._counter = count()
+        self._sizes = [0] * priorities
+        self._problem_sizes = Counter()
+        self.node_map = {}
+
+    def __len__(self):
+        return len(self.node_map)
+
+    def __contains__(self, id):
+        return id in self.node_map
+
+    def __iter__(self):
+        for priority in range(self.priorities):
+            yield from sorted(self.iter_priority(priority))
+
+    def iter_priority(self, priority):
+        for buckets in (self._general[priority], self._targeted[priority]):
+            for bucket in buckets.values():
+                yield from bucket
+
+    def count(self, priority):
+        # This is safe to call without holding the JudgeList lock.
+        return self._sizes[priority]
+
+    def has_priority(self, priority):
+        return bool(self._general[priority] or self._targeted[priority])
+
+    def has_problem(self, problem):
+        return self._problem_sizes[problem] > 0
+
+    def ids_for_problem(self, problem, min_priority=0, limit=None):
+        """Returns the ids of up to `limit` submissions to `problem` queued at `min_priority` or lower priorities."""
+        ids = []
+        for priority in range(min_priority, self.priorities):
+            for (bucket_problem, _), bucket in self._general[priority].items():
+                if bucket_problem == problem:
+                    ids.extend(item.id for item in bucket)
+            for bucket in self._targeted[priority].values():
+                ids.extend(item.id for item in bucket if item.problem == problem)
+        return ids[:limit]
+
+    def _buckets_for(self, item):
+        if item.judge_id:
+            return self._targeted[item.priority], item.judge_id
+        return self._general[item.priority], (item.problem, item.language)
+
+    def push(self, priority, id, problem, language, source, judge_id, user=None, contest=None):
+        item = QueuedSubmission(next(self._counter), priority, id, problem, language, source, judge_id,
+                                self.clock(), user, contest)
+        buckets, key = self._buckets_for(item)
+        try:
+            bucket = buckets[key]
+        except KeyError:
+            bucket = buckets[key] = dllist()
+            if not judge_id:
+                # This is the newest submission, so it always sorts last.
+                self._heads[priority].append((item.seq, key))
+        self.node_map[id] = bucket.appendright(item)
+        self._sizes[priority] += 1
+        self._problem_sizes[problem] += 1
+        return item
+
+    def remove(self, id):
+        try:
+            node = self.node_map.pop(id)
+        except KeyError:
+            return None
+
+        item = node.value
+        self._sizes[item.priority] -= 1
+        self._problem_sizes[item.problem] -= 1
+        if not self._problem_sizes[item.problem]:
+            del self._problem_sizes[item.problem]
+        buckets, key = self._buckets_for(item)
+        bucket = buckets[key]
+        is_head = bucket.first is node
+        bucket.remove(node)
+
+        if not item.judge_id and is_head:
+            heads = self._heads[item.priority]
+            del heads[bisect_left(heads, (item.seq, key))]
+            if bucket.size:
+                insort(heads, (bucket.first.value.seq, key))
+        if not bucket.size:
+            del buckets[key]
+        return item
+
+    def eligible(self, judge, priority, depth=1):
+        """
+        Yields submissions queued at `priority` that `judge` can grade: up to `depth` submissions from the front of
+        each (problem, language) bucket, and every submission pinned to the judge that it can grade.
+        """
+        targeted = self._targeted[priority].get(judge.name)
+        if targeted is not None:
+            for item in targeted:
+                if judge.can_judge(item.problem, item.language, item.judge_id):
+                    yield item
+
+        if not judge.is_disabled:
+            for _, (problem, language) in self._heads[priority]:
+                if judge.can_judge(problem, language):
+                    yield from islice(self._general[priority][problem, language], depth)
+
+    def find(self, judge, priority):
+        """Returns the earliest submission queued at `priority` that `judge` can grade, without removing it."""
+        best = None
+
+        targeted = self._targeted[priority].get(judge.name)
+        if targeted is not None:
+            for item in targeted:
+                if judge.can_judge(item.problem, item.language, item.judge_id):
+                    best = item
+                    break
+
+        if not judge.is_disabled:
+            for seq, (problem, language) in self._heads[priority]:
+                if best is not None and seq > best.seq:
+                    break
+                if judge.can_judge(problem, language):
+                    return self._general[priority][problem, language].first.value
+
+        return best
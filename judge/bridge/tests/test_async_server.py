@@ -0,0 +1,177 @@
+import socket
+import threading
+import unittest
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from judge.bridge import async_server
+from judge.bridge.async_server import AsyncServer
+from judge.bridge.base_handler import Disconnect, ZlibPacketHandler, size_pack
+from judge.bridge.judge_handler import JudgeHandler
+from judge.bridge.write_buffer import TestCaseWriteBuffer
+
+
+class EchoHandler(ZlibPacketHandler):
+    def __init__(self, request, client_address, server, events):
+        super().__init__(request, client_address, server)
+        self.events = events
+
+    def on_connect(self):
+        self.events.append('connect')
+
+    def on_packet(self, data):
+        if data == 'bye':
+            raise Disconnect()
+        self.send(data.upper())
+
+    def on_disconnect(self):
+        self.events.append('disconnect')
+
+
+class TimerHandler(ZlibPacketHandler):
+    """Pings, and waits for acknowledgements, with the tasks that replace the timer threads of JudgeHandler."""
+    ping_interval = 0.05
+    no_response_timeout = 0.1
+
+    _ping_if_due = JudgeHandler._ping_if_due
+    _ping_wait = JudgeHandler._ping_wait
+
+    def __init__(self, request, client_address, server, events):
+        super().__init__(request, client_address, server)
+        self.events = events
+        self._stop_ping = threading.Event()
+        self._test_case_buffer = TestCaseWriteBuffer(None, 100, 60)
+        self._no_response_job = None
+
+    def ping(self):
+        self.send('ping')
+
+    def on_packet(self, data):
+        if data == 'start-ping':
+            self._start_ping()
+        elif data == 'stop-ping':
+            self._stop_ping.set()
+            self.send('stopped')
+        elif data == 'submit':
+            self._no_response_job = self._make_no_response_job()
+        elif data == 'acknowledge':
+            self._no_response_job.cancel()
+            self.send('acknowledged')
+        else:
+            self.send(data)
+
+    def _kill_if_no_response(self):
+        self.events.append('killed')
+        self.close()
+
+    def on_disconnect(self):
+        self.events.append('disconnect')
+
+
+def send_packet(sock, data):
+    data = zlib.compress(data.encode('utf-8'))
+    sock.sendall(size_pack.pack(len(data)) + data)
+
+
+def recv_exactly(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise EOFError()
+        data += chunk
+    return data
+
+
+def recv_packet(sock):
+    size = size_pack.unpack(recv_exactly(sock, size_pack.size))[0]
+    return zlib.decompress(recv_exactly(sock, size)).decode('utf-8')
+
+
+class AsyncServerMixin(object):
+    handler = EchoHandler
+
+    def setUp(self):
+        self.events = []
+        self.executor = ThreadPoolExecutor(max_workers=2)
+        self.server = AsyncServer([('127.0.0.1', 0)], self.handler, self.executor, events=self.events)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.executor.shutdown()
+
+    def connect(self):
+        return socket.create_connection(self.server.bound_addresses()[0][:2], timeout=5)
+
+
+class AsyncServerTestCase(AsyncServerMixin, unittest.TestCase):
+    def test_echo(self):
+        address = self.server.bound_addresses()[0]
+        with socket.create_connection(address[:2]) as sock:
+            for message in ('hello', 'world'):
+                send_packet(sock, message)
+                self.assertEqual(recv_packet(sock), message.upper())
+            send_packet(sock, 'bye')
+            self.assertEqual(sock.recv(1), b'')
+        self.assertEqual(self.events, ['connect', 'disconnect'])
+
+    def test_database_connections_checked(self):
+        address = self.server.bound_addresses()[0]
+        with mock.patch.object(async_server.db, 'close_old_connections', lambda: self.events.append('db')):
+            with socket.create_connection(address[:2]) as sock:
+                send_packet(sock, 'bye')
+                self.assertEqual(sock.recv(1), b'')
+        # Around every call in the executor, whose threads are shared by every connection.
+        self.assertEqual(self.events, ['db', 'connect', 'db', 'db', 'db', 'db', 'db', 'db', 'disconnect', 'db'])
+
+
+class AsyncTimerTestCase(AsyncServerMixin, unittest.TestCase):
+    handler = TimerHandler
+
+    def wait_disconnected(self):
+        # Otherwise the server would be shut down while it is still handling the connection.
+        for _ in range(100):
+            if 'disconnect' in self.events:
+                return
+            threading.Event().wait(0.05)
+        self.fail('The connection was not closed')
+
+    def test_ping(self):
+        with self.connect() as sock:
+            send_packet(sock, 'start-ping')
+            for _ in range(3):
+                self.assertEqual(recv_packet(sock), 'ping')
+            send_packet(sock, 'stop-ping')
+            while recv_packet(sock) != 'stopped':
+                pass
+            # Once the task is stopped, at most a ping it was already sending arrives.
+            threading.Event().wait(TimerHandler.ping_interval * 3)
+            send_packet(sock, 'still there')
+            pings = 0
+            while recv_packet(sock) != 'still there':
+                pings += 1
+            self.assertLessEqual(pings, 1)
+        self.wait_disconnected()
+
+    def test_no_response(self):
+        with self.connect() as sock:
+            send_packet(sock, 'submit')
+            self.assertEqual(sock.recv(1), b'')
+        self.wait_disconnected()
+        self.assertEqual(self.events, ['killed', 'disconnect'])
+
+    def test_acknowledged(self):
+        with self.connect() as sock:
+            send_packet(sock, 'submit')
+            send_packet(sock, 'acknowledge')
+            self.assertEqual(recv_packet(sock), 'acknowledged')
+            # Well after the acknowledgement was due, the connection is still open.
+            threading.Event().wait(TimerHandler.no_response_timeout * 3)
+            send_packet(sock, 'still there')
+            self.assertEqual(recv_packet(sock), 'still there')
+        self.wait_disconnected()
+        self.assertEqual(self.events, ['disconnect'])
@@ -0,0 +1,146 @@
+import os
+import socket
+import threading
+import unittest
+import zlib
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import override_settings
+
+from judge.bridge.base_handler import Disconnect, FRAME_MSGPACK, FRAME_RAW, RECEIVE_BUFFER_SIZE, ZlibPacketHandler, \
+    json_loads, size_pack, split_header
+from judge.bridge.judge_handler import JudgeHandler
+
+
+class RecordingHandler(ZlibPacketHandler):
+    def on_packet(self, data):
+        self.packets.append(data)
+
+
+class RawRecordingHandler(RecordingHandler):
+    raw_packets = True
+
+
+def make_handler(handler_class, sock):
+    # Bypass RequestHandlerMeta, which would run the handle() loop immediately.
+    handler = handler_class.__new__(handler_class)
+    handler.__init__(sock, ('127.0.0.1', 0), SimpleNamespace(server_address=('127.0.0.1', 0)))
+    handler.packets = []
+    return handler
+
+
+def frame(data, flags=0):
+    payload = data if flags & FRAME_RAW else zlib.compress(data)
+    return size_pack.pack(len(payload) | flags) + payload
+
+
+def read_frame(sock):
+    size, flags = split_header(size_pack.unpack(sock.recv(size_pack.size, socket.MSG_WAITALL))[0])
+    payload = sock.recv(size, socket.MSG_WAITALL)
+    return payload if flags & FRAME_RAW else zlib.decompress(payload), flags
+
+
+class ZlibPacketHandlerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.reader, self.writer = socket.socketpair()
+        self.addCleanup(self.reader.close)
+        self.addCleanup(self.writer.close)
+
+    def send(self, data):
+        sender = threading.Thread(target=self.writer.sendall, args=(data,))
+        sender.start()
+        self.addCleanup(sender.join)
+
+    def test_packets(self):
+        # Incompressible, so that the packet spans many receive buffers.
+        large = os.urandom(RECEIVE_BUFFER_SIZE * 3).hex().encode('ascii')
+        self.send(frame(b'small') + frame(large) + frame('中文'.encode('utf-8')))
+
+        handler = make_handler(RecordingHandler, self.reader)
+        for _ in range(3):
+            handler.read_sized_packet(handler.read_size())
+        self.assertEqual(handler.packets, ['small', large.decode('ascii'), '中文'])
+
+    def test_raw_packets(self):
+        self.send(frame(b'{"name": "ping"}'))
+        handler = make_handler(RawRecordingHandler, self.reader)
+        handler.read_sized_packet(handler.read_size())
+        self.assertEqual(json_loads(handler.packets[0]), {'name': 'ping'})
+
+    def test_raw_frames(self):
+        large = os.urandom(RECEIVE_BUFFER_SIZE * 2).hex().encode('ascii')
+        self.send(frame(b'raw', FRAME_RAW) + frame(b'compressed') + frame(large, FRAME_RAW))
+
+        handler = make_handler(RecordingHandler, self.reader)
+        for _ in range(3):
+            handler.read_sized_packet(handler.read_size())
+        self.assertEqual(handler.packets, ['raw', 'compressed', large.decode('ascii')])
+
+    def test_unnegotiated_msgpack(self):
+        self.send(frame(b'\x81\xa4name\xa4ping', FRAME_MSGPACK))
+        handler = make_handler(RecordingHandler, self.reader)
+        with self.assertRaises(Disconnect):
+            handler.read_sized_packet(handler.read_size())
+
+    def test_send_frame(self):
+        handler = make_handler(RecordingHandler, self.writer)
+        handler.send('compressed by default')
+        self.assertEqual(read_frame(self.reader), (b'compressed by default', 0))
+
+        handler.compression_threshold = 16
+        handler.send('short')
+        handler.send('longer than the threshold')
+        self.assertEqual(read_frame(self.reader), (b'short', FRAME_RAW))
+        self.assertEqual(read_frame(self.reader), (b'longer than the threshold', 0))
+
+    def test_truncated_packet(self):
+        data = frame(os.urandom(RECEIVE_BUFFER_SIZE * 2))
+        self.writer.sendall(data[:-10])
+        self.writer.shutdown(socket.SHUT_WR)
+
+        handler = make_handler(RecordingHandler, self.reader)
+        with self.assertRaises(Disconnect):
+            handler.read_sized_packet(handler.read_size())
+
+
+class JsonLoadsTestCase(unittest.TestCase):
+    def test_json_loads(self):
+        self.assertEqual(json_loads(bytearray(b'{"a": [1, 2.5, null]}')), {'a': [1, 2.5, None]})
+        self.assertNotEqual(json_loads(b'NaN'), json_loads(b'NaN'))
+        with self.assertRaises(ValueError):
+            json_loads(b'{"a": ')
+        with self.assertRaises(ValueError):
+            json_loads(b'\xff')
+
+
+class ProtocolNegotiationTestCase(unittest.TestCase):
+    def negotiate(self, features):
+        return JudgeHandler._negotiate_protocol(None, features)
+
+    @override_settings(BRIDGED_COMPRESSION_THRESHOLD=256, BRIDGED_COMPRESSION_LEVEL=1, BRIDGED_USE_MSGPACK=True)
+    def test_negotiate(self):
+        self.assertEqual(self.negotiate([]), {})
+        self.assertEqual(self.negotiate(['raw-frames', 'unknown']),
+                         {'compression-threshold': 256, 'compression-level': 1})
+        with mock.patch('judge.bridge.judge_handler.msgpack', None):
+            self.assertNotIn('encoding', self.negotiate(['msgpack']))
+        with mock.patch('judge.bridge.judge_handler.msgpack', object()):
+            self.assertEqual(self.negotiate(['msgpack']), {'encoding': 'msgpack'})
+
+    def test_unnegotiated_msgpack(self):
+        handler = JudgeHandler.__new__(JudgeHandler)
+        handler._msgpack = False
+        handler.client_address = None
+        with mock.patch.object(JudgeHandler, '_on_encoded_packet') as on_encoded_packet:
+            with self.assertRaises(Disconnect):
+                handler.on_msgpack_packet(b'\x81\xa4name\xa4ping')
+            # The packet is rejected even if the base handler stops disconnecting.
+            with mock.patch.object(ZlibPacketHandler, 'on_msgpack_packet'):
+                handler.on_msgpack_packet(b'\x81\xa4name\xa4ping')
+        on_encoded_packet.assert_not_called()
+
+    @override_settings(BRIDGED_COMPRESSION_THRESHOLD=0, BRIDGED_USE_MSGPACK=False)
+    def test_disabled(self):
+        with mock.patch('judge.bridge.judge_handler.msgpack', object()):
+            self.assertEqual(self.negotiate(['raw-frames', 'msgpack']), {})
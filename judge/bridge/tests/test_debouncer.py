@@ -0,0 +1,78 @@
+import unittest
+from functools import partial
+
+from judge.bridge.debouncer import Debouncer
+from judge.bridge.tests.util import FakeClock
+
+
+class DebouncerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.delivered = []
+
+    def make_debouncer(self, interval=0.5, rate=100):
+        return Debouncer(interval, rate, clock=self.clock, background=False)
+
+    def submit(self, debouncer, key, value):
+        debouncer.submit(key, partial(self.delivered.append, (key, value)))
+
+    def advance(self, debouncer, seconds):
+        self.clock.now += seconds
+        debouncer.run_due()
+
+    def test_trailing_edge(self):
+        debouncer = self.make_debouncer()
+        for position in range(1, 6):
+            self.submit(debouncer, 1, position)
+            self.advance(debouncer, 0.05)
+        self.assertEqual(self.delivered, [(1, 1)])
+
+        self.advance(debouncer, 0.5)
+        self.assertEqual(self.delivered, [(1, 1), (1, 5)])
+
+    def test_keys_are_independent(self):
+        debouncer = self.make_debouncer()
+        self.submit(debouncer, 1, 1)
+        self.submit(debouncer, 2, 1)
+        self.assertEqual(self.delivered, [(1, 1), (2, 1)])
+
+    def test_quiet_keys_are_forgotten(self):
+        debouncer = self.make_debouncer()
+        self.submit(debouncer, 1, 1)
+        self.advance(debouncer, 0.5)
+        self.assertEqual(len(debouncer), 0)
+
+        self.submit(debouncer, 1, 2)
+        self.assertEqual(self.delivered, [(1, 1), (1, 2)])
+
+    def test_cancel(self):
+        debouncer = self.make_debouncer()
+        self.submit(debouncer, 1, 1)
+        self.submit(debouncer, 1, 2)
+        debouncer.cancel(1)
+        self.assertEqual(len(debouncer), 0)
+
+        self.advance(debouncer, 1)
+        self.assertEqual(self.delivered, [(1, 1)])
+
+        # A stale timer must not cut short the interval of a key submitted again after being cancelled.
+        self.submit(debouncer, 2, 1)
+        self.advance(debouncer, 0.3)
+        debouncer.cancel(2)
+        self.submit(debouncer, 2, 2)
+        self.submit(debouncer, 2, 3)
+        self.advance(debouncer, 0.3)
+        self.assertEqual(self.delivered, [(1, 1), (2, 1), (2, 2)])
+        self.advance(debouncer, 0.3)
+        self.assertEqual(self.delivered, [(1, 1), (2, 1), (2, 2), (2, 3)])
+
+    def test_global_rate(self):
+        debouncer = self.make_debouncer(rate=2)
+        for key in range(4):
+            self.submit(debouncer, key, 1)
+        self.assertEqual(self.delivered, [(0, 1), (1, 1)])
+
+        self.advance(debouncer, 0.5)
+        self.assertEqual(len(self.delivered), 3)
+        self.advance(debouncer, 0.5)
+        self.assertEqual(sorted(self.delivered), [(key, 1) for key in range(4)])
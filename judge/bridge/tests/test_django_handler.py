@@ -0,0 +1,194 @@
+import socket
+import threading
+import time
+import unittest
+from functools import partial
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from judge.bridge.django_handler import DjangoHandler
+from judge.bridge.judge_list import JudgeList
+from judge.bridge.server import Server
+from judge.bridge.tests.test_async_server import recv_packet, send_packet
+from judge.judge_priority import BATCH_REJUDGE_PRIORITY, CONTEST_SUBMISSION_PRIORITY, DEFAULT_PRIORITY
+from judge.judgeapi import BridgeConnection, BridgeConnectionPool, _broadcast_pools, _pool, estimate_submission, \
+    judge_broadcast, judge_submissions
+from judge.models import ContestSubmission, Language, Submission, SubmissionSource, SubmissionTestCase
+from judge.models.tests.util import create_contest, create_contest_participation, create_contest_problem, \
+    create_problem, create_user
+
+
+class BridgeServerMixin(object):
+    def setUp(self):
+        super().setUp()
+        self.judges = JudgeList()
+        self.server = Server([('127.0.0.1', 0)], partial(DjangoHandler, judges=self.judges))
+        self.address = self.server.servers[0].server_address
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        # Open connections would outlive the server.
+        _pool.close()
+        self.server.shutdown()
+        self.thread.join()
+        super().tearDown()
+
+
+class DjangoHandlerTestCase(BridgeServerMixin, unittest.TestCase):
+    def make_request(self, id):
+        return {'name': 'submission-request', 'submission-id': id, 'problem-id': 'aplusb', 'language': 'PY3',
+                'source': '', 'judge-id': None, 'priority': DEFAULT_PRIORITY}
+
+    def test_legacy_request(self):
+        with socket.create_connection(self.address) as sock:
+            send_packet(sock, '{"name": "terminate-submission", "submission-id": 1}')
+            self.assertEqual(recv_packet(sock), '{"name":"submission-received","judge-aborted":false}')
+            self.assertEqual(sock.recv(1), b'')
+
+    def test_pipelined_requests(self):
+        connection = BridgeConnection(self.address)
+        try:
+            responses = connection.request_many([self.make_request(id) for id in range(1, 51)])
+            self.assertEqual([response['submission-id'] for response in responses], list(range(1, 51)))
+            self.assertEqual(len(self.judges.queue), 50)
+
+            # The connection stays open for further requests.
+            self.assertEqual(connection.request_many([{'name': 'terminate-submission', 'submission-id': 1}]),
+                             [{'name': 'submission-received', 'judge-aborted': False}])
+            self.assertEqual(len(self.judges.queue), 49)
+        finally:
+            connection.close()
+
+    def test_estimate(self):
+        connection = BridgeConnection(self.address)
+        try:
+            request = {'name': 'submission-estimate', 'submission-id': 1}
+            self.assertEqual(connection.request_many([request]),
+                             [{'name': 'submission-estimate', 'submission-id': 1, 'state': 'unknown'}])
+            connection.request_many([self.make_request(1)])
+            self.assertEqual(connection.request_many([request]),
+                             [{'name': 'submission-estimate', 'submission-id': 1, 'state': 'queued', 'position': 0,
+                               'wait': None, 'grading': None}])
+        finally:
+            connection.close()
+
+    def test_estimate_submission_cached(self):
+        submission = Submission(id=1)
+        self.addCleanup(cache.delete, 'sub_estimate:1')
+        self.judges.judge(1, 'aplusb', 'PY3', '', None, DEFAULT_PRIORITY)
+        with override_settings(BRIDGED_DJANGO_CONNECT=self.address):
+            estimate = {'state': 'queued', 'position': 0, 'wait': None, 'grading': None}
+            self.assertEqual(estimate_submission(submission), estimate)
+
+            # Until the estimate expires, the bridge is not asked again.
+            self.judges.abort(1)
+            self.assertEqual(estimate_submission(submission), estimate)
+            cache.delete('sub_estimate:1')
+            self.assertIsNone(estimate_submission(submission))
+
+            # Submissions the bridge does not have are cached too.
+            self.judges.judge(1, 'aplusb', 'PY3', '', None, DEFAULT_PRIORITY)
+            self.assertIsNone(estimate_submission(submission))
+
+    def test_estimate_submission_timeout(self):
+        self.addCleanup(cache.delete, 'sub_estimate:1')
+        with socket.socket() as silent:
+            silent.bind(('127.0.0.1', 0))
+            silent.listen()
+            with override_settings(BRIDGED_DJANGO_CONNECT=silent.getsockname(), DMOJ_SUBMISSION_ESTIMATE_TIMEOUT=0.1), \
+                    self.assertLogs('judge.judgeapi', 'ERROR'):
+                start = time.monotonic()
+                self.assertIsNone(estimate_submission(Submission(id=1)))
+        # The request is not retried, and its connection, whose response was never read, is not reused.
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(_pool._idle, [])
+
+    def test_pool_reuses_connections(self):
+        pool = BridgeConnectionPool(size=1)
+        self.addCleanup(pool.close)
+        with override_settings(BRIDGED_DJANGO_CONNECT=self.address):
+            pool.request_many([self.make_request(1)])
+            connection = pool._idle[0]
+            pool.request_many([self.make_request(2)])
+            self.assertIs(pool._idle[0], connection)
+
+            # A connection closed by the bridge is replaced transparently.
+            connection.sock.shutdown(socket.SHUT_RDWR)
+            self.assertEqual(pool.request_many([self.make_request(3)])[0]['submission-id'], 3)
+            self.assertIsNot(pool._idle[0], connection)
+        self.assertEqual(len(self.judges.queue), 3)
+
+    def test_broadcast(self):
+        with socket.socket() as dead:
+            dead.bind(('127.0.0.1', 0))
+            dead_address = dead.getsockname()
+        self.addCleanup(lambda: [pool.close() for pool in _broadcast_pools.values()])
+
+        self.judges.judge(1, 'aplusb', 'PY3', '', None, DEFAULT_PRIORITY)
+        with override_settings(BRIDGED_DJANGO_BROADCAST=[self.address, dead_address]), \
+                self.assertLogs('judge.judgeapi', 'ERROR'):
+            responses = judge_broadcast({'name': 'terminate-submission', 'submission-id': 1})
+        # Instances that cannot be reached are skipped.
+        self.assertEqual(responses, [{'name': 'submission-received', 'judge-aborted': False}])
+        self.assertEqual(len(self.judges.queue), 0)
+
+
+class JudgeSubmissionsTestCase(BridgeServerMixin, TestCase):
+    @classmethod
+    def setUpTestData(self):
+        self.user = create_user(username='rejudger').profile
+        self.problem = create_problem(code='rejudged')
+        self.contest = create_contest(key='rejudged')
+        self.participation = create_contest_participation(contest=self.contest, user=self.user)
+        self.contest_problem = create_contest_problem(contest=self.contest, problem=self.problem)
+
+    def create_submissions(self, count, contest=False):
+        submissions = []
+        for _ in range(count):
+            submission = Submission.objects.create(user=self.user, problem=self.problem, status='D', result='WA',
+                                                   language=Language.get_python3(), points=1, case_points=1,
+                                                   case_total=2, contest_object=self.contest if contest else None)
+            SubmissionSource.objects.create(submission=submission, source='print(%d)' % submission.id)
+            SubmissionTestCase.objects.create(submission=submission, case=1, status='WA', time=0.1, memory=1,
+                                              points=0, total=1, output='')
+            if contest:
+                ContestSubmission.objects.create(submission=submission, problem=self.contest_problem,
+                                                 participation=self.participation)
+            submissions.append(submission)
+        return submissions
+
+    def judge_submissions(self, submissions, **kwargs):
+        with override_settings(BRIDGED_DJANGO_CONNECT=self.address), CaptureQueriesContext(connection) as queries:
+            result = judge_submissions(submissions, **kwargs)
+        return result, len(queries)
+
+    def test_judge_submissions(self):
+        submissions = self.create_submissions(2) + self.create_submissions(1, contest=True)
+        Submission.objects.filter(id=submissions[1].id).update(status='G')
+
+        result, _ = self.judge_submissions(submissions)
+        self.assertEqual(result, [True, False, True])
+        self.assertEqual(Submission.objects.get(id=submissions[0].id).status, 'QU')
+        self.assertEqual(Submission.objects.get(id=submissions[1].id).status, 'G')
+        self.assertFalse(SubmissionTestCase.objects.filter(
+            submission_id__in=[submissions[0].id, submissions[2].id]).exists())
+        self.assertTrue(SubmissionTestCase.objects.filter(submission_id=submissions[1].id).exists())
+
+        queued = {item.id: item for item in self.judges.queue}
+        self.assertEqual(set(queued), {submissions[0].id, submissions[2].id})
+        self.assertEqual(queued[submissions[0].id].priority, DEFAULT_PRIORITY)
+        self.assertEqual(queued[submissions[0].id].source, 'print(%d)' % submissions[0].id)
+        self.assertEqual(queued[submissions[2].id].priority, CONTEST_SUBMISSION_PRIORITY)
+        self.assertEqual(queued[submissions[2].id].contest, self.contest.id)
+
+    def test_constant_queries(self):
+        _, few = self.judge_submissions(self.create_submissions(2) + self.create_submissions(1, contest=True),
+                                        rejudge=True, batch_rejudge=True)
+        _, many = self.judge_submissions(self.create_submissions(10) + self.create_submissions(10, contest=True),
+                                         rejudge=True, batch_rejudge=True)
+        self.assertEqual(few, many)
+        self.assertEqual({item.priority for item in self.judges.queue}, {BATCH_REJUDGE_PRIORITY})
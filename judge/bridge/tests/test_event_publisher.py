@@ -0,0 +1,168 @@
+import json
+import threading
+import unittest
+from unittest import mock
+
+from websocket import WebSocketConnectionClosedException
+
+from judge.bridge.event_publisher import EventPublisher
+from judge.event_poster_ws import EventPoster
+
+
+class BlockingPoster(object):
+    """Records batches, holding the publishing thread inside the first call until released."""
+
+    def __init__(self):
+        self.batches = []
+        self.entered = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, events):
+        self.entered.set()
+        self.release.wait(5)
+        self.batches.append(list(events))
+        return [0] * len(events)
+
+    @property
+    def events(self):
+        return [event for batch in self.batches for event in batch]
+
+
+class EventPublisherTestCase(unittest.TestCase):
+    def setUp(self):
+        self.poster = BlockingPoster()
+
+    def make_publisher(self, **kwargs):
+        publisher = EventPublisher(self.poster, **kwargs)
+        # Occupy the publishing thread, so that later posts stay queued.
+        publisher.post('hold', {'type': 'hold'})
+        self.assertTrue(self.poster.entered.wait(5))
+        return publisher
+
+    def finish(self, publisher):
+        self.poster.release.set()
+        publisher.flush(timeout=5)
+        return self.poster.events[1:]
+
+    def test_coalesces_test_cases(self):
+        publisher = self.make_publisher()
+        publisher.post('sub_a', {'type': 'grading-begin'})
+        for case in range(1, 4):
+            publisher.post('sub_a', {'type': 'test-case', 'id': case})
+            publisher.post('sub_b', {'type': 'test-case', 'id': case})
+        publisher.post('sub_a', {'type': 'grading-end'})
+
+        self.assertEqual(self.finish(publisher), [
+            ('sub_a', {'type': 'grading-begin'}),
+            ('sub_a', {'type': 'test-case', 'id': 3}),
+            ('sub_b', {'type': 'test-case', 'id': 3}),
+            ('sub_a', {'type': 'grading-end'}),
+        ])
+
+    def test_coalesces_submission_updates_by_id(self):
+        publisher = self.make_publisher()
+        publisher.post('submissions', {'type': 'update-submission', 'id': 1, 'state': 'processing'})
+        publisher.post('submissions', {'type': 'update-submission', 'id': 2, 'state': 'processing'})
+        publisher.post('submissions', {'type': 'update-submission', 'id': 1, 'state': 'grading'})
+        publisher.post('submissions', {'type': 'done-submission', 'id': 1})
+
+        self.assertEqual(self.finish(publisher), [
+            ('submissions', {'type': 'update-submission', 'id': 2, 'state': 'processing'}),
+            ('submissions', {'type': 'update-submission', 'id': 1, 'state': 'grading'}),
+            ('submissions', {'type': 'done-submission', 'id': 1}),
+        ])
+
+    def test_coalesced_update_follows_done(self):
+        publisher = self.make_publisher()
+        publisher.post('submissions', {'type': 'update-submission', 'id': 1, 'state': 'grading'})
+        publisher.post('submissions', {'type': 'done-submission', 'id': 1})
+        # A rejudge of the same submission begins while the earlier run's events are still queued.
+        publisher.post('submissions', {'type': 'update-submission', 'id': 1, 'state': 'processing'})
+
+        self.assertEqual(self.finish(publisher), [
+            ('submissions', {'type': 'done-submission', 'id': 1}),
+            ('submissions', {'type': 'update-submission', 'id': 1, 'state': 'processing'}),
+        ])
+
+    def test_overflow_drops_oldest_progress_after_coalescing(self):
+        publisher = self.make_publisher(max_size=2)
+        publisher.post('sub_a', {'type': 'test-case', 'id': 1})
+        publisher.post('sub_b', {'type': 'test-case', 'id': 1})
+        publisher.post('sub_a', {'type': 'test-case', 'id': 2})
+        publisher.post('sub_c', {'type': 'test-case', 'id': 1})
+
+        self.assertEqual(publisher.dropped, 1)
+        self.assertEqual(self.finish(publisher), [
+            ('sub_a', {'type': 'test-case', 'id': 2}),
+            ('sub_c', {'type': 'test-case', 'id': 1}),
+        ])
+
+    def test_overflow_drops_only_progress(self):
+        publisher = self.make_publisher(max_size=2)
+        publisher.post('sub_a', {'type': 'test-case', 'id': 1})
+        publisher.post('submissions', {'type': 'done-submission', 'id': 1})
+        publisher.post('submissions', {'type': 'update-submission', 'id': 2, 'state': 'test-case'})
+        publisher.post('sub_b', {'type': 'grading-begin'})
+        publisher.post('sub_c', {'type': 'test-case', 'id': 1})
+
+        self.assertEqual(publisher.dropped, 3)
+        self.assertEqual(self.finish(publisher), [
+            ('submissions', {'type': 'done-submission', 'id': 1}),
+            ('sub_b', {'type': 'grading-begin'}),
+        ])
+
+    def test_overflow_keeps_state_transitions(self):
+        publisher = self.make_publisher(max_size=2)
+        publisher.post('submissions', {'type': 'update-submission', 'id': 1, 'state': 'test-case'})
+        # A progress update replaced by a state transition is no longer dropped.
+        publisher.post('submissions', {'type': 'update-submission', 'id': 1, 'state': 'grading'})
+        publisher.post('sub_a', {'type': 'processing'})
+        publisher.post('sub_a', {'type': 'compile-message'})
+        publisher.post('sub_b', {'type': 'test-case', 'id': 1})
+
+        self.assertEqual(publisher.dropped, 1)
+        self.assertEqual(self.finish(publisher), [
+            ('submissions', {'type': 'update-submission', 'id': 1, 'state': 'grading'}),
+            ('sub_a', {'type': 'processing'}),
+            ('sub_a', {'type': 'compile-message'}),
+        ])
+
+    def test_batches(self):
+        publisher = self.make_publisher(batch_size=2)
+        for id in range(5):
+            publisher.post('submissions', {'type': 'done-submission', 'id': id})
+
+        self.finish(publisher)
+        self.assertEqual([len(batch) for batch in self.poster.batches], [1, 2, 2, 1])
+
+
+class FlakyConnection(object):
+    """Acknowledges posts in order, failing once after acknowledging `fail_after` of them."""
+
+    def __init__(self, received, fail_after=None):
+        self.received = received
+        self.fail_after = fail_after
+        self.unacknowledged = []
+
+    def send(self, data):
+        self.received.append(json.loads(data)['message'])
+        self.unacknowledged.append(len(self.received))
+
+    def recv(self):
+        if self.fail_after is not None and len(self.received) - len(self.unacknowledged) == self.fail_after:
+            raise WebSocketConnectionClosedException()
+        return json.dumps({'status': 'success', 'id': self.unacknowledged.pop(0)})
+
+
+class EventPosterTestCase(unittest.TestCase):
+    def test_post_many_resends_only_unacknowledged(self):
+        received = []
+        connections = iter([FlakyConnection(received, fail_after=2), FlakyConnection(received)])
+        with mock.patch.object(EventPoster, '_connect', autospec=True,
+                               side_effect=lambda poster: setattr(poster, '_conn', next(connections))):
+            poster = EventPoster()
+            ids = poster.post_many([('channel', index) for index in range(4)])
+
+        # The two acknowledged posts are not sent again.
+        self.assertEqual(received, [0, 1, 2, 3, 2, 3])
+        self.assertEqual(ids, [1, 2, 5, 6])
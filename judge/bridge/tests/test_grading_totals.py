@@ -0,0 +1,28 @@
+import unittest
+from types import SimpleNamespace
+
+from judge.bridge.grading_totals import GradingTotals
+
+
+def case(status='AC', time=0.5, memory=100, points=1, total=1, batch=None):
+    return SimpleNamespace(status=status, time=time, memory=memory, points=points, total=total, batch=batch)
+
+
+class GradingTotalsTestCase(unittest.TestCase):
+    def test_empty(self):
+        self.assertEqual(GradingTotals(1).result(), (0, 0, 0.0, 0, 'SC'))
+
+    def test_no_batches(self):
+        totals = GradingTotals.from_cases(1, [case(), case(status='WA', time=1.0, memory=300, points=0), case()])
+        self.assertEqual(totals.result(), (2.0, 300, 2.0, 3, 'WA'))
+
+    def test_batches(self):
+        totals = GradingTotals.from_cases(1, [
+            case(points=5, total=5, batch=1),
+            case(status='TLE', points=0, total=5, batch=1),
+            case(points=3, total=3, batch=2),
+            case(status='RTE', points=0, total=3, batch=2),
+            case(points=2, total=2, batch=3),
+            case(points=1, total=1),
+        ])
+        self.assertEqual(totals.result(), (3.0, 100, 3, 11, 'RTE'))
@@ -0,0 +1,116 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from django.test import TestCase
+
+from judge.bridge.daemon import recover_submissions
+from judge.bridge.journal import QueueJournal
+from judge.bridge.judge_list import JudgeList
+from judge.bridge.tests.util import FakeJudge
+from judge.judge_priority import CONTEST_SUBMISSION_PRIORITY, DEFAULT_PRIORITY
+from judge.models import Language, Submission
+from judge.models.tests.util import create_problem, create_user
+
+
+class JournalMixin(object):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'queue.journal')
+
+    def make_judges(self, **kwargs):
+        journal = QueueJournal(self.path, **kwargs)
+        self.addCleanup(journal.close)
+        journal.replay()
+        return JudgeList(journal=journal)
+
+    def restart(self):
+        journal = QueueJournal(self.path)
+        self.addCleanup(journal.close)
+        return journal.replay()
+
+
+class QueueJournalTestCase(JournalMixin, unittest.TestCase):
+    def test_replay(self):
+        judges = self.make_judges()
+        judge = FakeJudge('j1', ['a'], ['PY3'])
+        judges.judges.add(judge)
+        judges.judge(1, 'a', 'PY3', 'print(1)', None, DEFAULT_PRIORITY, user=1)
+        judges.judge(2, 'a', 'PY3', 'print(2)', None, CONTEST_SUBMISSION_PRIORITY, user=2, contest=3)
+        judges.judge(3, 'b', 'PY3', 'print(3)', None, DEFAULT_PRIORITY)
+        judges.judge(4, 'b', 'PY3', 'print(4)', None, DEFAULT_PRIORITY)
+        judges.abort(4)
+        judges.on_judge_free(judge, 1)
+
+        # The bridge dies while writing a line.
+        with open(self.path, 'a') as f:
+            f.write('["finish",')
+
+        records, dispatched = self.restart()
+        self.assertEqual(records, [
+            ['queue', 2, 'a', 'PY3', 'print(2)', None, CONTEST_SUBMISSION_PRIORITY, 2, 3],
+            ['queue', 3, 'b', 'PY3', 'print(3)', None, DEFAULT_PRIORITY, None, None],
+        ])
+        self.assertEqual(dispatched, {2})
+
+        recovered = JudgeList()
+        recovered.recover(records)
+        self.assertEqual([(item.id, item.priority, item.user, item.contest) for item in recovered.queue],
+                         [(2, CONTEST_SUBMISSION_PRIORITY, 2, 3), (3, DEFAULT_PRIORITY, None, None)])
+
+    def test_compaction(self):
+        judges = self.make_judges(compact_ratio=2, min_compact_size=10)
+        judge = FakeJudge('j1', ['a'], ['PY3'])
+        judges.judges.add(judge)
+        judges.judge(1, 'a', 'PY3', '', 'j2', DEFAULT_PRIORITY)
+        for id in range(2, 100):
+            judges.judge(id, 'a', 'PY3', '', None, DEFAULT_PRIORITY)
+            judges.on_judge_free(judge, id)
+
+        with open(self.path) as f:
+            self.assertLessEqual(len(f.readlines()), 10)
+        self.assertEqual(self.restart(), ([['queue', 1, 'a', 'PY3', '', 'j2', DEFAULT_PRIORITY, None, None]], set()))
+
+    def test_closed(self):
+        judges = self.make_judges()
+        judge = FakeJudge('j1', ['a'], ['PY3'])
+        judges.judges.add(judge)
+        judges.judge(1, 'a', 'PY3', '', None, DEFAULT_PRIORITY)
+
+        # Judges disconnecting as the bridge shuts down do not finish their submissions in the journal.
+        judges.journal.close()
+        judges.remove(judge)
+        self.assertEqual(self.restart()[1], {1})
+
+
+class RecoverSubmissionsTestCase(JournalMixin, TestCase):
+    @classmethod
+    def setUpTestData(self):
+        self.user = create_user(username='recovered').profile
+        self.problem = create_problem(code='recovered')
+
+    def create_submission(self, status):
+        return Submission.objects.create(user=self.user, problem=self.problem, language=Language.get_python3(),
+                                         status=status, result='IE' if status == 'IE' else None)
+
+    def test_recover_submissions(self):
+        queued, grading, aborted, lost = (self.create_submission('QU'), self.create_submission('G'),
+                                          self.create_submission('QU'), self.create_submission('G'))
+        judges = self.make_judges()
+        judges.judges.update({FakeJudge('j1', ['recovered'], ['PY3']), FakeJudge('j2', ['recovered'], ['PY3'])})
+        for submission in (grading, lost, queued, aborted):
+            judges.judge(submission.id, 'recovered', 'PY3', '', None, DEFAULT_PRIORITY)
+        judges.journal.close()
+        Submission.objects.filter(id=aborted.id).update(status='AB', result='AB')
+        Submission.objects.filter(id=lost.id).update(status='IE', result='IE')
+
+        restarted = JudgeList(journal=QueueJournal(self.path))
+        self.addCleanup(restarted.journal.close)
+        self.assertEqual(recover_submissions(restarted), {queued.id, grading.id, lost.id})
+        self.assertEqual([item.id for item in restarted.queue], [grading.id, lost.id, queued.id])
+        self.assertEqual(set(Submission.objects.filter(status='QU').values_list('id', flat=True)),
+                         {queued.id, grading.id, lost.id})
+        self.assertNotIn(aborted.id, restarted.journal.pending)
@@ -0,0 +1,102 @@
+import unittest
+
+from judge.bridge.judge_list import JudgeList
+from judge.bridge.tests.util import FakeJudge
+from judge.judge_priority import BATCH_REJUDGE_PRIORITY, CONTEST_SUBMISSION_PRIORITY, DEFAULT_PRIORITY
+
+
+class JudgeListTestCase(unittest.TestCase):
+    def setUp(self):
+        self.judges = JudgeList()
+
+    def add_judge(self, name, problems=('a', 'b'), executors=('PY3', 'CPP17'), **kwargs):
+        judge = FakeJudge(name, problems, executors, **kwargs)
+        self.judges.judges.add(judge)
+        return judge
+
+    def free(self, judge):
+        self.judges.on_judge_free(judge, judge.get_current_submission())
+
+    def test_dispatch_immediately(self):
+        judge = self.add_judge('j1')
+        self.judges.judge(1, 'a', 'PY3', '', None, DEFAULT_PRIORITY)
+        self.assertEqual(judge.submitted, [1])
+        self.assertEqual(self.judges.submission_map, {1: judge})
+        self.assertEqual(len(self.judges.queue), 0)
+
+    def test_priority_then_fifo(self):
+        judge = self.add_judge('j1')
+        self.judges.judge(1, 'a', 'PY3', '', None, DEFAULT_PRIORITY)
+        self.judges.judge(2, 'a', 'PY3', '', None, DEFAULT_PRIORITY)
+        self.judges.judge(3, 'b', 'CPP17', '', None, DEFAULT_PRIORITY)
+        self.judges.judge(4, 'b', 'PY3', '', None, CONTEST_SUBMISSION_PRIORITY)
+        self.assertEqual(len(self.judges.queue), 3)
+
+        for _ in range(3):
+            self.free(judge)
+        self.assertEqual(judge.submitted, [1, 4, 2, 3])
+        self.assertEqual(len(self.judges.queue), 0)
+
+    def test_skips_unsupported(self):
+        judge = self.add_judge('j1', problems=('a',))
+        other = self.add_judge('j2', problems=('b',))
+        self.judges.judge(1, 'a', 'PY3', '', None, DEFAULT_PRIORITY)
+        self.judges.judge(2, 'b', 'PY3', '', None, DEFAULT_PRIORITY)
+        self.judges.judge(3, 'b', 'PY3', '', None, DEFAULT_PRIORITY)
+        self.judges.judge(4, 'a', 'PY3', '', None, DEFAULT_PRIORITY)
+
+        self.free(judge)
+        self.assertEqual(judge.submitted, [1, 4])
+        self.free(other)
+        self.assertEqual(other.submitted, [2, 3])
+
+    def test_targeted_judge(self):
+        judge = self.add_judge('j1', is_disabled=True)
+        self.add_judge('j2')
+        self.judges.judge(1, 'a', 'PY3', '', 'j1', DEFAULT_PRIORITY)
+        self.assertEqual(judge.submitted, [])
+        self.assertIn(1, self.judges.node_map)
+
+        self.judges.update_problems(judge)
+        self.assertEqual(judge.submitted, [1])
+
+    def test_add_problems(self):
+        judge = self.add_judge('j1', problems=('a',))
+        self.add_judge('j2', problems=('b', 'c'), is_disabled=True)
+        self.judges.judge(1, 'b', 'PY3', '', None, DEFAULT_PRIORITY)
+        self.judges.judge(2, 'c', 'PY3', '', None, DEFAULT_PRIORITY)
+        self.assertTrue(self.judges.queue.has_problem('b'))
+
+        # Submissions to problems the judge already had are not reconsidered.
+        judge.problems.update({'b', 'c'})
+        self.judges.add_problems(judge, ['c', 'd'])
+        self.assertEqual(judge.submitted, [2])
+        self.assertFalse(self.judges.queue.has_problem('c'))
+
+        self.free(judge)
+        self.assertEqual(judge.submitted, [2, 1])
+
+    def test_duplicate_and_abort(self):
+        judge = self.add_judge('j1')
+        self.judges.judge(1, 'a', 'PY3', '', None, DEFAULT_PRIORITY)
+        self.judges.judge(2, 'a', 'PY3', '', None, DEFAULT_PRIORITY)
+        self.judges.judge(2, 'a', 'PY3', '', None, DEFAULT_PRIORITY)
+        self.judges.judge(3, 'a', 'PY3', '', None, DEFAULT_PRIORITY)
+        self.assertEqual(len(self.judges.queue), 2)
+
+        self.assertFalse(self.judges.abort(2))
+        self.assertNotIn(2, self.judges.node_map)
+        self.free(judge)
+        self.assertEqual(judge.submitted, [1, 3])
+
+    def test_reserve_judge_for_non_rejudge(self):
+        first = self.add_judge('j1')
+        second = self.add_judge('j2')
+        self.judges.judge(1, 'a', 'PY3', '', None, BATCH_REJUDGE_PRIORITY)
+        self.judges.judge(2, 'a', 'PY3', '', None, BATCH_REJUDGE_PRIORITY)
+        self.assertEqual(len(first.submitted) + len(second.submitted), 1)
+        self.assertEqual(len(self.judges.queue), 1)
+
+        self.judges.judge(3, 'a', 'PY3', '', None, DEFAULT_PRIORITY)
+        self.assertEqual(len(self.judges.queue), 1)
+        self.assertIn(2, self.judges.node_map)
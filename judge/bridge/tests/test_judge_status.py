@@ -0,0 +1,50 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from judge.bridge.judge_handler import JudgeHandler
+from judge.models import Judge
+
+
+def make_handler(name):
+    # Only the state used by _update_ping, without a connection.
+    handler = JudgeHandler.__new__(JudgeHandler)
+    handler.name = name
+    handler.latency = None
+    handler.load = None
+    handler._saved_status = (None, None)
+    return handler
+
+
+@override_settings(BRIDGED_JUDGE_LOAD_CHANGE=0.25, BRIDGED_JUDGE_PING_CHANGE=0.5)
+class JudgeStatusTestCase(TestCase):
+    def setUp(self):
+        self.judge = Judge.objects.create(name='pinged', auth_key='key', online=True)
+        self.addCleanup(cache.clear)
+
+    def ping(self, handler, latency, load):
+        handler.latency = latency
+        handler.load = load
+        handler._update_ping()
+        judge = Judge.objects.get(id=self.judge.id)
+        return judge.ping, judge.load
+
+    def test_database_written_on_significant_change(self):
+        handler = make_handler(self.judge.name)
+        self.assertEqual(self.ping(handler, 0.1, 1.0), (0.1, 1.0))
+        self.assertEqual(self.ping(handler, 0.12, 1.2), (0.1, 1.0))
+        self.assertEqual(self.ping(handler, 0.12, 1.3), (0.12, 1.3))
+        self.assertEqual(self.ping(handler, 0.2, 1.3), (0.2, 1.3))
+
+    def test_live_status(self):
+        handler = make_handler(self.judge.name)
+        self.ping(handler, 0.1, 1.0)
+        self.ping(handler, 0.12, 1.2)
+        Judge.objects.create(name='offline', auth_key='key', ping=1, load=2)
+
+        judges = {judge.name: judge for judge in Judge.with_live_status(Judge.objects.all())}
+        self.assertEqual((judges['pinged'].ping, judges['pinged'].load), (0.12, 1.2))
+        self.assertEqual((judges['offline'].ping, judges['offline'].load), (1, 2))
+
+        Judge.clear_live_status(self.judge.name)
+        judge, = Judge.with_live_status(Judge.objects.filter(id=self.judge.id))
+        self.assertEqual((judge.ping, judge.load), (0.1, 1.0))
@@ -0,0 +1,66 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from judge.bridge.judge_sync import sync_problems, sync_runtimes, update_problems
+from judge.models import Judge, Language, RuntimeVersion
+from judge.models.tests.util import create_problem
+
+
+class JudgeSyncTestCase(TestCase):
+    @classmethod
+    def setUpTestData(self):
+        self.problems = [create_problem(code='synced%d' % i) for i in range(4)]
+        self.python, _ = Language.objects.get_or_create(key='PY3', defaults={'name': 'Python 3'})
+        self.cpp, _ = Language.objects.get_or_create(key='CPP17', defaults={'name': 'C++17'})
+
+    def setUp(self):
+        self.judge = Judge.objects.create(name='synced', auth_key='key')
+        self.addCleanup(cache.clear)
+
+    def sync_problems(self, codes):
+        with CaptureQueriesContext(connection) as queries:
+            result = sync_problems(self.judge, codes)
+        return result, len(queries)
+
+    def test_problems(self):
+        self.assertEqual(self.sync_problems(['synced0', 'synced1', 'missing'])[0], (2, 0))
+        links = {link.problem_id: link.id for link in Judge.problems.through.objects.filter(judge=self.judge)}
+
+        # An unchanged reconnect does not touch the database.
+        self.assertEqual(self.sync_problems(['synced1', 'synced0', 'missing']), ((0, 0), 0))
+
+        self.assertEqual(self.sync_problems(['synced1', 'synced2', 'synced3'])[0], (2, 1))
+        self.assertEqual(set(self.judge.problems.values_list('code', flat=True)), {'synced1', 'synced2', 'synced3'})
+        self.assertEqual(Judge.problems.through.objects.get(judge=self.judge, problem=self.problems[1]).id,
+                         links[self.problems[1].id])
+
+    def test_update_problems(self):
+        self.sync_problems(['synced0', 'synced1'])
+        self.assertEqual(update_problems(self.judge, ['synced1', 'synced2', 'missing'], ['synced0']), (1, 1))
+        self.assertEqual(set(self.judge.problems.values_list('code', flat=True)), {'synced1', 'synced2'})
+
+        # The next full sync diffs the links, rather than trusting the digest of the old list.
+        self.assertEqual(self.sync_problems(['synced0', 'synced1'])[0], (1, 1))
+
+    def test_saving_a_problem_forces_a_sync(self):
+        self.sync_problems(['synced0'])
+        self.judge.problems.clear()
+        self.problems[0].save()
+        self.assertEqual(self.sync_problems(['synced0'])[0], (1, 0))
+
+    def test_runtimes(self):
+        executors = {'PY3': [['python3', [3, 11, 2]]], 'CPP17': [['g++', [12, 2]], ['clang++', [15]]], 'RUST': []}
+        self.assertEqual(sync_runtimes(self.judge, executors), (5, 0))
+        self.assertEqual(set(self.judge.runtimes.all()), {self.python, self.cpp})
+        version = RuntimeVersion.objects.get(judge=self.judge, name='g++')
+
+        self.assertEqual(sync_runtimes(self.judge, executors), (0, 0))
+
+        executors['PY3'] = [['python3', [3, 12, 0]]]
+        del executors['CPP17'][1]
+        self.assertEqual(sync_runtimes(self.judge, executors), (1, 2))
+        self.assertEqual(set(RuntimeVersion.objects.filter(judge=self.judge).values_list('name', 'version')),
+                         {('python3', '3.12.0'), ('g++', '12.2')})
+        self.assertEqual(RuntimeVersion.objects.get(judge=self.judge, name='g++').id, version.id)
@@ -0,0 +1,54 @@
+import threading
+import unittest
+from urllib.request import urlopen
+
+from judge.bridge.metrics import Counter, Gauge, MetricsServer, Registry, Summary, registry
+
+
+class MetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.registry = Registry()
+
+    def register(self, metric):
+        # Metrics register themselves globally; move them to a private registry instead.
+        registry._metrics.pop(metric.name)
+        self.registry.register(metric)
+        return metric
+
+    def test_counter(self):
+        counter = self.register(Counter('test_packets_total', 'Packets', ['judge']))
+        counter.inc(judge='a')
+        counter.inc(2, judge='a')
+        counter.inc(judge='b"')
+        self.assertEqual(counter.value(judge='a'), 3)
+        self.assertEqual(self.registry.render(), '# HELP test_packets_total Packets\n'
+                                                 '# TYPE test_packets_total counter\n'
+                                                 'test_packets_total{judge="a"} 3.0\n'
+                                                 'test_packets_total{judge="b\\""} 1.0\n')
+        with self.assertRaises(ValueError):
+            counter.inc(other='a')
+
+    def test_gauge_function(self):
+        gauge = self.register(Gauge('test_depth', 'Depth', ['priority'], function=lambda: {(0,): 5, (1,): 2}))
+        self.assertIn('test_depth{priority="0"} 5.0\n', self.registry.render())
+        gauge.set_function(lambda: {})
+        self.assertNotIn('test_depth{', self.registry.render())
+
+    def test_summary(self):
+        summary = self.register(Summary('test_seconds', 'Seconds'))
+        summary.observe(0.5)
+        summary.observe(1.5)
+        self.assertEqual(summary.value(), (2, 2.0))
+        self.assertIn('test_seconds_count 2.0\ntest_seconds_sum 2.0\n', self.registry.render())
+
+    def test_server(self):
+        server = MetricsServer([('127.0.0.1', 0)])
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            host, port = server.servers[0].server_address
+            with urlopen('http://%s:%d/metrics' % (host, port)) as response:
+                self.assertIn(b'bridge_handler_db_seconds', response.read())
+        finally:
+            server.shutdown()
+            thread.join()
@@ -0,0 +1,59 @@
+import unittest
+
+from judge.bridge.judge_list import JudgeList
+from judge.bridge.scheduler import LeastLoadScheduler
+from judge.bridge.tests.util import FakeClock, FakeJudge
+from judge.judge_priority import CONTEST_SUBMISSION_PRIORITY, DEFAULT_PRIORITY
+
+
+class QueueEstimatorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.judges = JudgeList(LeastLoadScheduler(clock=self.clock))
+
+    def add_judge(self, name, problems=('a', 'b'), executors=('PY3',)):
+        judge = FakeJudge(name, problems, executors)
+        self.judges.judges.add(judge)
+        return judge
+
+    def grade(self, judge, id, problem, duration):
+        self.judges.judge(id, problem, 'PY3', '', None, DEFAULT_PRIORITY)
+        self.clock.now += duration
+        self.judges.on_judge_free(judge, id)
+
+    def test_no_history(self):
+        self.add_judge('j1')
+        self.judges.judge(1, 'a', 'PY3', '', None, DEFAULT_PRIORITY)
+        self.judges.judge(2, 'a', 'PY3', '', None, DEFAULT_PRIORITY)
+        self.assertEqual(self.judges.estimate(1), {'state': 'grading', 'position': 0, 'wait': 0, 'grading': None})
+        self.assertEqual(self.judges.estimate(2), {'state': 'queued', 'position': 0, 'wait': None, 'grading': None})
+        self.assertIsNone(self.judges.estimate(3))
+
+    def test_estimate(self):
+        judge = self.add_judge('j1')
+        self.grade(judge, 1, 'a', 10)
+        self.grade(judge, 2, 'b', 2)
+        self.add_judge('j2')
+
+        self.judges.judge(3, 'a', 'PY3', '', None, DEFAULT_PRIORITY)
+        self.judges.judge(4, 'b', 'PY3', '', None, DEFAULT_PRIORITY)
+        self.clock.now += 4
+        self.assertEqual(self.judges.estimate(3)['grading'], 6)
+        self.assertEqual(self.judges.estimate(4)['grading'], 0)
+
+        self.judges.judge(5, 'b', 'PY3', '', None, DEFAULT_PRIORITY)
+        self.judges.judge(6, 'a', 'PY3', '', None, CONTEST_SUBMISSION_PRIORITY)
+        self.judges.judge(7, 'c', 'PY3', '', None, DEFAULT_PRIORITY)
+        # 6 is ahead of 5, since it has a higher priority. Both judges are busy, for 6 and 0 more seconds.
+        self.assertEqual(self.judges.estimate(5), {'state': 'queued', 'position': 1, 'wait': (10 + 6 + 0) / 2,
+                                                   'grading': 2})
+        self.assertEqual(self.judges.estimate(6)['position'], 0)
+
+        # No judge can grade problem c, whose grading time is estimated from all problems.
+        self.assertIsNone(self.judges.estimate(7)['wait'])
+        self.assertAlmostEqual(self.judges.estimate(7)['grading'], 8.4)
+
+        free = self.judges.submission_map[4]
+        self.judges.on_judge_free(free, 4)
+        self.assertEqual(free.submitted[-1], 6)
+        self.assertEqual(self.judges.estimate(5)['position'], 0)
@@ -0,0 +1,98 @@
+import unittest
+from collections import Counter
+
+from judge.bridge.judge_list import JudgeList
+from judge.bridge.scheduler import AffinityScheduler, FairShareScheduler, LeastLoadScheduler, \
+    ShortestJobFirstScheduler, ThroughputScheduler, make_scheduler
+from judge.bridge.tests.util import FakeClock, FakeJudge, simulate
+from judge.judge_priority import DEFAULT_PRIORITY
+
+
+class SchedulerTestCase(unittest.TestCase):
+    def make_judge_list(self, scheduler_class, judges=1, **options):
+        self.clock = FakeClock()
+        judge_list = JudgeList(scheduler=scheduler_class(clock=self.clock, seed=0, **options))
+        for i in range(judges):
+            judge_list.judges.add(FakeJudge('judge%d' % i, ('fast', 'slow'), ('PY3',)))
+        return judge_list
+
+    def test_make_scheduler(self):
+        scheduler = make_scheduler('fair-share', {'share_by': 'contest'})
+        self.assertIsInstance(scheduler, FairShareScheduler)
+        self.assertEqual(scheduler.share_by, 'contest')
+
+    def test_least_load(self):
+        judge_list = self.make_judge_list(LeastLoadScheduler, judges=3)
+        for judge, load in zip(sorted(judge_list.judges, key=lambda judge: judge.name), (0.5, 0.1, 0.9)):
+            judge.load = load
+        judge_list.judge(1, 'fast', 'PY3', '', None, DEFAULT_PRIORITY)
+        self.assertEqual(judge_list.submission_map[1].name, 'judge1')
+
+    def test_throughput(self):
+        judge_list = self.make_judge_list(ThroughputScheduler, judges=2)
+        speed = {'judge0': 1, 'judge1': 4}
+        arrivals = [(i * 0.5, i, 'fast', 'PY3', DEFAULT_PRIORITY, None, None) for i in range(1, 401)]
+        results = simulate(judge_list, self.clock, arrivals, lambda judge, id, problem: 1 / speed[judge.name])
+
+        graded = Counter(name for name, _, _ in results.values())
+        self.assertEqual(sum(graded.values()), 400)
+        self.assertGreater(graded['judge1'], graded['judge0'] * 2)
+
+    def test_shortest_job_first(self):
+        judge_list = self.make_judge_list(ShortestJobFirstScheduler, max_wait=100)
+        durations = {'fast': 1, 'slow': 10}
+        arrivals = [(0, 1, 'slow', 'PY3', DEFAULT_PRIORITY, None, None),
+                    (0, 2, 'fast', 'PY3', DEFAULT_PRIORITY, None, None)]
+        # Learn how long each problem takes.
+        simulate(judge_list, self.clock, arrivals, lambda judge, id, problem: durations[problem])
+
+        start = self.clock.now
+        arrivals = [(start, 3, 'fast', 'PY3', DEFAULT_PRIORITY, None, None),
+                    (start, 4, 'slow', 'PY3', DEFAULT_PRIORITY, None, None),
+                    (start, 5, 'fast', 'PY3', DEFAULT_PRIORITY, None, None)]
+        results = simulate(judge_list, self.clock, arrivals, lambda judge, id, problem: durations[problem])
+        self.assertEqual(sorted(results, key=lambda id: results[id][1]), [3, 5, 4])
+
+    def test_shortest_job_first_starvation(self):
+        judge_list = self.make_judge_list(ShortestJobFirstScheduler, max_wait=5)
+        durations = {'fast': 1, 'slow': 10}
+        simulate(judge_list, self.clock, [(0, 1, 'slow', 'PY3', DEFAULT_PRIORITY, None, None)],
+                 lambda judge, id, problem: durations[problem])
+
+        start = self.clock.now
+        arrivals = [(start, 2, 'fast', 'PY3', DEFAULT_PRIORITY, None, None),
+                    (start, 3, 'slow', 'PY3', DEFAULT_PRIORITY, None, None)]
+        arrivals += [(start + i, 3 + i, 'fast', 'PY3', DEFAULT_PRIORITY, None, None) for i in range(1, 20)]
+        results = simulate(judge_list, self.clock, arrivals, lambda judge, id, problem: durations[problem])
+        self.assertLessEqual(results[3][1] - start, 5 + durations['fast'])
+
+    def test_fair_share(self):
+        judge_list = self.make_judge_list(FairShareScheduler)
+        arrivals = [(0, i, 'fast', 'PY3', DEFAULT_PRIORITY, 'busy', None) for i in range(1, 11)]
+        arrivals += [(0.5, 11, 'fast', 'PY3', DEFAULT_PRIORITY, 'other', None),
+                     (0.5, 12, 'fast', 'PY3', DEFAULT_PRIORITY, 'other', None)]
+        results = simulate(judge_list, self.clock, arrivals, lambda judge, id, problem: 1)
+
+        order = sorted(results, key=lambda id: results[id][1])
+        self.assertLess(order.index(11), 3)
+        self.assertLess(order.index(12), 5)
+
+    def test_affinity(self):
+        judge_list = self.make_judge_list(AffinityScheduler, judges=2, max_wait=5)
+        judge_list.judge(1, 'fast', 'PY3', '', None, DEFAULT_PRIORITY)
+        judge_list.judge(2, 'slow', 'PY3', '', None, DEFAULT_PRIORITY)
+        warm_for_fast = judge_list.submission_map[1]
+
+        judge_list.judge(3, 'slow', 'PY3', '', None, DEFAULT_PRIORITY)
+        judge_list.judge(4, 'fast', 'PY3', '', None, DEFAULT_PRIORITY)
+        self.clock.now = 1
+        judge_list.on_judge_free(warm_for_fast, 1)
+        self.assertEqual(judge_list.submission_map[4], warm_for_fast)
+
+        self.clock.now = 10
+        judge_list.judge(5, 'fast', 'PY3', '', None, DEFAULT_PRIORITY)
+        judge_list.on_judge_free(warm_for_fast, 4)
+        # Submission 3 has waited long enough that it must not be passed over any longer.
+        self.assertEqual(judge_list.submission_map[3], warm_for_fast)
+        self.assertEqual(judge_list.scheduler.hits, 1)
+        self.assertEqual(judge_list.scheduler.misses, 3)
@@ -0,0 +1,139 @@
+from django.test import TestCase
+
+from judge.bridge.daemon import release_submissions
+from judge.bridge.shared_queue import SharedJudgeList, SharedQueue
+from judge.bridge.tests.util import FakeJudge
+from judge.judge_priority import BATCH_REJUDGE_PRIORITY, CONTEST_SUBMISSION_PRIORITY, DEFAULT_PRIORITY
+from judge.models import BridgeQueueEntry, Language, Submission, SubmissionSource
+from judge.models.tests.util import create_problem, create_user
+
+
+class SharedQueueTestCase(TestCase):
+    @classmethod
+    def setUpTestData(self):
+        self.user = create_user(username='shared').profile
+        self.problem = create_problem(code='shared')
+
+    def setUp(self):
+        self.a = self.make_instance('a')
+        self.b = self.make_instance('b')
+
+    def make_instance(self, name):
+        return SharedJudgeList(SharedQueue(name, window=2))
+
+    def add_judge(self, instance, name):
+        judge = FakeJudge(name, ['shared'], ['PY3'])
+        instance.judges.add(judge)
+        return judge
+
+    def create_submission(self):
+        submission = Submission.objects.create(user=self.user, problem=self.problem, language=Language.get_python3())
+        SubmissionSource.objects.create(submission=submission, source='print(%d)' % submission.id)
+        return submission.id
+
+    def submit(self, instance, priority=DEFAULT_PRIORITY, judge_id=None, id=None):
+        id = self.create_submission() if id is None else id
+        instance.judge(id, 'shared', 'PY3', 'print(%d)' % id, judge_id, priority)
+        return id
+
+    def claimed(self):
+        return dict(BridgeQueueEntry.objects.values_list('submission_id', 'bridge'))
+
+    def test_dispatch_across_instances(self):
+        j1 = self.add_judge(self.a, 'j1')
+        j2 = self.add_judge(self.b, 'j2')
+        first, second, third = self.submit(self.a), self.submit(self.a), self.submit(self.a)
+        self.assertEqual(j1.submitted, [first])
+        self.assertEqual(self.claimed(), {first: 'a', second: None, third: None})
+
+        # Submissions queued at one instance are dispatched to free judges of another when it polls.
+        self.b.poll()
+        self.assertEqual(j2.submitted, [second])
+
+        self.a.on_judge_free(j1, first)
+        self.assertEqual(j1.submitted, [first, third])
+        self.assertEqual(self.claimed(), {second: 'b', third: 'a'})
+
+        self.b.remove(j2)
+        self.assertEqual(self.claimed(), {third: 'a'})
+
+    def test_priority(self):
+        j1 = self.add_judge(self.a, 'j1')
+        busy = self.submit(self.a)
+        rejudge = self.submit(self.b, BATCH_REJUDGE_PRIORITY)
+        targeted = [self.submit(self.b, DEFAULT_PRIORITY, judge_id='j2') for _ in range(3)]
+        normal = self.submit(self.b, DEFAULT_PRIORITY)
+        contest = self.submit(self.b, CONTEST_SUBMISSION_PRIORITY)
+        # Already queued at another instance.
+        self.a.judge(normal, 'shared', 'PY3', '', None, DEFAULT_PRIORITY)
+
+        for id in (busy, contest, normal):
+            self.a.on_judge_free(j1, id)
+        self.assertEqual(j1.submitted, [busy, contest, normal, rejudge])
+        expected = dict.fromkeys(targeted)
+        expected[rejudge] = 'a'
+        self.assertEqual(self.claimed(), expected)
+
+    def test_reserve_judge(self):
+        self.add_judge(self.a, 'j1')
+        self.add_judge(self.a, 'j2')
+        first = self.submit(self.b, BATCH_REJUDGE_PRIORITY)
+        self.a.poll()
+        second = self.submit(self.b, BATCH_REJUDGE_PRIORITY)
+        # The last free judge is kept for higher priority submissions.
+        self.a.poll()
+        self.assertEqual(self.claimed(), {first: 'a', second: None})
+
+    def test_abort(self):
+        j1 = self.add_judge(self.a, 'j1')
+        grading, queued = self.submit(self.a), self.submit(self.a)
+        self.assertFalse(self.b.abort(grading))
+        self.assertTrue(self.a.abort(grading))
+        self.assertFalse(self.b.abort(queued))
+        self.assertEqual(self.claimed(), {grading: 'a'})
+        self.assertEqual(j1.submitted, [grading])
+
+    def test_estimate(self):
+        self.add_judge(self.a, 'j1')
+        grading, first, second = self.submit(self.a), self.submit(self.a), self.submit(self.a)
+        self.assertEqual(self.b.estimate(grading), {'state': 'grading', 'position': 0, 'wait': 0, 'grading': None})
+        self.assertEqual(self.b.estimate(second), {'state': 'queued', 'position': 1, 'wait': None, 'grading': None})
+        self.assertEqual(self.a.estimate(first)['position'], 0)
+        self.assertIsNone(self.a.estimate(0))
+
+    def test_rejudge_position(self):
+        j1 = self.add_judge(self.a, 'j1')
+        grading = self.submit(self.a)
+        rejudged = self.create_submission()
+        queued = self.submit(self.a)
+        self.submit(self.b, id=rejudged)
+        # Positions follow the order in which submissions are claimed, not their ids.
+        self.assertEqual(self.b.estimate(queued)['position'], 0)
+        self.assertEqual(self.b.estimate(rejudged)['position'], 1)
+        self.a.on_judge_free(j1, grading)
+        self.assertEqual(j1.submitted, [grading, queued])
+
+    def test_max_scan(self):
+        targeted = [self.submit(self.b, judge_id='j2') for _ in range(3)]
+        normal = self.submit(self.b)
+        shared = SharedQueue('a', window=2, max_scan=3)
+        judge = FakeJudge('j1', ['shared'], ['PY3'])
+        # Only the first rows are read, none of which the judge can grade.
+        self.assertIsNone(shared.claim(judge, DEFAULT_PRIORITY))
+        shared.max_scan = 4
+        self.assertEqual(shared.claim(judge, DEFAULT_PRIORITY).id, normal)
+        expected = dict.fromkeys(targeted)
+        expected[normal] = 'a'
+        self.assertEqual(self.claimed(), expected)
+
+    def test_release_submissions(self):
+        self.add_judge(self.a, 'j1')
+        grading = self.submit(self.a)
+        Submission.objects.filter(id=grading).update(status='G')
+
+        restarted = self.make_instance('a')
+        self.assertEqual(release_submissions(restarted), [grading])
+        self.assertEqual(Submission.objects.get(id=grading).status, 'QU')
+        j2 = self.add_judge(self.b, 'j2')
+        self.b.poll()
+        self.assertEqual(j2.submitted, [grading])
@@ -0,0 +1,40 @@
+from django.core.cache import cache
+from django.test import TestCase
+
+from judge.bridge.submission_data import get_attempt_numbers, get_problem_limits
+from judge.models import Language, LanguageLimit, Submission
+from judge.models.tests.util import create_problem, create_user
+
+
+class SubmissionDataTestCase(TestCase):
+    @classmethod
+    def setUpTestData(self):
+        self.problem = create_problem(code='limits', time_limit=2, memory_limit=65536)
+        self.python = Language.get_python3()
+        self.other = Language.objects.get_or_create(key='CPP17', defaults={'name': 'C++17'})[0]
+        self.users = [create_user(username='attempts%d' % i).profile for i in range(2)]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_problem_limits(self):
+        self.assertEqual(get_problem_limits(self.problem.id, self.python.id), (2, 65536, self.problem.short_circuit))
+        LanguageLimit.objects.create(problem=self.problem, language=self.python, time_limit=5, memory_limit=1024)
+        self.assertEqual(get_problem_limits(self.problem.id, self.python.id)[:2], (5, 1024))
+        self.assertEqual(get_problem_limits(self.problem.id, self.other.id)[:2], (2, 65536))
+
+    def test_problem_limits_invalidated(self):
+        get_problem_limits(self.problem.id, self.python.id)
+        self.problem.time_limit = 3
+        self.problem.save()
+        self.assertEqual(get_problem_limits(self.problem.id, self.python.id)[0], 3)
+
+    def test_attempt_numbers(self):
+        def submit(user, status='QU'):
+            return Submission.objects.create(user=user, problem=self.problem, language=self.python, status=status).id
+
+        first = submit(self.users[0])
+        submit(self.users[0], status='CE')
+        second = submit(self.users[0])
+        other = submit(self.users[1])
+        self.assertEqual(get_attempt_numbers([first, second, other]), {first: 1, second: 2, other: 1})
@@ -0,0 +1,135 @@
+import threading
+from unittest import mock
+
+from django.test import TestCase
+
+from judge.bridge import judge_handler
+from judge.bridge.judge_handler import JudgeHandler
+from judge.bridge.write_buffer import TestCaseWriteBuffer
+from judge.models import Language, Submission, SubmissionTestCase
+from judge.models.tests.util import create_problem, create_user
+
+
+class TestCaseWriteBufferTestCase(TestCase):
+    @classmethod
+    def setUpTestData(self):
+        self.submission = Submission.objects.create(
+            user=create_user(username='buffered').profile,
+            problem=create_problem(code='buffered'),
+            language=Language.get_python3(),
+            status='G',
+        )
+
+    def make_case(self, position):
+        return SubmissionTestCase(submission_id=self.submission.id, case=position, status='AC', time=0.1,
+                                  memory=10, points=1, total=1, output='')
+
+    def test_buffers_until_flush(self):
+        buffer = TestCaseWriteBuffer('judge', max_rows=3, max_delay=60)
+        buffer.add(self.submission.id, 2, [self.make_case(1)])
+        buffer.add(self.submission.id, 3, [self.make_case(2)])
+        self.assertFalse(buffer.should_flush())
+        self.assertFalse(SubmissionTestCase.objects.filter(submission=self.submission).exists())
+
+        buffer.add(self.submission.id, 4, [self.make_case(3)])
+        self.assertTrue(buffer.should_flush())
+        self.assertTrue(buffer.flush())
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(SubmissionTestCase.objects.filter(submission=self.submission).count(), 3)
+        self.submission.refresh_from_db()
+        self.assertEqual(self.submission.current_testcase, 4)
+
+    def test_time_threshold(self):
+        buffer = TestCaseWriteBuffer('judge', max_rows=100, max_delay=0)
+        buffer.add(self.submission.id, 2, [self.make_case(1)])
+        self.assertTrue(buffer.should_flush())
+
+    def test_unknown_submission(self):
+        buffer = TestCaseWriteBuffer('judge', max_rows=100, max_delay=60)
+        buffer.add(-1, 2, [])
+        self.assertFalse(buffer.flush())
+        self.assertIsNone(buffer.submission_id)
+
+
+class JudgeProgressTestCase(TestCase):
+    @classmethod
+    def setUpTestData(self):
+        self.submission = Submission.objects.create(
+            user=create_user(username='progress').profile,
+            problem=create_problem(code='progress', is_public=True),
+            language=Language.get_python3(),
+            status='G',
+        )
+
+    def make_handler(self, max_rows, max_delay=60):
+        # Only the state used to handle test cases, without a connection.
+        handler = JudgeHandler.__new__(JudgeHandler)
+        handler.name = handler.judge_address = None
+        handler.batch_id = None
+        handler.in_batch = False
+        handler._grading_totals = None
+        handler._progress_lock = threading.Lock()
+        handler._progress_id = self.submission.id
+        handler._submission_cache_id = None
+        handler._test_case_lock = threading.Lock()
+        handler._test_case_buffer = TestCaseWriteBuffer(None, max_rows, max_delay)
+        return handler
+
+    def grade_case(self, handler, position):
+        handler.on_test_case({'submission-id': self.submission.id, 'cases': [{
+            'position': position, 'status': 0, 'time': 0.1, 'memory': 10, 'points': 1, 'total-points': 1,
+            'output': '',
+        }]})
+
+    def test_progress_posted_after_flush(self):
+        handler = self.make_handler(max_rows=2)
+        with mock.patch.object(judge_handler, 'progress_events') as progress_events, \
+                mock.patch.object(judge_handler, 'event') as event:
+            self.grade_case(handler, 1)
+            progress_events.submit.assert_not_called()
+
+            self.grade_case(handler, 2)
+            self.assertEqual(SubmissionTestCase.objects.filter(submission=self.submission).count(), 2)
+            key, deliver = progress_events.submit.call_args.args
+            self.assertEqual(key, self.submission.id)
+
+            # The debouncer thread only posts the events.
+            with self.assertNumQueries(0):
+                deliver()
+            self.assertEqual([call.args[1]['type'] for call in event.post.call_args_list],
+                             ['test-case', 'update-submission'])
+
+            event.post.reset_mock()
+            handler._end_progress()
+            deliver()
+            event.post.assert_not_called()
+
+    def test_flushed_without_more_packets(self):
+        handler = self.make_handler(max_rows=100)
+        with mock.patch.object(judge_handler, 'progress_events') as progress_events:
+            self.grade_case(handler, 1)
+            handler._flush_test_cases_if_due()
+            self.assertFalse(SubmissionTestCase.objects.filter(submission=self.submission).exists())
+
+            handler._test_case_buffer.max_delay = 0
+            handler._flush_test_cases_if_due()
+            self.assertEqual(SubmissionTestCase.objects.filter(submission=self.submission).count(), 1)
+            self.assertEqual(progress_events.submit.call_args.args[1].args[:2], (self.submission.id, 1))
+
+    def test_ping_loop_wakes_when_due(self):
+        handler = self.make_handler(max_rows=100, max_delay=0.1)
+        handler._stop_ping = threading.Event()
+        handler.ping = mock.Mock()
+        self.grade_case(handler, 1)
+
+        # The loop sleeps until the buffered test case is old enough, well before the next ping.
+        flushed = threading.Event()
+        handler._flush_test_cases_if_due = lambda: handler._test_case_buffer.due_in() == 0 and flushed.set()
+        thread = threading.Thread(target=handler._ping_thread)
+        thread.start()
+        try:
+            self.assertTrue(flushed.wait(5))
+        finally:
+            handler._stop_ping.set()
+            thread.join()
+        handler.ping.assert_called_once()
@@ -0,0 +1,82 @@
+class FakeJudge:
+    """A stand-in for JudgeHandler that records dispatched submissions instead of talking to a judge."""
+
+    def __init__(self, name, problems=(), executors=(), load=0.0, is_disabled=False):
+        self.name = name
+        self.problems = set(problems)
+        self.executors = set(executors)
+        self.load = load
+        self.is_disabled = is_disabled
+        self._working = False
+        self.submitted = []
+        self.on_submit = None
+
+    @property
+    def working(self):
+        return bool(self._working)
+
+    def can_judge(self, problem, executor, judge_id=None):
+        return problem in self.problems and executor in self.executors and \
+            ((not judge_id and not self.is_disabled) or self.name == judge_id)
+
+    def submit(self, id, problem, language, source):
+        self._working = id
+        self.submitted.append(id)
+        if self.on_submit is not None:
+            self.on_submit(id)
+
+    def get_current_submission(self):
+        return self._working or None
+
+    def abort(self):
+        pass
+
+    def disconnect(self, force=False):
+        pass
+
+
+class FakeClock:
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def simulate(judge_list, clock, arrivals, duration):
+    """
+    Runs a simulated judge fleet to completion.
+
+    `arrivals` is a list of (time, id, problem, language, priority, user, contest) tuples, and `duration(judge, id,
+    problem)` gives how long a judge takes to grade a submission. The judges in `judge_list` must be FakeJudges and
+    `clock` the FakeClock used by its scheduler. Returns a dictionary mapping each submission id to the name of the
+    judge that graded it and the time it was dispatched and finished.
+    """
+    import heapq
+    from itertools import count
+
+    events = []
+    order = count()
+    results = {}
+    problems = {}
+
+    for judge in judge_list.judges:
+        def on_submit(id, judge=judge):
+            end = clock.now + duration(judge, id, problems[id])
+            results[id] = (judge.name, clock.now, end)
+            heapq.heappush(events, (end, next(order), 'finish', (judge, id)))
+        judge.on_submit = on_submit
+
+    for arrival in arrivals:
+        heapq.heappush(events, (arrival[0], next(order), 'arrive', arrival[1:]))
+
+    while events:
+        clock.now, _, kind, payload = heapq.heappop(events)
+        if kind == 'arrive':
+            id, problem, language, priority, user, contest = payload
+            problems[id] = problem
+            judge_list.judge(id, problem, language, '', None, priority, user=user, contest=contest)
+        else:
+            judge, id = payload
+            judge_list.on_judge_free(judge, id)
+    return results
@@ -0,0 +1,73 @@
+import time
+
+from judge.bridge.metrics import Summary
+from judge.models import Submission, SubmissionTestCase
+
+flush_latency = Summary('bridge_test_case_flush_seconds', 'Time spent writing buffered test cases', ['judge'])
+flush_rows = Summary('bridge_test_case_flush_rows', 'Number of test case rows written per flush', ['judge'])
+
+
+class TestCaseWriteBuffer(object):
+    """
+    Write-behind buffer for the test case results of the submission a judge is grading.
+
+    Instead of an UPDATE and an INSERT for every test-case-status packet, results are collected in memory and
+    written as one UPDATE of current_testcase and one bulk INSERT once enough rows are buffered, the oldest
+    buffered row is old enough, or the caller needs the database to be up to date.
+
+    The buffer is not thread-safe. JudgeHandler guards it with a lock, since rows that become old enough are also
+    written from its ping loop, when no more packets come.
+    """
+
+    def __init__(self, judge_name, max_rows, max_delay):
+        self.judge_name = judge_name
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.submission_id = None
+        self.current_testcase = None
+        self.cases = []
+        self._first_buffered = None
+
+    def __len__(self):
+        return len(self.cases)
+
+    def add(self, submission_id, current_testcase, cases):
+        if self.submission_id is not None and self.submission_id != submission_id:
+            self.flush()
+        if self._first_buffered is None:
+            self._first_buffered = time.monotonic()
+        self.submission_id = submission_id
+        self.current_testcase = max(self.current_testcase or 0, current_testcase)
+        self.cases.extend(cases)
+
+    def should_flush(self):
+        return self.submission_id is not None and (
+            len(self.cases) >= self.max_rows or time.monotonic() - self._first_buffered >= self.max_delay
+        )
+
+    def due_in(self):
+        """Returns the seconds until the oldest buffered row is old enough to be written, or None if none are."""
+        first = self._first_buffered
+        if first is None:
+            return None
+        return max(0, first + self.max_delay - time.monotonic())
+
+    def flush(self):
+        """Writes out everything buffered. Returns False if the submission no longer exists."""
+        if self.submission_id is None:
+            return True
+
+        start = time.perf_counter()
+        found = bool(Submission.objects.filter(id=self.submission_id).update(current_testcase=self.current_testcase))
+        if found and self.cases:
+            SubmissionTestCase.objects.bulk_create(self.cases)
+        flush_latency.observe(time.perf_counter() - start, judge=self.judge_name)
+        flush_rows.observe(len(self.cases) if found else 0, judge=self.judge_name)
+        self.clear()
+        return found
+
+    def clear(self):
+        self.submission_id = None
+        self.current_testcase = None
+        self.cases = []
+        self._first_buffered = None
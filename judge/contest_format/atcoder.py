@@ -9,6 +9,7 @@ from django.utils.safestring import mark_safe
 from django.utils.translation import gettext as _, gettext_lazy, ngettext
 
 from judge.contest_format.default import DefaultContestFormat
+from judge.contest_format.icpc import apply_penalized_result, penalized_results
 from judge.contest_format.registry import register_contest_format
 from judge.timezone import from_database_time
 from judge.utils.timedelta import nice_repr
@@ -95,6 +96,37 @@ class AtCoderContestFormat(DefaultContestFormat):
         participation.format_data = format_data
         participation.save()
 
+    def apply_submission(self, participation, submission):
+        format_data = participation.format_data or {}
+        key = str(submission.problem_id)
+        dt = (submission.submission.date - participation.start).total_seconds()
+        data = apply_penalized_result(format_data, key, submission, dt, bool(self.config['penalty']))
+        if data is None:
+            return False
+        format_data[key] = data
+        self.set_results(participation, format_data)
+        participation.save()
+        return True
+
+    def set_results(self, participation, format_data):
+        solved = [data for data in format_data.values() if data['points']]
+        participation.cumtime = max((data['time'] for data in solved), default=0) + \
+            sum(data['penalty'] for data in solved) * self.config['penalty'] * 60
+        participation.score = round(sum(data['points'] for data in format_data.values()),
+                                    self.contest.points_precision)
+        participation.tiebreaker = 0
+        participation.format_data = format_data
+
+    def update_participations(self, participations):
+        submissions = self.get_submissions(participations, 'points', 'submission__date', 'submission__result')
+        penalized = bool(self.config['penalty'])
+        for participation in participations:
+            self.set_results(participation, {
+                str(problem_id): penalized_results(results, participation.start, penalized)
+                for problem_id, results in submissions[participation.id].items()
+            })
+        return True
+
     def display_user_problem(self, participation, contest_problem):
         format_data = (participation.format_data or {}).get(str(contest_problem.id))
         if format_data:
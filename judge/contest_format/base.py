@@ -47,6 +47,32 @@ class BaseContestFormat(metaclass=ABCMeta):
         """
         raise NotImplementedError()
 
+    def apply_submission(self, participation, submission):
+        """
+        Updates a ContestParticipation object's score, cumtime, tiebreaker, and format_data fields for a newly graded
+        submission, from the result of that submission alone, instead of recomputing them from scratch.
+        Implementations should call ContestParticipation.save().
+
+        This is only called when every other submission of the participation to the same problem is older and fully
+        graded, so that format_data already accounts for them.
+
+        :param participation: A ContestParticipation object, whose result fields are up to date.
+        :param submission: The ContestSubmission object that was graded.
+        :return: Whether the participation was updated. If not, update_participation is called instead.
+        """
+        return False
+
+    def update_participations(self, participations):
+        """
+        Updates the score, cumtime, tiebreaker, and format_data fields of many ContestParticipation objects of this
+        contest, as update_participation would, but with a constant number of queries. Implementations should not
+        save the participations; they are saved together by the caller.
+
+        :param participations: A list of ContestParticipation objects.
+        :return: Whether the participations were updated. If not, update_participation is called for each instead.
+        """
+        return False
+
     @abstractmethod
     def display_user_problem(self, participation, contest_problem):
         """
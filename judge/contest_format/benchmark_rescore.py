@@ -0,0 +1,163 @@
+"""
+Compares recomputing the results of every participation of a contest one by one, as rescore_contest used to, with
+recomputing them in chunks through Contest.recompute_participations, on a synthetic contest.
+
+The contest, its users and their submissions are created in a transaction that is rolled back at the end, so nothing
+is left behind, but the tables are locked meanwhile on some databases; do not run it against a live site.
+
+Run with: DJANGO_SETTINGS_MODULE=dmoj.settings python -m judge.contest_format.benchmark_rescore \
+    [--users 5000] [--problems 5] [--submissions 3] [--format default] [--config '{}']
+"""
+import json
+import random
+import time
+from datetime import timedelta
+
+import django
+
+
+class Rollback(Exception):
+    pass
+
+
+def create_contest(format_name, config, users, problems, submissions):
+    from django.contrib.auth.models import User
+    from django.utils import timezone
+
+    from judge.models import Contest, ContestParticipation, ContestProblem, ContestSubmission, Language, Problem, \
+        ProblemGroup, Profile, Submission, SubmissionTestCase
+
+    rng = random.Random(0)
+    now = timezone.now()
+    language = Language.get_python3()
+    group = ProblemGroup.objects.get_or_create(name='benchmark', defaults={'full_name': 'benchmark'})[0]
+    contest = Contest.objects.create(key='rescorebench', name='Rescore benchmark', format_name=format_name,
+                                     format_config=config, start_time=now - timedelta(days=1), end_time=now)
+
+    contest_problems = []
+    for i in range(problems):
+        problem = Problem.objects.create(code='rescorebench%d' % i, name='Rescore benchmark %d' % i, group=group,
+                                         time_limit=1, memory_limit=65536, points=100)
+        contest_problems.append(ContestProblem.objects.create(contest=contest, problem=problem, points=100, order=i,
+                                                              partial=True))
+
+    # Not every database returns the primary keys of the objects it bulk creates, so they are queried back instead.
+    User.objects.bulk_create([User(username='rescorebench%d' % i) for i in range(users)], batch_size=1000)
+    users = User.objects.filter(username__startswith='rescorebench')
+    Profile.objects.bulk_create([Profile(user=user, language=language) for user in users], batch_size=1000)
+    ContestParticipation.objects.bulk_create([
+        ContestParticipation(contest=contest, user=profile, real_start=contest.start_time)
+        for profile in Profile.objects.filter(user__in=users)
+    ], batch_size=1000)
+    participations = list(contest.users.all())
+
+    rows = []
+    for participation in participations:
+        for contest_problem in contest_problems:
+            for _ in range(submissions):
+                batches = [rng.choice((0, 25, 50)) for _ in range(2)]
+                result = 'AC' if sum(batches) == 100 else rng.choice(('WA', 'TLE', 'IE', 'CE'))
+                date = contest.start_time + timedelta(seconds=rng.randrange(86400))
+                rows.append((participation, contest_problem, result, date, batches))
+
+    Submission.objects.bulk_create([
+        Submission(user_id=participation.user_id, problem_id=contest_problem.problem_id, language=language,
+                   status='D', result=result, case_points=sum(batches), case_total=100, points=sum(batches),
+                   contest_object=contest)
+        for participation, contest_problem, result, _, batches in rows
+    ], batch_size=1000)
+    created = list(Submission.objects.filter(contest_object=contest).order_by('id').only('id'))
+    # The submission date is set automatically on creation.
+    for submission, (_, _, _, date, _) in zip(created, rows):
+        submission.date = date
+    Submission.objects.bulk_update(created, ['date'], batch_size=1000)
+
+    ContestSubmission.objects.bulk_create([
+        ContestSubmission(submission=submission, problem=contest_problem, participation=participation,
+                          points=sum(batches))
+        for submission, (participation, contest_problem, _, _, batches) in zip(created, rows)
+    ], batch_size=1000)
+    SubmissionTestCase.objects.bulk_create([
+        SubmissionTestCase(submission=submission, case=batch, batch=batch, status='AC', points=points, total=50)
+        for submission, (_, _, _, _, batches) in zip(created, rows) for batch, points in enumerate(batches, 1)
+    ], batch_size=1000)
+    return contest
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def measure(contest, chunk_size):
+    from django.db import connection
+
+    from judge.models import ContestParticipation
+
+    participations = contest.users.order_by('id')
+
+    queries = QueryCounter()
+    with connection.execute_wrapper(queries):
+        begin = time.perf_counter()
+        for participation in participations.iterator():
+            participation.recompute_results()
+        one_by_one = time.perf_counter() - begin
+    one_by_one_queries = queries.count
+    expected = {id: (score, cumtime) for id, score, cumtime in participations.values_list('id', 'score', 'cumtime')}
+
+    ContestParticipation.objects.filter(contest=contest).update(score=0, cumtime=0, tiebreaker=0, format_data=None)
+    queries = QueryCounter()
+    with connection.execute_wrapper(queries):
+        begin = time.perf_counter()
+        last_id = 0
+        while True:
+            chunk = list(participations.filter(id__gt=last_id)[:chunk_size])
+            if not chunk:
+                break
+            contest.recompute_participations(chunk)
+            last_id = chunk[-1].id
+        chunked = time.perf_counter() - begin
+    chunked_queries = queries.count
+    actual = {id: (score, cumtime) for id, score, cumtime in participations.values_list('id', 'score', 'cumtime')}
+
+    return one_by_one, one_by_one_queries, chunked, chunked_queries, actual == expected
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-u', '--users', type=int, default=5000)
+    parser.add_argument('-p', '--problems', type=int, default=5)
+    parser.add_argument('-s', '--submissions', type=int, default=3, help='submissions per user and problem')
+    parser.add_argument('-f', '--format', default='default')
+    parser.add_argument('-c', '--config', type=json.loads, default=None)
+    parser.add_argument('--chunk-size', type=int, default=None)
+    args = parser.parse_args()
+
+    django.setup()
+    from django.db import transaction
+
+    from judge.tasks.contest import RESCORE_CHUNK_SIZE
+
+    try:
+        with transaction.atomic():
+            begin = time.perf_counter()
+            contest = create_contest(args.format, args.config, args.users, args.problems, args.submissions)
+            print('Created %d participations in %.2f s' % (args.users, time.perf_counter() - begin))
+
+            one_by_one, one_by_one_queries, chunked, chunked_queries, match = \
+                measure(contest, args.chunk_size or RESCORE_CHUNK_SIZE)
+            print('One by one: %.2f s, %d queries' % (one_by_one, one_by_one_queries))
+            print('Chunked: %.2f s, %d queries (%.1fx faster)' % (chunked, chunked_queries, one_by_one / chunked))
+            print('Results match' if match else 'Results DO NOT match')
+            raise Rollback
+    except Rollback:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,4 @@
+from collections import defaultdict
 from datetime import timedelta
 
 from django.core.exceptions import ValidationError
@@ -45,6 +46,50 @@ class DefaultContestFormat(BaseContestFormat):
         participation.format_data = format_data
         participation.save()
 
+    def set_results(self, participation, format_data):
+        """Sets the score, cumtime, tiebreaker and format_data fields of a participation from its format data."""
+        participation.cumtime = max(sum(data['time'] for data in format_data.values() if data['points']), 0)
+        participation.score = round(sum(data['points'] for data in format_data.values()),
+                                    self.contest.points_precision)
+        participation.tiebreaker = 0
+        participation.format_data = format_data
+
+    def apply_submission(self, participation, submission):
+        format_data = participation.format_data or {}
+        key = str(submission.problem_id)
+        points = max(format_data[key]['points'], submission.points) if key in format_data else submission.points
+        # This is the latest submission to the problem.
+        format_data[key] = {'time': (submission.submission.date - participation.start).total_seconds(),
+                            'points': points}
+        self.set_results(participation, format_data)
+        participation.save()
+        return True
+
+    @staticmethod
+    def get_submissions(participations, *fields):
+        """
+        Returns a dictionary mapping the id of each participation to a dictionary mapping the ids of the problems it
+        submitted to, to the values of `fields` of each of its submissions to the problem.
+        """
+        from judge.models import ContestSubmission
+
+        submissions = defaultdict(lambda: defaultdict(list))
+        for row in ContestSubmission.objects.filter(participation__in=participations) \
+                .values_list('participation_id', 'problem_id', *fields).order_by():
+            submissions[row[0]][row[1]].append(row[2:])
+        return submissions
+
+    def update_participations(self, participations):
+        submissions = self.get_submissions(participations, 'points', 'submission__date')
+        for participation in participations:
+            format_data = {}
+            for problem_id, results in submissions[participation.id].items():
+                # The maximum score, and the time of the last submission.
+                dt = (max(date for _, date in results) - participation.start).total_seconds()
+                format_data[str(problem_id)] = {'time': dt, 'points': max(points for points, _ in results)}
+            self.set_results(participation, format_data)
+        return True
+
     def display_user_problem(self, participation, contest_problem):
         format_data = (participation.format_data or {}).get(str(contest_problem.id))
         if format_data:
@@ -98,6 +98,59 @@ class ECOOContestFormat(DefaultContestFormat):
         participation.format_data = format_data
         participation.save()
 
+    def apply_submission(self, participation, submission):
+        format_data = participation.format_data or {}
+        if submission.submission.result not in ('IE', 'CE'):
+            key = str(submission.problem_id)
+            date = submission.submission.date
+            bonus = 0
+            if submission.points > 0:
+                # First AC bonus, if every earlier submission to the problem was an IE or CE
+                if key not in format_data and submission.points == submission.problem.points:
+                    bonus += self.config['first_ac_bonus']
+                # Time bonus
+                if self.config['time_bonus']:
+                    bonus += (participation.end_time - date).total_seconds() // 60 // self.config['time_bonus']
+            format_data[key] = {'time': (date - participation.start).total_seconds(), 'points': submission.points,
+                                'bonus': bonus}
+        self.set_results(participation, format_data)
+        participation.save()
+        return True
+
+    def set_results(self, participation, format_data):
+        participation.cumtime = sum(data['time'] for data in format_data.values()) if self.config['cumtime'] else 0
+        participation.score = round(sum(data['points'] + data['bonus'] for data in format_data.values()),
+                                    self.contest.points_precision)
+        participation.tiebreaker = 0
+        participation.format_data = format_data
+
+    def update_participations(self, participations):
+        submissions = self.get_submissions(participations, 'points', 'submission__date', 'submission__result',
+                                           'problem__points')
+        for participation in participations:
+            format_data = {}
+            for problem_id, results in submissions[participation.id].items():
+                results = [result for result in results if result[2] not in ('IE', 'CE')]
+                if not results:
+                    continue
+                # The maximum score among the last submissions to the problem.
+                date = max(date for _, date, _, _ in results)
+                points = max(score for score, submitted, _, _ in results if submitted == date)
+                problem_points = results[0][3]
+
+                bonus = 0
+                if points > 0:
+                    # First AC bonus
+                    if len(results) == 1 and points == problem_points:
+                        bonus += self.config['first_ac_bonus']
+                    # Time bonus
+                    if self.config['time_bonus']:
+                        bonus += (participation.end_time - date).total_seconds() // 60 // self.config['time_bonus']
+                format_data[str(problem_id)] = {'time': (date - participation.start).total_seconds(), 'points': points,
+                                                'bonus': bonus}
+            self.set_results(participation, format_data)
+        return True
+
     def display_user_problem(self, participation, contest_problem):
         format_data = (participation.format_data or {}).get(str(contest_problem.id))
         if format_data:
@@ -14,6 +14,44 @@ from judge.timezone import from_database_time
 from judge.utils.timedelta import nice_repr
 
 
+def apply_penalized_result(format_data, key, submission, dt, penalized):
+    """
+    Returns the new format data of a problem, as computed by the ICPC and AtCoder formats, after a submission newer
+    than every other to the problem is graded, or None if it cannot be computed from the old format data.
+    """
+    counted = int(penalized and submission.submission.result not in ('IE', 'CE'))
+    previous = format_data.get(key) or {'time': dt, 'points': 0, 'penalty': 0}
+    if submission.points > previous['points']:
+        if previous['points']:
+            # The penalty is the number of submissions before the first one with the maximum score, which is not
+            # kept once the problem has a score.
+            return None
+        penalty = previous['penalty'] + counted - 1 if penalized else 0
+        return {'time': dt, 'points': submission.points, 'penalty': penalty}
+    if submission.points == previous['points'] and not submission.points:
+        return dict(previous, penalty=previous['penalty'] + counted)
+    return previous
+
+
+def penalized_results(results, start, penalized):
+    """
+    Returns the format data of a problem, as computed by the ICPC and AtCoder formats, from the (points, date, result)
+    of every submission to the problem.
+    """
+    points = max(score for score, _, _ in results)
+    time = min(date for score, date, _ in results if score == points)
+    penalty = 0
+    if penalized:
+        # An IE can have a submission result of `None`
+        counted = [date for _, date, result in results if result is not None and result not in ('IE', 'CE')]
+        if points:
+            penalty = sum(date <= time for date in counted) - 1
+        else:
+            # We should always display the penalty, even if the user has a score of 0
+            penalty = len(counted)
+    return {'time': (time - start).total_seconds(), 'points': points, 'penalty': penalty}
+
+
 @register_contest_format('icpc')
 class ICPCContestFormat(DefaultContestFormat):
     name = gettext_lazy('ICPC')
@@ -97,6 +135,37 @@ class ICPCContestFormat(DefaultContestFormat):
         participation.format_data = format_data
         participation.save()
 
+    def apply_submission(self, participation, submission):
+        format_data = participation.format_data or {}
+        key = str(submission.problem_id)
+        dt = (submission.submission.date - participation.start).total_seconds()
+        data = apply_penalized_result(format_data, key, submission, dt, bool(self.config['penalty']))
+        if data is None:
+            return False
+        format_data[key] = data
+        self.set_results(participation, format_data)
+        participation.save()
+        return True
+
+    def set_results(self, participation, format_data):
+        solved = [data for data in format_data.values() if data['points']]
+        participation.cumtime = sum(data['time'] for data in solved) + \
+            sum(data['penalty'] for data in solved) * self.config['penalty'] * 60
+        participation.score = round(sum(data['points'] for data in format_data.values()),
+                                    self.contest.points_precision)
+        participation.tiebreaker = max((data['time'] for data in solved), default=0)
+        participation.format_data = format_data
+
+    def update_participations(self, participations):
+        submissions = self.get_submissions(participations, 'points', 'submission__date', 'submission__result')
+        penalized = bool(self.config['penalty'])
+        for participation in participations:
+            self.set_results(participation, {
+                str(problem_id): penalized_results(results, participation.start, penalized)
+                for problem_id, results in submissions[participation.id].items()
+            })
+        return True
+
     def display_user_problem(self, participation, contest_problem):
         format_data = (participation.format_data or {}).get(str(contest_problem.id))
         if format_data:
@@ -1,4 +1,7 @@
+from collections import defaultdict
+
 from django.db import connection
+from django.db.models import Min
 from django.utils.translation import gettext as _, gettext_lazy
 
 from judge.contest_format.legacy_ioi import LegacyIOIContestFormat
@@ -6,6 +9,10 @@ from judge.contest_format.registry import register_contest_format
 from judge.timezone import from_database_time
 
 
+def batch_order(batch):
+    return batch[0] is not None, batch[0] or 0
+
+
 @register_contest_format('ioi16')
 class IOIContestFormat(LegacyIOIContestFormat):
     name = gettext_lazy('IOI')
@@ -22,6 +29,7 @@ class IOIContestFormat(LegacyIOIContestFormat):
         with connection.cursor() as cursor:
             cursor.execute("""
                 SELECT q.prob,
+                       q.batch,
                        MIN(q.date) as `date`,
                        q.batch_points
                 FROM (
@@ -66,18 +74,24 @@ class IOIContestFormat(LegacyIOIContestFormat):
                 GROUP BY q.prob, q.batch
             """, (participation.id, participation.id))
 
-            for problem_id, time, subtask_points in cursor.fetchall():
+            for problem_id, batch, time, subtask_points in cursor.fetchall():
                 problem_id = str(problem_id)
                 time = from_database_time(time)
+                batch_dt = (time - participation.start).total_seconds()
                 if self.config['cumtime']:
-                    dt = (time - participation.start).total_seconds()
+                    dt = batch_dt
                 else:
                     dt = 0
 
                 if format_data.get(problem_id) is None:
-                    format_data[problem_id] = {'points': 0, 'time': 0}
+                    format_data[problem_id] = {'points': 0, 'time': 0, 'batches': []}
                 format_data[problem_id]['points'] += subtask_points
                 format_data[problem_id]['time'] = max(dt, format_data[problem_id]['time'])
+                # Kept so that a new submission can be scored without recomputing every batch.
+                format_data[problem_id]['batches'].append([batch, subtask_points, batch_dt])
+
+            for problem_data in format_data.values():
+                problem_data['batches'].sort(key=batch_order)
 
             for problem_data in format_data.values():
                 penalty = problem_data['time']
@@ -92,6 +106,65 @@ class IOIContestFormat(LegacyIOIContestFormat):
         participation.format_data = format_data
         participation.save()
 
+    def apply_submission(self, participation, submission):
+        from judge.models import SubmissionTestCase
+
+        format_data = participation.format_data or {}
+        key = str(submission.problem_id)
+        if key in format_data and 'batches' not in format_data[key]:
+            # Computed before batches were kept.
+            return False
+
+        if submission.submission.status == 'D':
+            batches = {batch: [batch, points, dt] for batch, points, dt in format_data.get(key, {}).get('batches', ())}
+            dt = (submission.submission.date - participation.start).total_seconds()
+            for batch, points in SubmissionTestCase.objects.filter(submission_id=submission.submission_id) \
+                    .values_list('batch').annotate(points=Min('points')).order_by():
+                # The time of a batch is that of the first submission with its maximum score.
+                if batch not in batches or points > batches[batch][1]:
+                    batches[batch] = [batch, points, dt]
+
+            if batches:
+                batches = sorted(batches.values(), key=batch_order)
+                format_data[key] = {
+                    'points': sum(points for _, points, _ in batches),
+                    'time': max(0, *(dt for _, _, dt in batches)) if self.config['cumtime'] else 0,
+                    'batches': batches,
+                }
+
+        self.set_results(participation, format_data)
+        participation.save()
+        return True
+
+    def update_participations(self, participations):
+        from judge.models import SubmissionTestCase
+
+        # The score of each batch of each graded submission of the participations.
+        batches = defaultdict(lambda: defaultdict(dict))
+        for participation_id, problem_id, submission_id, date, batch, points in SubmissionTestCase.objects \
+                .filter(submission__contest__participation__in=participations, submission__status='D') \
+                .values_list('submission__contest__participation_id', 'submission__contest__problem_id',
+                             'submission_id', 'submission__date', 'batch') \
+                .annotate(points=Min('points')).order_by():
+            problem_batches = batches[participation_id][problem_id]
+            # The time of a batch is that of the first submission with its maximum score.
+            best = problem_batches.get(batch)
+            if best is None or points > best[0] or points == best[0] and date < best[1]:
+                problem_batches[batch] = (points, date)
+
+        for participation in participations:
+            format_data = {}
+            for problem_id, problem_batches in batches[participation.id].items():
+                problem_batches = sorted(([batch, points, (date - participation.start).total_seconds()]
+                                          for batch, (points, date) in problem_batches.items()), key=batch_order)
+                format_data[str(problem_id)] = {
+                    'points': sum(points for _, points, _ in problem_batches),
+                    'time': max(0, *(dt for _, _, dt in problem_batches)) if self.config['cumtime'] else 0,
+                    'batches': problem_batches,
+                }
+            self.set_results(participation, format_data)
+        return True
+
     def get_short_form_display(self):
         yield _('The maximum score for each problem batch will be used.')
 
@@ -69,6 +69,39 @@ class LegacyIOIContestFormat(DefaultContestFormat):
         participation.format_data = format_data
         participation.save()
 
+    def apply_submission(self, participation, submission):
+        format_data = participation.format_data or {}
+        key = str(submission.problem_id)
+        # The time is that of the first submission with the maximum score.
+        if key not in format_data or submission.points > format_data[key]['points']:
+            dt = (submission.submission.date - participation.start).total_seconds() if self.config['cumtime'] else 0
+            format_data[key] = {'points': submission.points, 'time': dt}
+        self.set_results(participation, format_data)
+        participation.save()
+        return True
+
+    def set_results(self, participation, format_data):
+        cumtime = sum(data['time'] for data in format_data.values() if data['points']) if self.config['cumtime'] else 0
+        participation.cumtime = max(cumtime, 0)
+        participation.score = round(sum(data['points'] for data in format_data.values()),
+                                    self.contest.points_precision)
+        participation.tiebreaker = 0
+        participation.format_data = format_data
+
+    def update_participations(self, participations):
+        submissions = self.get_submissions(participations, 'points', 'submission__date')
+        for participation in participations:
+            format_data = {}
+            for problem_id, results in submissions[participation.id].items():
+                points = max(points for points, _ in results)
+                dt = 0
+                if self.config['cumtime']:
+                    time = min(date for score, date in results if score == points)
+                    dt = (time - participation.start).total_seconds()
+                format_data[str(problem_id)] = {'points': points, 'time': dt}
+            self.set_results(participation, format_data)
+        return True
+
     def display_user_problem(self, participation, contest_problem):
         format_data = (participation.format_data or {}).get(str(contest_problem.id))
         if format_data:
@@ -6,7 +6,7 @@ import pika
 from django.conf import settings
 from pika.exceptions import AMQPError
 
-__all__ = ['EventPoster', 'post', 'last']
+__all__ = ['EventPoster', 'post', 'post_many', 'last']
 
 
 class EventPoster(object):
@@ -30,6 +30,9 @@ class EventPoster(object):
             self._connect()
             return self.post(channel, message, tries + 1)
 
+    def post_many(self, events):
+        return [self.post(channel, message) for channel, message in events]
+
 
 _local = threading.local()
 
@@ -51,5 +54,16 @@ def post(channel, message):
     return 0
 
 
+def post_many(events):
+    try:
+        return _get_poster().post_many(events)
+    except AMQPError:
+        try:
+            del _local.poster
+        except AttributeError:
+            pass
+    return [0] * len(events)
+
+
 def last():
     return int(time() * 1000000)
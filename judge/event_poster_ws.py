@@ -5,7 +5,7 @@ import threading
 from django.conf import settings
 from websocket import WebSocketException, create_connection
 
-__all__ = ['EventPostingError', 'EventPoster', 'post', 'last']
+__all__ = ['EventPostingError', 'EventPoster', 'post', 'post_many', 'last']
 _local = threading.local()
 
 
@@ -39,6 +39,25 @@ class EventPoster(object):
             self._connect()
             return self.post(channel, message, tries + 1)
 
+    def post_many(self, events, tries=0, ids=None):
+        # Send every post before reading any response, so that a batch costs one round trip instead of one each.
+        # After a reconnection, only the posts that were not acknowledged yet are sent again.
+        ids = [] if ids is None else ids
+        try:
+            for channel, message in events[len(ids):]:
+                self._conn.send(json.dumps({'command': 'post', 'channel': channel, 'message': message}))
+            while len(ids) < len(events):
+                resp = json.loads(self._conn.recv())
+                if resp['status'] == 'error':
+                    raise EventPostingError(resp['code'])
+                ids.append(resp['id'])
+            return ids
+        except WebSocketException:
+            if tries > 10:
+                raise
+            self._connect()
+            return self.post_many(events, tries + 1, ids)
+
     def last(self, tries=0):
         try:
             self._conn.send('{"command": "last-msg"}')
@@ -71,6 +90,17 @@ def post(channel, message):
     return 0
 
 
+def post_many(events):
+    try:
+        return _get_poster().post_many(events)
+    except (WebSocketException, socket.error):
+        try:
+            del _local.poster
+        except AttributeError:
+            pass
+    return [0] * len(events)
+
+
 def last():
     try:
         return _get_poster().last()
@@ -1,10 +1,15 @@
 import json
 import logging
+import os
 import socket
 import struct
+import threading
+import time
 import zlib
 
 from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
 from django.utils import timezone
 
 from judge import event_poster as event
@@ -13,6 +18,12 @@ from judge.judge_priority import BATCH_REJUDGE_PRIORITY, CONTEST_SUBMISSION_PRIO
 logger = logging.getLogger('judge.judgeapi')
 size_pack = struct.Struct('!I')
 
+# Number of idle connections to the bridge each process keeps, and for how long.
+POOL_SIZE = 4
+POOL_IDLE_TIMEOUT = 60
+# Maximum number of requests written to the bridge before reading their responses.
+PIPELINE_SIZE = 100
+
 
 def _post_update_submission(submission, done=False):
     if submission.problem.is_public:
@@ -23,98 +34,301 @@ def _post_update_submission(submission, done=False):
                                    'status': submission.status, 'language': submission.language.key})
 
 
-def judge_request(packet, reply=True):
-    sock = socket.create_connection(settings.BRIDGED_DJANGO_CONNECT or
-                                    settings.BRIDGED_DJANGO_ADDRESS[0])
+class BridgeConnection(object):
+    """
+    A persistent connection to the Django-facing port of the bridge.
 
-    output = json.dumps(packet, separators=(',', ':'))
-    output = zlib.compress(output.encode('utf-8'))
-    writer = sock.makefile('wb')
-    writer.write(size_pack.pack(len(output)))
-    writer.write(output)
-    writer.close()
+    Every packet is tagged with a request id, which the bridge echoes in its response, so that many requests can be
+    written before any response is read.
+    """
 
-    if reply:
-        reader = sock.makefile('rb', -1)
-        input = reader.read(size_pack.size)
-        if not input:
-            raise ValueError('Judge did not respond')
-        length = size_pack.unpack(input)[0]
-        input = reader.read(length)
-        if not input:
+    def __init__(self, address, timeout=None):
+        self.sock = socket.create_connection(address, timeout)
+        self.reader = self.sock.makefile('rb')
+        self.last_used = time.monotonic()
+        self._next_id = 0
+
+    def _read_exactly(self, size):
+        data = self.reader.read(size)
+        if len(data) < size:
             raise ValueError('Judge did not respond')
-        reader.close()
-        sock.close()
+        return data
 
-        result = json.loads(zlib.decompress(input).decode('utf-8'))
-        return result
+    def request_many(self, packets, timeout=None):
+        # A request that times out leaves its response unread, so the connection must not be used again.
+        self.sock.settimeout(timeout)
+        ids = []
+        frames = []
+        for packet in packets:
+            self._next_id += 1
+            ids.append(self._next_id)
+            output = zlib.compress(json.dumps(dict(packet, **{'request-id': self._next_id}),
+                                              separators=(',', ':')).encode('utf-8'))
+            frames.append(size_pack.pack(len(output)))
+            frames.append(output)
+        self.sock.sendall(b''.join(frames))
 
+        responses = {}
+        while len(responses) < len(ids):
+            length = size_pack.unpack(self._read_exactly(size_pack.size))[0]
+            response = json.loads(zlib.decompress(self._read_exactly(length)).decode('utf-8'))
+            responses[response.pop('request-id', None)] = response
+        self.last_used = time.monotonic()
+        return [responses[id] for id in ids]
 
-def judge_submission(submission, rejudge=False, batch_rejudge=False, judge_id=None):
+    def close(self):
+        self.reader.close()
+        self.sock.close()
+
+
+class BridgeConnectionPool(object):
+    def __init__(self, size=POOL_SIZE, idle_timeout=POOL_IDLE_TIMEOUT, address=None):
+        self.address = address
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self._idle = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _connect(self, timeout=None):
+        return BridgeConnection(self.address or settings.BRIDGED_DJANGO_CONNECT or settings.BRIDGED_DJANGO_ADDRESS[0],
+                                timeout)
+
+    def _get(self, timeout=None):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked: the sockets belong to the parent.
+                self._idle = []
+                self._pid = os.getpid()
+            while self._idle:
+                connection = self._idle.pop()
+                if time.monotonic() - connection.last_used < self.idle_timeout:
+                    return connection, True
+                connection.close()
+        return self._connect(timeout), False
+
+    def _put(self, connection):
+        with self._lock:
+            if len(self._idle) < self.size and self._pid == os.getpid():
+                self._idle.append(connection)
+                return
+        connection.close()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+    def _request(self, connection, packets, timeout=None):
+        try:
+            responses = connection.request_many(packets, timeout)
+        except BaseException:
+            connection.close()
+            raise
+        self._put(connection)
+        return responses
+
+    def request_many(self, packets, timeout=None):
+        """
+        Sends requests to the bridge and returns their responses. If `timeout` is set, raises socket.timeout when the
+        bridge takes longer than that many seconds to accept the connection or to send any part of a response.
+        """
+        connection, reused = self._get(timeout)
+        try:
+            return self._request(connection, packets, timeout)
+        except (OSError, ValueError) as e:
+            # A bridge that is too slow to respond would only be as slow again.
+            if not reused or isinstance(e, socket.timeout):
+                raise
+        # The bridge may have closed an idle connection, e.g. when it restarted. Every request is idempotent (the bridge
+        # ignores requests to queue a submission it already has), so it is safe to retry once on a new connection.
+        return self._request(self._connect(timeout), packets, timeout)
+
+
+_pool = BridgeConnectionPool()
+_broadcast_pools = {}
+_broadcast_lock = threading.Lock()
+
+
+def judge_request(packet, timeout=None):
+    return _pool.request_many([packet], timeout)[0]
+
+
+def judge_broadcast(packet):
+    """
+    Sends a request to every bridge instance in BRIDGED_DJANGO_BROADCAST, or to the bridge if it is not set, and
+    returns the responses of those that could be reached. Raises if none could be.
+    """
+    addresses = settings.BRIDGED_DJANGO_BROADCAST
+    if not addresses:
+        return [judge_request(packet)]
+
+    responses = []
+    error = None
+    for address in addresses:
+        address = tuple(address)
+        with _broadcast_lock:
+            pool = _broadcast_pools.get(address)
+            if pool is None:
+                pool = _broadcast_pools[address] = BridgeConnectionPool(address=address)
+        try:
+            responses.append(pool.request_many([packet])[0])
+        except (OSError, ValueError) as e:
+            logger.exception('Failed to send request to bridge at %s:%s', *address)
+            error = e
+    if not responses:
+        raise error
+    return responses
+
+
+def _reset_submissions(ids, rejudge):
+    """
+    Resets submissions to be queued for judging, with a constant number of queries. Returns a dictionary mapping each
+    submission reset to whether it is in a contest.
+    """
     from .models import ContestSubmission, Submission, SubmissionTestCase
 
     updates = {'time': None, 'memory': None, 'points': None, 'result': None, 'case_points': 0, 'case_total': 0,
-               'error': None, 'rejudged_date': timezone.now() if rejudge or batch_rejudge else None, 'status': 'QU'}
-    try:
-        # This is set proactively; it might get unset in judgecallback's on_grading_begin if the problem doesn't
-        # actually have pretests stored on the judge.
-        updates['is_pretested'] = all(ContestSubmission.objects.filter(submission=submission)
-                                      .values_list('problem__contest__run_pretests_only', 'problem__is_pretested')[0])
-    except IndexError:
-        priority = DEFAULT_PRIORITY
-    else:
-        priority = CONTEST_SUBMISSION_PRIORITY
-
-    # This should prevent double rejudge issues by permitting only the judging of
-    # QU (which is the initial state) and D (which is the final state).
-    # Even though the bridge will not queue a submission already being judged,
-    # we will destroy the current state by deleting all SubmissionTestCase objects.
-    # However, we can't drop the old state immediately before a submission is set for judging,
-    # as that would prevent people from knowing a submission is being scheduled for rejudging.
-    # It is worth noting that this mechanism does not prevent a new rejudge from being scheduled
-    # while already queued, but that does not lead to data corruption.
-    if not Submission.objects.filter(id=submission.id).exclude(status__in=('P', 'G')).update(**updates):
-        return False
-
-    SubmissionTestCase.objects.filter(submission_id=submission.id).delete()
-    print({
+               'error': None, 'rejudged_date': timezone.now() if rejudge else None, 'status': 'QU'}
+
+    # This is set proactively; it might get unset in judgecallback's on_grading_begin if the problem doesn't
+    # actually have pretests stored on the judge.
+    is_pretested = {id: run_pretests_only and problem_is_pretested
+                    for id, run_pretests_only, problem_is_pretested in
+                    ContestSubmission.objects.filter(submission_id__in=ids)
+                    .values_list('submission_id', 'problem__contest__run_pretests_only', 'problem__is_pretested')}
+
+    with transaction.atomic():
+        # This should prevent double rejudge issues by permitting only the judging of
+        # QU (which is the initial state) and D (which is the final state).
+        # Even though the bridge will not queue a submission already being judged,
+        # we will destroy the current state by deleting all SubmissionTestCase objects.
+        # However, we can't drop the old state immediately before a submission is set for judging,
+        # as that would prevent people from knowing a submission is being scheduled for rejudging.
+        # It is worth noting that this mechanism does not prevent a new rejudge from being scheduled
+        # while already queued, but that does not lead to data corruption.
+        reset = list(Submission.objects.select_for_update().filter(id__in=ids).exclude(status__in=('P', 'G'))
+                     .values_list('id', flat=True))
+        if not reset:
+            return {}
+
+        groups = {}
+        for id in reset:
+            groups.setdefault(is_pretested.get(id), []).append(id)
+        for pretested, group in groups.items():
+            if pretested is None:
+                Submission.objects.filter(id__in=group).update(**updates)
+            else:
+                Submission.objects.filter(id__in=group).update(is_pretested=pretested, **updates)
+
+        SubmissionTestCase.objects.filter(submission_id__in=reset).delete()
+
+    return {id: id in is_pretested for id in reset}
+
+
+def judge_submissions(submissions, rejudge=False, batch_rejudge=False, judge_id=None):
+    """
+    Queues submissions for judging. The database is updated with a constant number of queries, and all requests are
+    sent to the bridge at once. Returns a list of whether each submission was queued.
+    """
+    from .models import Submission
+
+    in_contest = _reset_submissions([submission.id for submission in submissions], rejudge or batch_rejudge)
+    if not in_contest:
+        return [False] * len(submissions)
+
+    data = {row['id']: row for row in Submission.objects.filter(id__in=list(in_contest)).values(
+        'id', 'problem__code', 'problem__is_public', 'language__key', 'source__source', 'user_id',
+        'contest_object_id', 'contest_object__key', 'problem_id',
+    )}
+    requested = []
+    for submission in submissions:
+        row = data.get(submission.id)
+        if row is None:
+            continue
+        priority = CONTEST_SUBMISSION_PRIORITY if in_contest[submission.id] else DEFAULT_PRIORITY
+        requested.append((row, {
             'name': 'submission-request',
-            'submission-id': submission.id,
-            'problem-id': submission.problem.code,
-            'language': submission.language.key,
-            'source': submission.source.source,
+            'submission-id': row['id'],
+            'problem-id': row['problem__code'],
+            'language': row['language__key'],
+            'source': row['source__source'],
             'judge-id': judge_id,
             'priority': BATCH_REJUDGE_PRIORITY if batch_rejudge else (REJUDGE_PRIORITY if rejudge else priority),
-    })
+            'user-id': row['user_id'],
+            'contest-id': row['contest_object_id'],
+        }))
+
+    success = set()
+    for start in range(0, len(requested), PIPELINE_SIZE):
+        chunk = requested[start:start + PIPELINE_SIZE]
+        ids = [row['id'] for row, _ in chunk]
+        try:
+            responses = _pool.request_many([packet for _, packet in chunk])
+        except BaseException:
+            logger.exception('Failed to send request to judge')
+            Submission.objects.filter(id__in=ids).update(status='IE', result='IE')
+            continue
+
+        failed = [id for id, response in zip(ids, responses)
+                  if response['name'] != 'submission-received' or response['submission-id'] != id]
+        if failed:
+            Submission.objects.filter(id__in=failed).update(status='IE', result='IE')
+        success.update(ids)
+
+        for row, _ in chunk:
+            if row['problem__is_public']:
+                event.post('submissions', {
+                    'type': 'update-submission', 'id': row['id'],
+                    'contest': row['contest_object__key'] if in_contest[row['id']] else None,
+                    'user': row['user_id'], 'problem': row['problem_id'],
+                    'status': 'IE' if row['id'] in failed else 'QU', 'language': row['language__key'],
+                })
+
+    return [submission.id in success for submission in submissions]
+
+
+def judge_submission(submission, rejudge=False, batch_rejudge=False, judge_id=None):
+    return judge_submissions([submission], rejudge=rejudge, batch_rejudge=batch_rejudge, judge_id=judge_id)[0]
+
+
+def estimate_submission(submission):
+    """
+    Asks the bridge how long a submission is expected to wait and take to grade. Returns a dictionary with its
+    'state' ('queued' or 'grading'), 'position' in the queue, and 'wait' and 'grading' times in seconds, which are
+    None when the bridge cannot tell. Returns None if the bridge does not have the submission or cannot be reached.
+
+    Estimates are cached for DMOJ_SUBMISSION_ESTIMATE_CACHE_TIMEOUT seconds, so that pages polling the status of a
+    submission do not each make a round trip to the bridge, and the bridge is given at most
+    DMOJ_SUBMISSION_ESTIMATE_TIMEOUT seconds to respond, so that pages are not held up by a busy bridge.
+    """
+    cache_key = 'sub_estimate:%d' % submission.id
+    estimate = cache.get(cache_key)
+    if estimate is not None:
+        return estimate or None
+
     try:
-        response = judge_request({
-            'name': 'submission-request',
-            'submission-id': submission.id,
-            'problem-id': submission.problem.code,
-            'language': submission.language.key,
-            'source': submission.source.source,
-            'judge-id': judge_id,
-            'priority': BATCH_REJUDGE_PRIORITY if batch_rejudge else (REJUDGE_PRIORITY if rejudge else priority),
-        })
-    except BaseException:
-        logger.exception('Failed to send request to judge')
-        Submission.objects.filter(id=submission.id).update(status='IE', result='IE')
-        success = False
+        response = judge_request({'name': 'submission-estimate', 'submission-id': submission.id},
+                                 timeout=settings.DMOJ_SUBMISSION_ESTIMATE_TIMEOUT)
+    except (OSError, ValueError):
+        logger.exception('Failed to get estimate for submission: %d', submission.id)
+        response = {}
+    if response.get('name') != 'submission-estimate' or response.get('state') not in ('queued', 'grading'):
+        estimate = {}
     else:
-        print(response)
-        if response['name'] != 'submission-received' or response['submission-id'] != submission.id:
-            Submission.objects.filter(id=submission.id).update(status='IE', result='IE')
-        _post_update_submission(submission)
-        success = True
-    return success
+        estimate = {key: response.get(key) for key in ('state', 'position', 'wait', 'grading')}
+    # An empty estimate is cached too, so that an unreachable bridge is not asked again on every request.
+    cache.set(cache_key, estimate, settings.DMOJ_SUBMISSION_ESTIMATE_CACHE_TIMEOUT)
+    return estimate or None
 
 
 def disconnect_judge(judge, force=False):
-    judge_request({'name': 'disconnect-judge', 'judge-id': judge.name, 'force': force}, reply=False)
+    judge_broadcast({'name': 'disconnect-judge', 'judge-id': judge.name, 'force': force})
 
 
 def update_disable_judge(judge):
-    judge_request({'name': 'disable-judge', 'judge-id': judge.name, 'is-disabled': judge.is_disabled})
+    judge_broadcast({'name': 'disable-judge', 'judge-id': judge.name, 'is-disabled': judge.is_disabled})
 
 
 def abort_submission(submission):
@@ -123,10 +337,11 @@ def abort_submission(submission):
     # submissions marked as aborted.
     if submission.status == 'D':
         return
-    response = judge_request({'name': 'terminate-submission', 'submission-id': submission.id})
+    responses = judge_broadcast({'name': 'terminate-submission', 'submission-id': submission.id})
     # This defaults to true, so that in the case the JudgeList fails to remove the submission from the queue,
     # and returns a bad-request, the submission is not falsely shown as "Aborted" when it will still be judged.
-    if not response.get('judge-aborted', True):
+    # With several bridge instances, only the one grading the submission has a judge to abort it.
+    if not any(response.get('judge-aborted', True) for response in responses):
         Submission.objects.filter(id=submission.id).update(status='AB', result='AB', points=0)
         event.post('sub_%s' % Submission.get_id_secret(submission.id), {'type': 'aborted'})
         _post_update_submission(submission, done=True)
@@ -0,0 +1,35 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('judge', '0145_auto_20240405_0044'),
+        ('judge', '0145_site_data_batch_prerequisites'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BridgeQueueEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('priority', models.IntegerField(verbose_name='priority')),
+                ('problem', models.CharField(max_length=20, verbose_name='problem code')),
+                ('language', models.CharField(max_length=6, verbose_name='language key')),
+                ('judge', models.CharField(max_length=50, null=True, verbose_name='requested judge')),
+                ('user', models.IntegerField(null=True, verbose_name='user ID')),
+                ('contest', models.IntegerField(null=True, verbose_name='contest ID')),
+                ('bridge', models.CharField(help_text='The bridge that dispatched the submission to one of its judges, if any.', max_length=50, null=True, verbose_name='dispatching bridge')),
+                ('submission', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='judge.submission', verbose_name='associated submission')),
+            ],
+            options={
+                'verbose_name': 'bridge queue entry',
+                'verbose_name_plural': 'bridge queue entries',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='bridgequeueentry',
+            index=models.Index(fields=['bridge', 'priority', 'id'], name='judge_bridg_bridge_a09724_idx'),
+        ),
+    ]
@@ -1,3 +1,8 @@
+import logging
+import math
+from functools import partial
+
+from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.core.validators import MaxValueValidator, MinValueValidator, RegexValidator
 from django.db import models, transaction
@@ -18,6 +23,27 @@ from judge.ratings import rate_contest
 
 __all__ = ['Contest', 'ContestTag', 'ContestParticipation', 'ContestProblem', 'ContestSubmission', 'Rating']
 
+logger = logging.getLogger('judge.contest')
+
+
+def results_match(a, b):
+    """Compares contest results, such as format data, allowing for floating point error."""
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(results_match(a[key], b[key]) for key in a)
+    if isinstance(a, (list, tuple)) and isinstance(b, (list, tuple)):
+        return len(a) == len(b) and all(results_match(x, y) for x, y in zip(a, b))
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+        return math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-6)
+    return a == b
+
+
+def update_scoreboard_on_commit(contest, participation_ids):
+    """Renders the cached scoreboard rows of participations again once their recomputed results are committed."""
+    from judge.utils.scoreboard import update_scoreboard
+
+    if participation_ids:
+        transaction.on_commit(partial(update_scoreboard, contest, participation_ids))
+
 
 class MinValueOrNoneValidator(MinValueValidator):
     def compare(self, a, b):
@@ -320,6 +346,29 @@ class Contest(models.Model):
 
     update_user_count.alters_data = True
 
+    def recompute_participations(self, participations):
+        """
+        Recomputes the results of a list of participations of this contest, together if the contest format can,
+        and one by one otherwise.
+        """
+        for participation in participations:
+            participation.contest = self
+        with transaction.atomic():
+            if not self.format.update_participations(participations):
+                for participation in participations:
+                    participation.recompute_results()
+                return
+
+            for participation in participations:
+                if participation.is_disqualified:
+                    participation.score = -9999
+                    participation.cumtime = 0
+                    participation.tiebreaker = 0
+            ContestParticipation.objects.bulk_update(participations, ContestParticipation.RESULT_FIELDS)
+            update_scoreboard_on_commit(self, [participation.id for participation in participations
+                                               if participation.live])
+    recompute_participations.alters_data = True
+
     class Inaccessible(Exception):
         pass
 
@@ -495,6 +544,7 @@ class Contest(models.Model):
 class ContestParticipation(models.Model):
     LIVE = 0
     SPECTATE = -1
+    RESULT_FIELDS = ('score', 'cumtime', 'tiebreaker', 'format_data')
 
     contest = models.ForeignKey(Contest, verbose_name=_('associated contest'), related_name='users', on_delete=CASCADE)
     user = models.ForeignKey(Profile, verbose_name=_('user'), related_name='contest_history', on_delete=CASCADE)
@@ -516,8 +566,46 @@ class ContestParticipation(models.Model):
                 self.cumtime = 0
                 self.tiebreaker = 0
                 self.save(update_fields=['score', 'cumtime', 'tiebreaker'])
+            if self.live:
+                update_scoreboard_on_commit(self.contest, [self.id])
     recompute_results.alters_data = True
 
+    def _is_latest_result(self, submission):
+        if submission.submission.rejudged_date is not None:
+            return False
+        return not self.submissions.filter(problem_id=submission.problem_id).exclude(id=submission.id) \
+            .filter(Q(submission__date__gte=submission.submission.date) | ~Q(submission__status='D')).exists()
+
+    def apply_submission(self, submission):
+        """
+        Updates the results of this participation after one of its submissions, a ContestSubmission, is graded. The
+        contest format updates them from that submission alone when it can, which needs every other submission to
+        the problem to be older and graded already. Otherwise, they are recomputed from scratch.
+        """
+        with transaction.atomic():
+            # Concurrent updates would otherwise each apply their submission to the same old results.
+            current = ContestParticipation.objects.select_for_update() \
+                .only('is_disqualified', *self.RESULT_FIELDS).get(id=self.id)
+            self.is_disqualified = current.is_disqualified
+            for field in self.RESULT_FIELDS:
+                setattr(self, field, getattr(current, field))
+
+            if self.is_disqualified or not self._is_latest_result(submission) or \
+                    not self.contest.format.apply_submission(self, submission):
+                self.recompute_results()
+                return
+            if self.live:
+                update_scoreboard_on_commit(self.contest, [self.id])
+
+            if settings.DMOJ_VERIFY_CONTEST_RESULTS:
+                applied = {field: getattr(self, field) for field in self.RESULT_FIELDS}
+                self.recompute_results()
+                expected = {field: getattr(self, field) for field in self.RESULT_FIELDS}
+                if not results_match(applied, expected):
+                    logger.error('Results of participation %d applied from submission %d do not match: %r != %r',
+                                 self.id, submission.submission_id, applied, expected)
+    apply_submission.alters_data = True
+
     def set_disqualified(self, disqualified):
         self.is_disqualified = disqualified
         self.recompute_results()
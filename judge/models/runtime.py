@@ -14,6 +14,9 @@ from judge.judgeapi import disconnect_judge, update_disable_judge
 
 __all__ = ['Language', 'RuntimeVersion', 'Judge']
 
+# Judges are pinged every 10 seconds; a status that was not refreshed for this long is stale.
+JUDGE_STATUS_TIMEOUT = 60
+
 
 class Language(models.Model):
     key = models.CharField(max_length=6, verbose_name=_('short identifier'),
@@ -173,6 +176,33 @@ class Judge(models.Model):
 
         return {judge: list(data.items()) for judge, data in ret.items()}
 
+    @staticmethod
+    def status_key(name):
+        return 'judge_status:%s' % name
+
+    @classmethod
+    def set_live_status(cls, name, ping, load):
+        """Records the latest ping and load of a connected judge in the cache, for the status page to show."""
+        cache.set(cls.status_key(name), (ping, load), JUDGE_STATUS_TIMEOUT)
+
+    @classmethod
+    def clear_live_status(cls, name):
+        cache.delete(cls.status_key(name))
+
+    @classmethod
+    def with_live_status(cls, judges):
+        """
+        Returns the judges as a list, with the ping and load of those online taken from the cache. The database only
+        holds the values as of the last significant change, and is used for judges with no status in the cache.
+        """
+        judges = list(judges)
+        statuses = cache.get_many([cls.status_key(judge.name) for judge in judges if judge.online])
+        for judge in judges:
+            status = statuses.get(cls.status_key(judge.name))
+            if status is not None:
+                judge.ping, judge.load = status
+        return judges
+
     @cached_property
     def uptime(self):
         return timezone.now() - self.start_time if self.online else 'N/A'
@@ -16,7 +16,7 @@ from judge.models.profile import Profile
 from judge.models.runtime import Language
 from judge.utils.unicode import utf8bytes
 
-__all__ = ['SUBMISSION_RESULT', 'Submission', 'SubmissionSource', 'SubmissionTestCase']
+__all__ = ['SUBMISSION_RESULT', 'Submission', 'SubmissionSource', 'SubmissionTestCase', 'BridgeQueueEntry']
 
 SUBMISSION_RESULT = (
     ('AC', _('Accepted')),
@@ -169,7 +169,11 @@ class Submission(models.Model):
 
         return False
 
-    def update_contest(self):
+    def update_contest(self, graded=False):
+        """
+        Updates the contest results of this submission's participation. Pass `graded` when the submission was just
+        graded by a judge, so that they may be updated from this submission alone.
+        """
         try:
             contest = self.contest
         except AttributeError:
@@ -181,7 +185,10 @@ class Submission(models.Model):
         if not contest_problem.partial and contest.points != contest_problem.points:
             contest.points = 0
         contest.save()
-        contest.participation.recompute_results()
+        if graded:
+            contest.participation.apply_submission(contest)
+        else:
+            contest.participation.recompute_results()
 
     update_contest.alters_data = True
 
@@ -271,6 +278,27 @@ class SubmissionSource(models.Model):
         verbose_name_plural = _('submission sources')
 
 
+class BridgeQueueEntry(models.Model):
+    submission = models.OneToOneField(Submission, on_delete=models.CASCADE, verbose_name=_('associated submission'),
+                                      related_name='+')
+    priority = models.IntegerField(verbose_name=_('priority'))
+    problem = models.CharField(max_length=20, verbose_name=_('problem code'))
+    language = models.CharField(max_length=6, verbose_name=_('language key'))
+    judge = models.CharField(max_length=50, verbose_name=_('requested judge'), null=True)
+    user = models.IntegerField(verbose_name=_('user ID'), null=True)
+    contest = models.IntegerField(verbose_name=_('contest ID'), null=True)
+    bridge = models.CharField(max_length=50, verbose_name=_('dispatching bridge'), null=True,
+                              help_text=_('The bridge that dispatched the submission to one of its judges, if any.'))
+
+    class Meta:
+        verbose_name = _('bridge queue entry')
+        verbose_name_plural = _('bridge queue entries')
+        indexes = [
+            # For claiming the next submission, in order.
+            models.Index(fields=['bridge', 'priority', 'id']),
+        ]
+
+
 @revisions.register()
 class SubmissionTestCase(models.Model):
     RESULT = SUBMISSION_RESULT
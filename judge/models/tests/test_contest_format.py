@@ -0,0 +1,192 @@
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from judge.models import ContestParticipation, ContestSubmission, Language, Submission, SubmissionTestCase
+from judge.models.contest import results_match
+from judge.models.tests.util import create_contest, create_contest_participation, create_contest_problem, \
+    create_problem, create_user
+
+
+class ApplySubmissionTestCase(TestCase):
+    formats = [
+        ('default', None),
+        ('icpc', {'penalty': 20}),
+        ('icpc', {'penalty': 0}),
+        ('atcoder', {'penalty': 5}),
+        ('ecoo', {'cumtime': True, 'first_ac_bonus': 10, 'time_bonus': 5}),
+        ('ioi', {'cumtime': True}),
+        ('ioi16', {'cumtime': True}),
+        ('ioi16', {'cumtime': False}),
+    ]
+
+    # (problem, result, test case points by batch); the points of a submission are the sum of its batches.
+    history = [
+        ('a', 'WA', [0, 0]),
+        ('b', 'WA', [10, 0]),
+        ('a', 'WA', [20, 0]),
+        ('a', 'AC', [50, 50]),
+        ('b', 'WA', [0, 20]),
+        ('a', 'WA', [0, 50]),
+        # Compile errors do not update the results, so the next submission to the problem recomputes them.
+        ('b', 'CE', []),
+        ('b', 'WA', [10, 20]),
+    ]
+
+    @classmethod
+    def setUpTestData(self):
+        self.user = create_user(username='apply').profile
+        self.problems = {code: create_problem(code='apply_%s' % code) for code in ('a', 'b')}
+
+    def create_contest(self, key, format_name, config=None):
+        contest = create_contest(key=key, format_name=format_name, format_config=config)
+        contest_problems = {code: create_contest_problem(contest=contest, problem=problem, order=i)
+                            for i, (code, problem) in enumerate(self.problems.items())}
+        return contest, contest_problems, create_contest_participation(contest=contest, user=self.user)
+
+    def grade(self, participation, contest_problems, index, code, result, batches):
+        submission = Submission.objects.create(user=participation.user, problem=self.problems[code],
+                                               language=Language.get_python3(), status='G')
+        start = participation.start
+        Submission.objects.filter(id=submission.id).update(date=start + timezone.timedelta(minutes=10 * (index + 1)))
+        ContestSubmission.objects.create(submission=submission, problem=contest_problems[code],
+                                         participation=participation)
+        SubmissionTestCase.objects.bulk_create([
+            SubmissionTestCase(submission=submission, case=batch, batch=batch, status='AC', points=points, total=50)
+            for batch, points in enumerate(batches, 1)
+        ])
+
+        submission = Submission.objects.get(id=submission.id)
+        submission.status = 'CE' if result == 'CE' else 'D'
+        submission.result = result
+        submission.case_points = sum(batches)
+        submission.case_total = 100
+        submission.save()
+        if result != 'CE':
+            submission.update_contest(graded=True)
+
+    @override_settings(DMOJ_VERIFY_CONTEST_RESULTS=True)
+    def test_apply_submission(self):
+        for number, (format_name, config) in enumerate(self.formats):
+            with self.subTest(format=format_name, config=config):
+                if format_name in ('icpc', 'atcoder', 'ioi16') and connection.vendor != 'mysql':
+                    self.skipTest('%s results are recomputed with MySQL-specific SQL' % format_name)
+                contest, contest_problems, participation = self.create_contest('apply_%d' % number, format_name,
+                                                                               config)
+                update_participation = contest.format_class.update_participation
+                with self.assertNoLogs('judge.contest', 'ERROR'), \
+                        mock.patch.object(contest.format_class, 'update_participation', autospec=True,
+                                          side_effect=update_participation) as recomputed:
+                    for index, (code, result, batches) in enumerate(self.history):
+                        self.grade(participation, contest_problems, index, code, result, batches)
+                # Each submission is verified by a recomputation, and the one after the compile error falls back to
+                # one. The ICPC formats also fall back when a partial score improves.
+                self.assertLess(recomputed.call_count, len(self.history) + 2)
+
+                applied = ContestParticipation.objects.get(id=participation.id)
+                participation.recompute_results()
+                for field in ContestParticipation.RESULT_FIELDS:
+                    self.assertTrue(results_match(getattr(applied, field), getattr(participation, field)), field)
+                self.assertGreater(participation.score, 0)
+
+    def grade_only_applied(self, contest, contest_problems, participation, history):
+        with mock.patch.object(contest.format_class, 'update_participation', side_effect=AssertionError):
+            for index, (code, result, batches) in enumerate(history):
+                self.grade(participation, contest_problems, index, code, result, batches)
+        participation.refresh_from_db()
+        return participation
+
+    def test_icpc(self):
+        contest, contest_problems, participation = self.create_contest('apply_icpc', 'icpc')
+        participation = self.grade_only_applied(contest, contest_problems, participation, [
+            ('a', 'WA', [0, 0]),
+            ('a', 'AC', [50, 50]),
+            ('a', 'WA', [0, 0]),
+            ('b', 'WA', [50, 0]),
+        ])
+        self.assertEqual(participation.format_data, {
+            str(contest_problems['a'].id): {'time': 1200, 'points': 100, 'penalty': 1},
+            str(contest_problems['b'].id): {'time': 2400, 'points': 50, 'penalty': 0},
+        })
+        self.assertEqual((participation.score, participation.cumtime, participation.tiebreaker),
+                         (150, 1200 + 20 * 60 + 2400, 2400))
+        self.assertRecomputedTogether(contest, [participation])
+
+        # The number of submissions before the first one with the maximum score is not kept.
+        submission = Submission.objects.create(user=self.user, problem=self.problems['b'],
+                                               language=Language.get_python3(), status='D', result='AC')
+        contest_submission = ContestSubmission.objects.create(submission=submission, points=100,
+                                                              problem=contest_problems['b'],
+                                                              participation=participation)
+        self.assertFalse(contest.format.apply_submission(participation, contest_submission))
+
+    def test_ioi16(self):
+        contest, contest_problems, participation = self.create_contest('apply_ioi16', 'ioi16', {'cumtime': True})
+        participation = self.grade_only_applied(contest, contest_problems, participation, [
+            ('a', 'WA', [20, 0]),
+            ('a', 'WA', [0, 30]),
+            ('a', 'WA', [20, 30]),
+            ('a', 'WA', [50, 0]),
+        ])
+        self.assertEqual(participation.format_data, {
+            str(contest_problems['a'].id): {'points': 80, 'time': 2400, 'batches': [[1, 50, 2400], [2, 30, 1200]]},
+        })
+        self.assertEqual((participation.score, participation.cumtime), (80, 2400))
+        self.assertRecomputedTogether(contest, [participation])
+
+    def test_out_of_order(self):
+        contest, contest_problems, participation = self.create_contest('apply_out_of_order', 'default')
+        contest_problem = contest_problems['a']
+        submissions = [Submission.objects.create(user=self.user, problem=self.problems['a'],
+                                                 language=Language.get_python3(), status='G') for _ in range(2)]
+        for i, submission in enumerate(submissions):
+            Submission.objects.filter(id=submission.id).update(
+                date=participation.start + timezone.timedelta(minutes=i + 1))
+            ContestSubmission.objects.create(submission=submission, problem=contest_problem,
+                                             participation=participation)
+
+        # The newer submission is graded first, while the older one is still grading.
+        for submission, result in zip(reversed(submissions), ('AC', 'WA')):
+            submission = Submission.objects.get(id=submission.id)
+            submission.status, submission.result = 'D', result
+            submission.case_points, submission.case_total = int(result == 'AC'), 1
+            submission.save()
+            submission.update_contest(graded=True)
+
+        participation.refresh_from_db()
+        # Once the older submission is graded, it is not the latest, so the results are recomputed.
+        self.assertEqual(participation.format_data, {str(contest_problem.id): {'time': 120, 'points': 100}})
+        self.assertEqual(participation.cumtime, 120)
+
+    def assertRecomputedTogether(self, contest, participations):
+        queryset = ContestParticipation.objects.filter(id__in=[p.id for p in participations]).order_by('id')
+        expected = list(queryset)
+        queryset.update(score=0, cumtime=0, tiebreaker=0, format_data=None)
+        participations = list(queryset)
+        # A savepoint, the submissions, and the update.
+        with self.assertNumQueries(4):
+            contest.recompute_participations(participations)
+        for participation, expected in zip(participations, expected):
+            participation.refresh_from_db()
+            for field in ContestParticipation.RESULT_FIELDS:
+                self.assertTrue(results_match(getattr(participation, field), getattr(expected, field)), field)
+
+    def test_recompute_participations(self):
+        others = [create_user(username='recompute_%d' % i).profile for i in range(2)]
+        for number, (format_name, config) in enumerate(self.formats):
+            with self.subTest(format=format_name, config=config):
+                if format_name in ('icpc', 'atcoder', 'ioi16') and connection.vendor != 'mysql':
+                    self.skipTest('%s results are recomputed with MySQL-specific SQL' % format_name)
+                contest, contest_problems, participation = self.create_contest('recompute_%d' % number, format_name,
+                                                                               config)
+                participations = [participation]
+                participations += [create_contest_participation(contest=contest, user=user) for user in others]
+                for offset, participation in enumerate(participations):
+                    for index, (code, result, batches) in enumerate(self.history[offset:]):
+                        self.grade(participation, contest_problems, index, code, result, batches)
+                participations[-1].is_disqualified = True
+                participations[-1].save()
+                participations[-1].recompute_results()
+                self.assertRecomputedTogether(contest, participations)
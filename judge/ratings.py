@@ -1,4 +1,5 @@
 from bisect import bisect
+from functools import partial
 from math import pi, sqrt, tanh
 from operator import attrgetter, itemgetter
 
@@ -142,6 +143,7 @@ def recalculate_ratings(ranking, old_mean, times_ranked, historical_p):
 
 def rate_contest(contest):
     from judge.models import Rating, Profile
+    from judge.utils.scoreboard import invalidate_scoreboard
 
     rating_subquery = Rating.objects.filter(user=OuterRef('user'))
     rating_sorted = rating_subquery.order_by('-contest__end_time')
@@ -184,6 +186,8 @@ def rate_contest(contest):
                for i, pid, r, m, perf, z in zip(user_ids, participation_ids, rating, mean, performance, ranking)]
     with transaction.atomic():
         Rating.objects.bulk_create(ratings)
+        # The scoreboard shows the rating of each participation.
+        transaction.on_commit(partial(invalidate_scoreboard, contest.id))
 
         Profile.objects.filter(contest_history__contest=contest, contest_history__virtual=0).update(
             rating=Subquery(Rating.objects.filter(user=OuterRef('id'))
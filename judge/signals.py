@@ -8,9 +8,12 @@ from django.core.cache.utils import make_template_fragment_key
 from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
+from .bridge.judge_sync import SYNC_TOKEN_KEY
 from .caching import finished_submission
-from .models import BlogPost, Comment, Contest, ContestSubmission, EFFECTIVE_MATH_ENGINES, Judge, Language, License, \
-    MiscConfig, Organization, Problem, Profile, Submission, WebAuthnCredential
+from .models import BlogPost, Comment, Contest, ContestParticipation, ContestSubmission, EFFECTIVE_MATH_ENGINES, \
+    Judge, Language, LanguageLimit, License, MiscConfig, Organization, Problem, Profile, Submission, \
+    WebAuthnCredential
+from .utils.scoreboard import invalidate_scoreboard_rows
 
 
 def get_pdf_path(basename: str) -> Optional[str]:
@@ -36,7 +39,8 @@ def problem_update(sender, instance, **kwargs):
     cache.delete_many([
         make_template_fragment_key('submission_problem', (instance.id,)),
         make_template_fragment_key('problem_feed', (instance.id,)),
-        'problem_tls:%s' % instance.id, 'problem_mls:%s' % instance.id,
+        'problem_tls:%s' % instance.id, 'problem_mls:%s' % instance.id, 'problem_judge_limits:%s' % instance.id,
+        SYNC_TOKEN_KEY,
     ])
     cache.delete_many([make_template_fragment_key('problem_html', (instance.id, engine, lang))
                        for lang, _ in settings.LANGUAGES for engine in EFFECTIVE_MATH_ENGINES])
@@ -50,6 +54,13 @@ def problem_update(sender, instance, **kwargs):
             unlink_if_exists(cached_pdf_filename)
 
 
+@receiver(post_save, sender=LanguageLimit)
+@receiver(post_delete, sender=LanguageLimit)
+def language_limit_update(sender, instance, **kwargs):
+    cache.delete_many(['problem_tls:%s' % instance.problem_id, 'problem_mls:%s' % instance.problem_id,
+                       'problem_judge_limits:%s' % instance.problem_id])
+
+
 @receiver(post_save, sender=Profile)
 def profile_update(sender, instance, **kwargs):
     if hasattr(instance, '_updating_stats_only'):
@@ -59,6 +70,8 @@ def profile_update(sender, instance, **kwargs):
                        for engine in EFFECTIVE_MATH_ENGINES] +
                       [make_template_fragment_key('org_member_count', (org_id,))
                        for org_id in instance.organizations.values_list('id', flat=True)])
+    invalidate_scoreboard_rows(instance.contest_history.filter(virtual=ContestParticipation.LIVE)
+                               .values_list('id', flat=True))
 
 
 @receiver(post_delete, sender=WebAuthnCredential)
@@ -87,7 +100,7 @@ def license_update(sender, instance, **kwargs):
 @receiver(post_save, sender=Language)
 def language_update(sender, instance, **kwargs):
     cache.delete_many([make_template_fragment_key('language_html', (instance.id,)),
-                       'lang:cn_map'])
+                       'lang:cn_map', SYNC_TOKEN_KEY])
 
 
 @receiver(post_save, sender=Judge)
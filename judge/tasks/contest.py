@@ -9,19 +9,27 @@ from judge.utils.celery import Progress
 
 __all__ = ('rescore_contest', 'run_moss')
 
+# The number of participations recomputed together by rescore_contest.
+RESCORE_CHUNK_SIZE = 500
+
 
 @shared_task(bind=True)
 def rescore_contest(self, contest_key):
     contest = Contest.objects.get(key=contest_key)
-    participations = contest.users
+    participations = contest.users.order_by('id')
 
     rescored = 0
+    last_id = 0
     with Progress(self, participations.count(), stage=_('Recalculating contest scores')) as p:
-        for participation in participations.iterator():
-            participation.recompute_results()
-            rescored += 1
-            if rescored % 10 == 0:
-                p.done = rescored
+        while True:
+            # Recomputed in chunks, with a few queries for each chunk if the contest format supports it.
+            chunk = list(participations.filter(id__gt=last_id)[:RESCORE_CHUNK_SIZE])
+            if not chunk:
+                break
+            contest.recompute_participations(chunk)
+            last_id = chunk[-1].id
+            rescored += len(chunk)
+            p.done = rescored
     return rescored
 
 
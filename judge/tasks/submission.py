@@ -1,13 +1,19 @@
+from itertools import islice
+
 from celery import shared_task
 from django.contrib.auth.models import User
 from django.core.cache import cache
 from django.utils import timezone
 from django.utils.translation import gettext as _
+from reversion import revisions
 
+from judge.judgeapi import judge_submissions
 from judge.models import Problem, Profile, Submission
 from judge.utils.celery import Progress
 
-__all__ = ('apply_submission_filter', 'rejudge_problem_filter', 'rescore_problem')
+__all__ = ('apply_submission_filter', 'rejudge_problem_filter', 'rejudge_submissions', 'rescore_problem')
+
+REJUDGE_CHUNK_SIZE = 100
 
 
 def apply_submission_filter(queryset, id_range, languages, results):
@@ -23,6 +29,25 @@ def apply_submission_filter(queryset, id_range, languages, results):
     return queryset
 
 
+def rejudge_submissions(queryset, user, chunk_size=REJUDGE_CHUNK_SIZE):
+    """
+    Rejudges the unlocked submissions in a queryset, chunk_size at a time, as batch rejudges. Each chunk costs a
+    constant number of queries and one round trip to the bridge. Yields the number of submissions in each chunk.
+    """
+    submissions = queryset.exclude(locked_after__lt=timezone.now()).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(submissions, chunk_size))
+        if not chunk:
+            break
+        with revisions.create_revision(manage_manually=True):
+            revisions.set_user(user)
+            revisions.set_comment('Rejudged')
+            for submission in chunk:
+                revisions.add_to_revision(submission)
+        judge_submissions(chunk, rejudge=True, batch_rejudge=True)
+        yield len(chunk)
+
+
 @shared_task(bind=True)
 def rejudge_problem_filter(self, problem_id, id_range=None, languages=None, results=None, user_id=None):
     queryset = Submission.objects.filter(problem_id=problem_id)
@@ -31,11 +56,9 @@ def rejudge_problem_filter(self, problem_id, id_range=None, languages=None, resu
 
     rejudged = 0
     with Progress(self, queryset.count()) as p:
-        for submission in queryset.iterator():
-            submission.judge(rejudge=True, batch_rejudge=True, rejudge_user=user)
-            rejudged += 1
-            if rejudged % 10 == 0:
-                p.done = rejudged
+        for count in rejudge_submissions(queryset, user):
+            rejudged += count
+            p.done = rejudged
     return rejudged
 
 
@@ -0,0 +1,330 @@
+import hashlib
+import json
+import operator
+from collections import namedtuple
+from functools import reduce
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db.models import Count, Prefetch, Q
+from django.utils.crypto import get_random_string
+from django.utils.safestring import mark_safe
+
+from judge import event_poster as event
+from judge.models import ContestParticipation, Organization
+
+__all__ = ['ContestRankingProfile', 'make_contest_ranking_profile', 'get_scoreboard_problems',
+           'get_scoreboard_participations', 'order_scoreboard', 'get_scoreboard_rows', 'get_scoreboard_ranks',
+           'get_scoreboard_position', 'get_scoreboard_version', 'get_scoreboard_changes', 'serialize_scoreboard_row',
+           'update_scoreboard', 'invalidate_scoreboard', 'invalidate_scoreboard_rows']
+
+ContestRankingProfile = namedtuple(
+    'ContestRankingProfile',
+    'id user css_class username points cumtime tiebreaker organization participation '
+    'participation_rating problem_cells result_cell display_name',
+)
+
+
+def make_contest_ranking_profile(contest, participation, contest_problems):
+    def display_user_problem(contest_problem):
+        # When the contest format is changed, `format_data` might be invalid.
+        # This will cause `display_user_problem` to error, so we display '???' instead.
+        try:
+            return contest.format.display_user_problem(participation, contest_problem)
+        except (KeyError, TypeError, ValueError):
+            return mark_safe('<td>???</td>')
+
+    user = participation.user
+    return ContestRankingProfile(
+        id=user.id,
+        user=user.user,
+        css_class=user.css_class,
+        username=user.username,
+        points=participation.score,
+        cumtime=participation.cumtime,
+        tiebreaker=participation.tiebreaker,
+        organization=user.organization,
+        participation_rating=participation.rating.rating if hasattr(participation, 'rating') else None,
+        problem_cells=[display_user_problem(contest_problem) for contest_problem in contest_problems],
+        result_cell=contest.format.display_participation_result(participation),
+        participation=participation,
+        display_name=user.display_name,
+    )
+
+
+def get_scoreboard_problems(contest):
+    return list(contest.contest_problems.select_related('problem').defer('problem__description').order_by('order'))
+
+
+# The scoreboard of a contest, which only has its live participations, is cached as one row per participation, with
+# the cells of the row rendered. Rows are replaced whenever the results of their
+# participation are recomputed, so that a page view only renders the rows that changed since the last one. Rows
+# are tagged with the state of the contest and its problems that they were rendered from, and with a generation of
+# the scoreboard, so that they are rendered again once either changes.
+#
+# Every replacement of rows is also a new version of the scoreboard under its tag, which records the participations
+# whose rows were replaced, and is announced on the event channel of the contest. Pages showing the scoreboard patch
+# the rows that changed, and catch up on the versions they missed with the rows that changed since.
+
+def _generation_key(contest_id):
+    return 'contest_scoreboard_generation:%d' % contest_id
+
+
+def _row_key(participation_id):
+    return 'contest_scoreboard_row:%d' % participation_id
+
+
+def _version_key(contest_id, tag):
+    return 'contest_scoreboard_version:%d:%s' % (contest_id, tag)
+
+
+def _change_key(contest_id, tag, version):
+    return 'contest_scoreboard_change:%d:%s:%d' % (contest_id, tag, version)
+
+
+def _get_tag(contest, problems):
+    generation = cache.get(_generation_key(contest.id))
+    if generation is None:
+        cache.add(_generation_key(contest.id), get_random_string(12), settings.DMOJ_CONTEST_SCOREBOARD_CACHE_TIMEOUT)
+        generation = cache.get(_generation_key(contest.id))
+
+    state = json.dumps([
+        contest.key, contest.format_name, contest.format_config, contest.points_precision, contest.run_pretests_only,
+        [(problem.id, problem.problem.code, problem.points, problem.partial, problem.is_pretested, problem.order)
+         for problem in problems],
+    ], sort_keys=True, default=str)
+    return '%s-%s' % (generation, hashlib.sha1(state.encode()).hexdigest())
+
+
+# The number of rows rendered together, with one query for their participations.
+RENDER_CHUNK_SIZE = 500
+
+
+def _render_rows(contest, problems, participation_ids):
+    rows = {}
+    # Only what the rows show is loaded, so that they are quick to cache and read back.
+    for participation in ContestParticipation.objects.filter(id__in=participation_ids, contest=contest, virtual=0) \
+            .select_related('user__user', 'rating') \
+            .prefetch_related(Prefetch('user__organizations', Organization.objects.only('id', 'slug', 'short_name'))) \
+            .only('real_start', 'score', 'cumtime', 'tiebreaker', 'is_disqualified', 'virtual', 'format_data',
+                  'contest_id', 'user__display_rank', 'user__rating', 'user__username_display_override',
+                  'user__user__username', 'rating__rating') \
+            .annotate(submission_cnt=Count('submission')):
+        participation.contest = contest
+        rows[participation.id] = make_contest_ranking_profile(contest, participation, problems)
+        # The contest is the same for every row, and is set again when they are read. Nothing else in a row needs
+        # the related objects of its participation once it is rendered.
+        profile = participation.user
+        participation._state.fields_cache.clear()
+        profile.user._state.fields_cache.clear()
+    return rows
+
+
+def _cache_rows(rows, tag, replace):
+    """Caches rendered rows, replacing the cached rows of the participations in `replace`, and no others."""
+    replaced = {}
+    for participation_id, row in rows.items():
+        if participation_id in replace:
+            replaced[_row_key(participation_id)] = (tag, row)
+        else:
+            cache.add(_row_key(participation_id), (tag, row), settings.DMOJ_CONTEST_SCOREBOARD_CACHE_TIMEOUT)
+    cache.set_many(replaced, settings.DMOJ_CONTEST_SCOREBOARD_CACHE_TIMEOUT)
+
+
+def _get_rows(contest, problems, tag, participation_ids):
+    cached = cache.get_many([_row_key(participation_id) for participation_id in participation_ids])
+    rows = {}
+    stale = set()
+    for participation_id in participation_ids:
+        entry = cached.get(_row_key(participation_id))
+        if entry is None:
+            continue
+        if entry[0] != tag:
+            stale.add(participation_id)
+            continue
+        row = entry[1]
+        row.participation.contest = contest
+        rows[participation_id] = row
+
+    missing = [participation_id for participation_id in participation_ids if participation_id not in rows]
+    for i in range(0, len(missing), RENDER_CHUNK_SIZE):
+        rendered = _render_rows(contest, problems, missing[i:i + RENDER_CHUNK_SIZE])
+        # Rows that are not cached yet are only added, since the results of their participations may have been
+        # recomputed, and their rows cached, since they were read.
+        _cache_rows(rendered, tag, replace=stale)
+        for row in rendered.values():
+            row.participation.contest = contest
+        rows.update(rendered)
+    return rows
+
+
+def _sort_rows(rows):
+    return sorted(rows, key=lambda row: (row.participation.is_disqualified, -row.points, row.cumtime, row.tiebreaker,
+                                         -row.participation.submission_cnt, row.participation.id))
+
+
+# The order of the scoreboard, over participations annotated with their number of submissions, as sorted above.
+# Participations with the same results, which are the first fields of the order, share a rank. Disqualified
+# participations are ranked after all others, so they are never counted in the ranks of the others.
+SCOREBOARD_ORDER = ('is_disqualified', '-score', 'cumtime', 'tiebreaker', '-submission_cnt', 'id')
+RANK_ORDER = ('is_disqualified', '-score', 'cumtime', 'tiebreaker')
+
+
+def _ordered_before(order, values):
+    """Returns a Q of the participations that are before one with the `values` of the fields of `order`, in it."""
+    conditions = []
+    equal = Q()
+    for field, value in zip(order, values):
+        name = field.lstrip('-')
+        conditions.append(equal & Q(**{'%s__%s' % (name, 'gt' if field.startswith('-') else 'lt'): value}))
+        equal &= Q(**{name: value})
+    return reduce(operator.or_, conditions)
+
+
+def get_scoreboard_participations(contest, organization=None):
+    """Returns the live participations of a contest, or only those of the members of `organization`."""
+    queryset = contest.users.filter(virtual=ContestParticipation.LIVE)
+    if organization is not None:
+        queryset = queryset.filter(user__organizations=organization)
+    return queryset
+
+
+def order_scoreboard(queryset):
+    return queryset.annotate(submission_cnt=Count('submission')).order_by(*SCOREBOARD_ORDER)
+
+
+def get_scoreboard_rows(contest, problems, participation_ids):
+    """Returns the scoreboard rows of some live participations of a contest, in the order of `participation_ids`."""
+    rows = _get_rows(contest, problems, _get_tag(contest, problems), participation_ids)
+    return [rows[participation_id] for participation_id in participation_ids if participation_id in rows]
+
+
+def get_scoreboard_ranks(contest, rows, offset=None):
+    """
+    Returns the ranks of scoreboard rows among all the live participations of their contest, so that rows can be
+    ranked without reading those ranked before them.
+
+    Rows that are a page of the whole scoreboard, after the first `offset` rows of it, are ranked from one count of
+    the participations ranked before the first row, and then by their position. Other rows, such as a page of the
+    members of an organization, are ranked with one query counting those ranked before each result among them.
+    """
+    if not rows:
+        return []
+    result = operator.attrgetter('participation.is_disqualified', 'points', 'cumtime', 'tiebreaker')
+
+    if offset is not None:
+        last = result(rows[0])
+        rank = get_scoreboard_participations(contest).filter(_ordered_before(RANK_ORDER, last)).count() + 1
+        ranks = []
+        for position, row in enumerate(rows, offset + 1):
+            if result(row) != last:
+                rank, last = position, result(row)
+            ranks.append(rank)
+        return ranks
+
+    results = sorted({result(row) for row in rows})
+    counts = get_scoreboard_participations(contest).aggregate(**{
+        'before_%d' % i: Count('id', filter=_ordered_before(RANK_ORDER, values)) for i, values in enumerate(results)
+    })
+    ranks = {values: counts['before_%d' % i] + 1 for i, values in enumerate(results)}
+    return [ranks[result(row)] for row in rows]
+
+
+def get_scoreboard_position(queryset, participation_id):
+    """Returns the number of participations in `queryset` that are ranked before a participation in it."""
+    queryset = order_scoreboard(queryset)
+    values = queryset.filter(id=participation_id).values_list(*(field.lstrip('-') for field in SCOREBOARD_ORDER))
+    values = values.first()
+    if values is None:
+        return None
+    return queryset.filter(_ordered_before(SCOREBOARD_ORDER, values)).count()
+
+
+def get_scoreboard_version(contest, problems):
+    """Returns the tag and the version of the scoreboard of a contest, which a page showing it catches up from."""
+    tag = _get_tag(contest, problems)
+    return tag, cache.get(_version_key(contest.id, tag), 0)
+
+
+# The most versions, and rows, that a page catches up on. Pages further behind load the whole scoreboard again.
+MAX_SCOREBOARD_CHANGES = 100
+
+# The most rows announced on the event channel with a new version, rather than left for pages to catch up on.
+MAX_ANNOUNCED_ROWS = 10
+
+
+def get_scoreboard_changes(contest, problems, tag, since):
+    """
+    Returns the current version of the scoreboard of a contest, and the rows that changed after version `since`, in
+    ranking order. Returns None if the rows that changed are no longer known, or if there are too many of them, in
+    which case the whole scoreboard is to be loaded again.
+    """
+    if tag != _get_tag(contest, problems):
+        return None
+    version = cache.get(_version_key(contest.id, tag), 0)
+    if not 0 <= since <= version or version - since > MAX_SCOREBOARD_CHANGES:
+        return None
+
+    keys = [_change_key(contest.id, tag, number) for number in range(since + 1, version + 1)]
+    changes = cache.get_many(keys)
+    if len(changes) != len(keys):
+        return None
+    participation_ids = list({participation_id for change in changes.values() for participation_id in change})
+    if len(participation_ids) > MAX_SCOREBOARD_CHANGES:
+        return None
+    rows = _get_rows(contest, problems, tag, participation_ids)
+    return version, _sort_rows(rows.values())
+
+
+def serialize_scoreboard_row(row):
+    participation = row.participation
+    return {
+        'id': participation.id,
+        'points': row.points,
+        'cumtime': row.cumtime,
+        'tiebreaker': row.tiebreaker,
+        'disqualified': participation.is_disqualified,
+        'submissions': participation.submission_cnt,
+        'cells': [str(cell) for cell in row.problem_cells] + [str(row.result_cell)],
+    }
+
+
+def _announce_rows(contest, tag, rows):
+    version_key = _version_key(contest.id, tag)
+    cache.add(version_key, 0, settings.DMOJ_CONTEST_SCOREBOARD_CACHE_TIMEOUT)
+    try:
+        version = cache.incr(version_key)
+    except ValueError:
+        # The version was evicted since it was added. Pages that miss this version load the whole scoreboard again
+        # once they see the next one.
+        return
+    cache.set(_change_key(contest.id, tag, version), list(rows), settings.DMOJ_CONTEST_SCOREBOARD_CACHE_TIMEOUT)
+
+    # The channel of a contest is open to anyone, so rows are only announced on it if anyone can see them.
+    if len(rows) <= MAX_ANNOUNCED_ROWS and contest.show_scoreboard and contest.is_accessible_by(AnonymousUser()):
+        announced = [serialize_scoreboard_row(row) for row in _sort_rows(rows.values())]
+    else:
+        announced = None
+    event.post('contest_%d' % contest.id, {'type': 'scoreboard', 'tag': tag, 'version': version, 'rows': announced})
+
+
+def update_scoreboard(contest, participation_ids):
+    """Renders and caches the scoreboard rows of participations again, after their results are recomputed."""
+    problems = get_scoreboard_problems(contest)
+    tag = _get_tag(contest, problems)
+    for i in range(0, len(participation_ids), RENDER_CHUNK_SIZE):
+        chunk = participation_ids[i:i + RENDER_CHUNK_SIZE]
+        rows = _render_rows(contest, problems, chunk)
+        _cache_rows(rows, tag, replace=set(chunk))
+        if rows:
+            _announce_rows(contest, tag, rows)
+
+
+def invalidate_scoreboard(contest_id):
+    """Discards every row rendered for the scoreboard of a contest."""
+    cache.delete(_generation_key(contest_id))
+
+
+def invalidate_scoreboard_rows(participation_ids):
+    cache.delete_many([_row_key(participation_id) for participation_id in participation_ids])
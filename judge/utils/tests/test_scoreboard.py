@@ -0,0 +1,230 @@
+import json
+import os
+import shutil
+import subprocess
+from operator import attrgetter
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.core.cache import cache
+from django.test import TestCase
+
+from judge.models import ContestParticipation, ContestSubmission, Language, Submission
+from judge.models.tests.util import create_contest, create_contest_participation, create_contest_problem, \
+    create_organization, create_problem
+from judge.utils.ranker import ranker
+from judge.utils.scoreboard import MAX_SCOREBOARD_CHANGES, get_scoreboard_changes, get_scoreboard_participations, \
+    get_scoreboard_position, get_scoreboard_problems, get_scoreboard_ranks, get_scoreboard_rows, \
+    get_scoreboard_version, order_scoreboard, serialize_scoreboard_row
+
+
+class ScoreboardTestCase(TestCase):
+    @classmethod
+    def setUpTestData(self):
+        self.contest = create_contest(key='scoreboard', is_visible=True)
+        self.problem = create_problem(code='scoreboard')
+        self.contest_problem = create_contest_problem(contest=self.contest, problem=self.problem)
+        self.participations = [create_contest_participation(contest=self.contest, user='scoreboard%d' % i)
+                               for i in range(3)]
+
+    def setUp(self):
+        cache.clear()
+
+    def scoreboard(self):
+        ids = list(order_scoreboard(get_scoreboard_participations(self.contest)).values_list('id', flat=True))
+        return get_scoreboard_rows(self.contest, get_scoreboard_problems(self.contest), ids)
+
+    def ranking(self):
+        return [(row.participation.id, row.points) for row in self.scoreboard()]
+
+    def grade(self, participation, points):
+        submission = Submission.objects.create(user=participation.user, problem=self.problem,
+                                               language=Language.get_python3(), status='D', result='AC',
+                                               case_points=points, case_total=100)
+        ContestSubmission.objects.create(submission=submission, problem=self.contest_problem,
+                                         participation=participation)
+        with self.captureOnCommitCallbacks(execute=True):
+            submission.update_contest(graded=True)
+
+    def test_cached_rows(self):
+        first, second, third = self.participations
+        # The problems, the page of participations, their rows, and their organizations.
+        with self.assertNumQueries(4):
+            self.assertEqual(self.ranking(), [(first.id, 0), (second.id, 0), (third.id, 0)])
+        # Only the problems, which are shown in the header, and the page.
+        with self.assertNumQueries(2):
+            self.scoreboard()
+
+        self.grade(second, 50)
+        with self.assertNumQueries(2):
+            self.assertEqual(self.ranking(), [(second.id, 50), (first.id, 0), (third.id, 0)])
+        row = self.scoreboard()[0]
+        self.assertIn('50', row.problem_cells[0])
+        with self.assertNumQueries(0):
+            self.assertEqual(row.participation.contest, self.contest)
+
+    def test_disqualified(self):
+        first, second, third = self.participations
+        self.grade(first, 100)
+        with self.captureOnCommitCallbacks(execute=True):
+            ContestParticipation.objects.get(id=first.id).set_disqualified(True)
+        self.assertEqual(self.ranking(), [(second.id, 0), (third.id, 0), (first.id, -9999)])
+
+    def test_invalidation(self):
+        first, second, third = self.participations
+        self.scoreboard()
+
+        # Rows show how close each score is to the points of the problem, so they are rendered again.
+        self.contest_problem.points = 50
+        self.contest_problem.save()
+        with self.assertNumQueries(4):
+            self.scoreboard()
+
+        fourth = create_contest_participation(contest=self.contest, user='scoreboard3')
+        self.assertEqual(self.ranking(), [(first.id, 0), (second.id, 0), (third.id, 0), (fourth.id, 0)])
+        fourth.delete()
+        self.assertEqual(len(self.scoreboard()), 3)
+
+        profile = second.user
+        profile.username_display_override = 'renamed'
+        profile.save()
+        self.assertEqual([row.display_name for row in self.scoreboard()], ['scoreboard0', 'renamed', 'scoreboard2'])
+
+    def test_virtual(self):
+        virtual = create_contest_participation(contest=self.contest, user='scoreboard0', virtual=1)
+        self.grade(virtual, 100)
+        self.assertEqual([participation_id for participation_id, _ in self.ranking()],
+                         [participation.id for participation in self.participations])
+
+    def changes(self, tag, since):
+        changes = get_scoreboard_changes(self.contest, get_scoreboard_problems(self.contest), tag, since)
+        if changes is None:
+            return None
+        version, rows = changes
+        return version, [(row.participation.id, row.points) for row in rows]
+
+    def test_changes(self):
+        first, second, third = self.participations
+        tag, version = get_scoreboard_version(self.contest, get_scoreboard_problems(self.contest))
+        self.assertEqual(version, 0)
+        self.assertEqual(self.changes(tag, 0), (0, []))
+
+        with mock.patch('judge.event_poster.post') as post:
+            self.grade(second, 50)
+            self.grade(third, 70)
+        self.assertEqual([call.args[1]['version'] for call in post.call_args_list], [1, 2])
+        message = post.call_args.args[1]
+        self.assertEqual((message['type'], message['tag']), ('scoreboard', tag))
+        self.assertEqual([(row['id'], row['points']) for row in message['rows']], [(third.id, 70)])
+
+        self.assertEqual(get_scoreboard_version(self.contest, get_scoreboard_problems(self.contest)), (tag, 2))
+        self.assertEqual(self.changes(tag, 0), (2, [(third.id, 70), (second.id, 50)]))
+        self.assertEqual(self.changes(tag, 1), (2, [(third.id, 70)]))
+        self.assertEqual(self.changes(tag, 2), (2, []))
+        # Versions that are not known yet, or of rows that are no longer cached, are loaded again.
+        self.assertIsNone(self.changes(tag, 3))
+        self.assertIsNone(self.changes('other', 0))
+
+        self.contest_problem.points = 50
+        self.contest_problem.save()
+        self.assertIsNone(self.changes(tag, 2))
+
+    def test_changes_too_far_behind(self):
+        second = self.participations[1]
+        tag, version = get_scoreboard_version(self.contest, get_scoreboard_problems(self.contest))
+        for points in range(MAX_SCOREBOARD_CHANGES + 1):
+            self.grade(second, points)
+        self.assertIsNone(self.changes(tag, 0))
+        self.assertEqual(self.changes(tag, 1), (MAX_SCOREBOARD_CHANGES + 1, [(second.id, MAX_SCOREBOARD_CHANGES)]))
+
+    def test_private_rows_not_announced(self):
+        self.contest.scoreboard_visibility = self.contest.SCOREBOARD_HIDDEN
+        self.contest.save()
+        with mock.patch('judge.event_poster.post') as post:
+            self.grade(self.participations[0], 50)
+        self.assertIsNone(post.call_args.args[1]['rows'])
+
+    def test_pages(self):
+        first, second, third = self.participations
+        for participation, score in zip(self.participations, (50, 50, 70)):
+            ContestParticipation.objects.filter(id=participation.id).update(score=score)
+        participations = get_scoreboard_participations(self.contest)
+        ids = list(order_scoreboard(participations).values_list('id', flat=True))
+        self.assertEqual(ids, [third.id, first.id, second.id])
+        self.assertEqual([get_scoreboard_position(participations, id) for id in ids], [0, 1, 2])
+
+        # A page is ranked among the participations before it, from where it starts in the whole scoreboard, or
+        # from the results of its rows.
+        rows = get_scoreboard_rows(self.contest, get_scoreboard_problems(self.contest), ids[1:])
+        self.assertEqual([row.participation.id for row in rows], ids[1:])
+        with self.assertNumQueries(1):
+            self.assertEqual(get_scoreboard_ranks(self.contest, rows, offset=1), [2, 2])
+        with self.assertNumQueries(1):
+            self.assertEqual(get_scoreboard_ranks(self.contest, rows), [2, 2])
+
+        # A page that starts among rows with the same results as the last rows of the page before it.
+        fourth = create_contest_participation(contest=self.contest, user='scoreboard3')
+        ids.append(fourth.id)
+        rows = get_scoreboard_rows(self.contest, get_scoreboard_problems(self.contest), ids[2:])
+        with self.assertNumQueries(1):
+            self.assertEqual(get_scoreboard_ranks(self.contest, rows, offset=2), [2, 4])
+        self.assertEqual(get_scoreboard_ranks(self.contest, rows), [2, 4])
+        fourth.delete()
+
+        organization = create_organization(name='scoreboard')
+        second.user.organizations.add(organization)
+        members = get_scoreboard_participations(self.contest, organization)
+        self.assertEqual(list(order_scoreboard(members).values_list('id', flat=True)), [second.id])
+        self.assertEqual(get_scoreboard_position(members, second.id), 0)
+        self.assertIsNone(get_scoreboard_position(members, first.id))
+        rows = get_scoreboard_rows(self.contest, get_scoreboard_problems(self.contest), [second.id])
+        self.assertEqual(get_scoreboard_ranks(self.contest, rows), [2])
+
+    def test_disqualified_ranks(self):
+        first, second, third = self.participations
+        fourth = create_contest_participation(contest=self.contest, user='scoreboard3')
+        for participation, score, disqualified in zip((first, second, third, fourth), (100, 90, 80, 100),
+                                                      (True, False, False, True)):
+            ContestParticipation.objects.filter(id=participation.id).update(score=score, is_disqualified=disqualified)
+        ids = list(order_scoreboard(get_scoreboard_participations(self.contest)).values_list('id', flat=True))
+        self.assertEqual(ids, [second.id, third.id, first.id, fourth.id])
+
+        # Disqualified rows are ranked last, as the whole scoreboard was ranked, and not counted in other ranks.
+        rows = get_scoreboard_rows(self.contest, get_scoreboard_problems(self.contest), ids)
+        expected = [rank for rank, _ in ranker(rows, key=attrgetter('points', 'cumtime', 'tiebreaker'))]
+        self.assertEqual(expected, [1, 2, 3, 3])
+        self.assertEqual(get_scoreboard_ranks(self.contest, rows, offset=0), expected)
+        self.assertEqual(get_scoreboard_ranks(self.contest, rows), expected)
+        for offset in range(1, len(rows)):
+            self.assertEqual(get_scoreboard_ranks(self.contest, rows[offset:], offset=offset), expected[offset:])
+            self.assertEqual(get_scoreboard_ranks(self.contest, rows[offset:]), expected[offset:])
+
+    @skipUnless(shutil.which('node'), 'node is not installed')
+    def test_client_ranks(self):
+        first, second, third = self.participations
+        fourth = create_contest_participation(contest=self.contest, user='scoreboard3')
+        for participation, score, disqualified in zip((first, second, third, fourth), (90, 90, 90, 100),
+                                                      (True, False, False, False)):
+            ContestParticipation.objects.filter(id=participation.id).update(score=score, is_disqualified=disqualified)
+        ids = list(order_scoreboard(get_scoreboard_participations(self.contest)).values_list('id', flat=True))
+        rows = get_scoreboard_rows(self.contest, get_scoreboard_problems(self.contest), ids)
+
+        # Pages patched with live updates are sorted and ranked again by contest-ranking.js, as the server would, even
+        # with a disqualified row that has the same results as the last rows before it.
+        script = """
+            var ranking = require(process.argv[1]);
+            var keys = JSON.parse(process.argv[2]).map(function (row) {
+                return ranking.scoreboard_sort_key(row.disqualified, row.points, row.cumtime, row.tiebreaker,
+                                                   row.submissions, row.id);
+            }).sort(ranking.scoreboard_compare);
+            var ranks = ranking.scoreboard_ranks(keys);
+            console.log(JSON.stringify(keys.map(function (key, i) {
+                return [key[5], ranks[i]];
+            })));
+        """
+        data = [serialize_scoreboard_row(row) for row in reversed(rows)]
+        output = subprocess.check_output(['node', '-e', script, os.path.join(settings.BASE_DIR, 'resources',
+                                                                             'contest-ranking.js'), json.dumps(data)])
+        self.assertEqual([tuple(item) for item in json.loads(output)],
+                         list(zip(ids, get_scoreboard_ranks(self.contest, rows, offset=0))))
+        self.assertEqual(get_scoreboard_ranks(self.contest, rows, offset=0), [1, 2, 2, 4])
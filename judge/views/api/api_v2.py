@@ -725,6 +725,10 @@ class APIJudgeList(APIListView):
     def get_unfiltered_queryset(self):
         return Judge.objects.filter(online=True).prefetch_related('runtimes').order_by('id')
 
+    def get_api_data(self, context):
+        context['object_list'] = Judge.with_live_status(context['object_list'])
+        return super().get_api_data(context)
+
     def get_object_data(self, judge):
         return {
             'name': judge.name,
@@ -13,7 +13,7 @@ from django.core.exceptions import ImproperlyConfigured, ObjectDoesNotExist
 from django.db import IntegrityError
 from django.db.models import BooleanField, Case, Count, F, FloatField, IntegerField, Max, Min, Q, Sum, Value, When
 from django.db.models.expressions import CombinedExpression, Exists, OuterRef
-from django.http import Http404, HttpResponse, HttpResponseBadRequest, HttpResponseRedirect
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, HttpResponseRedirect, JsonResponse
 from django.shortcuts import get_object_or_404, render
 from django.template.defaultfilters import date as date_filter
 from django.urls import reverse
@@ -33,19 +33,24 @@ from judge import event_poster as event
 from judge.comments import CommentedDetailView
 from judge.forms import ContestCloneForm
 from judge.models import Contest, ContestMoss, ContestParticipation, ContestProblem, ContestTag, \
-    Problem, Profile, Submission
+    Organization, Problem, Profile, Submission
 from judge.tasks import run_moss
 from judge.utils.celery import redirect_to_task_status
+from judge.utils.diggpaginator import DiggPaginator, InvalidPage
 from judge.utils.opengraph import generate_opengraph
 from judge.utils.problems import _get_result_data
 from judge.utils.ranker import ranker
+from judge.utils.scoreboard import get_scoreboard_changes, get_scoreboard_participations, get_scoreboard_position, \
+    get_scoreboard_problems, get_scoreboard_ranks, get_scoreboard_rows, get_scoreboard_version, \
+    make_contest_ranking_profile, order_scoreboard, serialize_scoreboard_row
 from judge.utils.stats import get_bar_chart, get_pie_chart
 from judge.utils.views import DiggPaginatorMixin, QueryStringSortMixin, SingleObjectFormView, TitleMixin, \
-    generic_message
+    generic_message, paginate_query_context
 
 __all__ = ['ContestList', 'ContestDetail', 'ContestRanking', 'ContestJoin', 'ContestLeave', 'ContestCalendar',
            'ContestClone', 'ContestStats', 'ContestMossView', 'ContestMossDelete', 'contest_ranking_ajax',
-           'ContestParticipationList', 'ContestParticipationDisqualify', 'get_contest_ranking_list',
+           'contest_ranking_diff', 'contest_ranking_redirect', 'ContestParticipationList',
+           'ContestParticipationDisqualify', 'get_contest_ranking_list', 'get_contest_ranking_page',
            'base_contest_ranking_list']
 
 
@@ -635,57 +640,17 @@ class ContestStats(TitleMixin, ContestMixin, DetailView):
         return context
 
 
-ContestRankingProfile = namedtuple(
-    'ContestRankingProfile',
-    'id user css_class username points cumtime tiebreaker organization participation '
-    'participation_rating problem_cells result_cell display_name',
-)
-
 BestSolutionData = namedtuple('BestSolutionData', 'code points time state is_pretested')
 
 
-def make_contest_ranking_profile(contest, participation, contest_problems):
-    def display_user_problem(contest_problem):
-        # When the contest format is changed, `format_data` might be invalid.
-        # This will cause `display_user_problem` to error, so we display '???' instead.
-        try:
-            return contest.format.display_user_problem(participation, contest_problem)
-        except (KeyError, TypeError, ValueError):
-            return mark_safe('<td>???</td>')
-
-    user = participation.user
-    return ContestRankingProfile(
-        id=user.id,
-        user=user.user,
-        css_class=user.css_class,
-        username=user.username,
-        points=participation.score,
-        cumtime=participation.cumtime,
-        tiebreaker=participation.tiebreaker,
-        organization=user.organization,
-        participation_rating=participation.rating.rating if hasattr(participation, 'rating') else None,
-        problem_cells=[display_user_problem(contest_problem) for contest_problem in contest_problems],
-        result_cell=contest.format.display_participation_result(participation),
-        participation=participation,
-        display_name=user.display_name,
-    )
-
-
 def base_contest_ranking_list(contest, problems, queryset):
     return [make_contest_ranking_profile(contest, participation, problems) for participation in
             queryset.select_related('user__user', 'rating').defer('user__about', 'user__organizations__about')]
 
 
-def contest_ranking_list(contest, problems):
-    return base_contest_ranking_list(contest, problems, contest.users.filter(virtual=0)
-                                     .prefetch_related('user__organizations')
-                                     .annotate(submission_cnt=Count('submission'))
-                                     .order_by('is_disqualified', '-score', 'cumtime', 'tiebreaker', '-submission_cnt'))
-
-
-def get_contest_ranking_list(request, contest, participation=None, ranking_list=contest_ranking_list,
-                             show_current_virtual=True, ranker=ranker):
-    problems = list(contest.contest_problems.select_related('problem').defer('problem__description').order_by('order'))
+def get_contest_ranking_list(request, contest, ranking_list, participation=None, show_current_virtual=True,
+                             ranker=ranker):
+    problems = get_scoreboard_problems(contest)
 
     users = ranker(ranking_list(contest, problems), key=attrgetter('points', 'cumtime', 'tiebreaker'))
 
@@ -699,6 +664,71 @@ def get_contest_ranking_list(request, contest, participation=None, ranking_list=
     return users, problems
 
 
+def get_ranking_organization(request):
+    if not request.GET.get('organization'):
+        return None
+    try:
+        return Organization.objects.get(id=int(request.GET['organization']))
+    except (ValueError, Organization.DoesNotExist):
+        raise Http404()
+
+
+def get_contest_ranking_page(request, contest, organization=None, participation=None):
+    """
+    Returns the requested page of the scoreboard of a contest, or of the members of `organization` in it, with the
+    ranks of its rows among all participations. Only the rows on the page are read, so that large contests are no
+    slower to show.
+    """
+    participations = get_scoreboard_participations(contest, organization)
+    paginator = DiggPaginator(order_scoreboard(participations).values_list('id', flat=True),
+                              settings.DMOJ_CONTEST_RANKING_PAGE_SIZE, body=6, padding=2, count=participations.count())
+    try:
+        page = paginator.page(request.GET.get('page', 1), softlimit=True)
+    except InvalidPage:
+        raise Http404()
+
+    participation_ids = list(page.object_list)
+    # Ranks are among all participations, so only a page of the whole scoreboard is ranked from where it starts.
+    offset = page.start_index() - 1 if organization is None else None
+    users, problems = get_contest_ranking_list(
+        request, contest, participation=participation,
+        ranking_list=lambda contest, problems: get_scoreboard_rows(contest, problems, participation_ids),
+        ranker=lambda users, key: zip(get_scoreboard_ranks(contest, users, offset), users),
+    )
+    return users, problems, page
+
+
+def contest_ranking_redirect(request, contest):
+    contest, exists = _find_contest(request, contest)
+    if not exists:
+        return HttpResponseBadRequest('Invalid contest', content_type='text/plain')
+
+    if not contest.can_see_full_scoreboard(request.user):
+        raise Http404()
+
+    if 'handle' in request.GET:
+        username = request.GET['handle']
+    elif request.user.is_authenticated:
+        username = request.user.username
+    else:
+        raise Http404()
+
+    organization = get_ranking_organization(request)
+    participation = get_object_or_404(contest.users, user__user__username=username, virtual=ContestParticipation.LIVE)
+    position = get_scoreboard_position(get_scoreboard_participations(contest, organization), participation.id)
+    if position is None:
+        raise Http404()
+
+    query = request.GET.copy()
+    query.setlist('handle', [])
+    page = position // settings.DMOJ_CONTEST_RANKING_PAGE_SIZE
+    if page:
+        query['page'] = page + 1
+    query = query.urlencode()
+    return HttpResponseRedirect('%s%s#!%s' % (reverse('contest_ranking', args=[contest.key]),
+                                              '?' + query if query else '', username))
+
+
 def contest_ranking_ajax(request, contest, participation=None):
     contest, exists = _find_contest(request, contest)
     if not exists:
@@ -707,7 +737,7 @@ def contest_ranking_ajax(request, contest, participation=None):
     if not contest.can_see_full_scoreboard(request.user):
         raise Http404()
 
-    users, problems = get_contest_ranking_list(request, contest, participation)
+    users, problems = get_contest_ranking_page(request, contest, get_ranking_organization(request), participation)[:2]
     return render(request, 'contest/ranking-table.html', {
         'users': users,
         'problems': problems,
@@ -716,6 +746,32 @@ def contest_ranking_ajax(request, contest, participation=None):
     })
 
 
+def contest_ranking_diff(request, contest):
+    contest, exists = _find_contest(request, contest)
+    if not exists:
+        return HttpResponseBadRequest('Invalid contest', content_type='text/plain')
+
+    if not contest.can_see_full_scoreboard(request.user):
+        raise Http404()
+
+    try:
+        since = int(request.GET['since'])
+        tag = request.GET['tag']
+    except (KeyError, ValueError):
+        return HttpResponseBadRequest('Invalid version', content_type='text/plain')
+
+    changes = get_scoreboard_changes(contest, get_scoreboard_problems(contest), tag, since)
+    if changes is None:
+        return JsonResponse({'reload': True})
+    version, rows = changes
+    return JsonResponse({
+        'reload': False,
+        'tag': tag,
+        'version': version,
+        'rows': [serialize_scoreboard_row(row) for row in rows],
+    })
+
+
 class ContestRankingBase(ContestMixin, TitleMixin, DetailView):
     template_name = 'contest/ranking.html'
     tab = None
@@ -758,11 +814,32 @@ class ContestRanking(ContestRankingBase):
                 ranker=lambda users, key: ((_('???'), user) for user in users),
             )
 
-        return get_contest_ranking_list(self.request, self.object)
+        users, problems, self.page = get_contest_ranking_page(self.request, self.object, self.organization)
+        return users, problems
+
+    def get(self, request, *args, **kwargs):
+        self.organization = get_ranking_organization(request)
+        self.page = None
+        return super().get(request, *args, **kwargs)
 
     def get_context_data(self, **kwargs):
+        # The rows of a live scoreboard are updated as they change, from the version that they were read at, so
+        # it is read before them.
+        if self.object.can_see_full_scoreboard(self.request.user) and not self.object.ended:
+            scoreboard_version = get_scoreboard_version(self.object, get_scoreboard_problems(self.object))
+        else:
+            scoreboard_version = None
         context = super().get_context_data(**kwargs)
         context['has_rating'] = self.object.ratings.exists()
+        context['scoreboard_version'] = scoreboard_version
+        context['page_obj'] = self.page
+        context.update(paginate_query_context(self.request))
+        context['ranking_organization'] = self.organization
+        if self.request.user.is_authenticated:
+            context['ranking_organizations'] = self.request.profile.organizations.all()
+            context['has_participation'] = self.object.users.filter(
+                user=self.request.profile, virtual=ContestParticipation.LIVE,
+            ).exists()
         return context
 
 
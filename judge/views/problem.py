@@ -681,7 +681,8 @@ class ProblemSubmit(LoginRequiredMixin, ProblemMixin, TitleMixin, SingleObjectFo
 
         form.fields['language'].queryset = (
             self.object.usable_languages.order_by('name', 'key')
-            .prefetch_related(Prefetch('runtimeversion_set', RuntimeVersion.objects.order_by('priority')))
+            .prefetch_related(Prefetch('runtimeversion_set',
+                                       RuntimeVersion.objects.filter(judge__online=True).order_by('priority')))
         )
 
         form_data = getattr(form, 'cleaned_data', form.initial)
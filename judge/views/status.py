@@ -12,9 +12,9 @@ __all__ = ['status_all', 'status_table']
 
 def get_judges(request):
     if request.user.is_superuser or request.user.is_staff:
-        return True, Judge.objects.order_by('-online', 'name')
+        return True, Judge.with_live_status(Judge.objects.order_by('-online', 'name'))
     else:
-        return False, Judge.objects.filter(online=True)
+        return False, Judge.with_live_status(Judge.objects.filter(online=True))
 
 
 def status_all(request):
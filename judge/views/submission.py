@@ -21,6 +21,7 @@ from django.views.generic import DetailView, ListView
 
 from judge import event_poster as event
 from judge.highlight_code import highlight_code
+from judge.judgeapi import estimate_submission
 from judge.models import Contest, Language, Problem, ProblemTranslation, Profile, Submission
 from judge.models.problem import SubmissionSourceAccess
 from judge.utils.infinite_paginator import InfinitePaginationMixin
@@ -178,6 +179,7 @@ class SubmissionStatus(SubmissionDetailBase):
 
         context['batches'], statuses, context['max_execution_time'] = group_test_cases(submission.test_cases.all())
         context['statuses'] = combine_statuses(statuses, submission)
+        context['estimate'] = estimate_submission(submission) if submission.status == 'QU' else None
 
         context['time_limit'] = submission.problem.time_limit
         try:
@@ -0,0 +1,34 @@
+// The order and the ranks of the rows of contest scoreboards, as judge/utils/scoreboard.py sorts and ranks them.
+
+function scoreboard_sort_key(disqualified, points, cumtime, tiebreaker, submissions, id) {
+    return [disqualified ? 1 : 0, -points, cumtime, tiebreaker, -submissions, id];
+}
+
+function scoreboard_compare(a, b) {
+    for (var i = 0; i < a.length; i++)
+        if (a[i] != b[i])
+            return a[i] < b[i] ? -1 : 1;
+    return 0;
+}
+
+// Returns the ranks of rows, given their sort keys in order. Rows with the same disqualification, points, time, and
+// tiebreaker share a rank, so disqualified rows are ranked after all others, and are not counted in their ranks.
+function scoreboard_ranks(keys) {
+    var ranks = [], rank = 0, last = null;
+    keys.forEach(function (key, i) {
+        var current = key.slice(0, 4).join(' ');
+        if (current !== last) {
+            rank = i + 1;
+            last = current;
+        }
+        ranks.push(rank);
+    });
+    return ranks;
+}
+
+if (typeof module !== 'undefined')
+    module.exports = {
+        scoreboard_sort_key: scoreboard_sort_key,
+        scoreboard_compare: scoreboard_compare,
+        scoreboard_ranks: scoreboard_ranks
+    };